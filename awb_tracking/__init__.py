@@ -6,6 +6,8 @@ This package provides functionality for tracking air waybills (AWB).
 
 # Import the main tracker class
 from .awbtracker import AWBTracker
+from .cache import CachePolicy, DiskCache, MemoryCache, ResultCache
+from .registry import CourierSpec, register_courier
 
 # Package metadata
 __version__ = "1.0.0"
@@ -14,4 +16,12 @@ __email__ = "support@awbtracker.com"
 __license__ = "MIT"
 
 # Define what should be imported with "from awb_tracking import *"
-__all__ = ["AWBTracker"]
+__all__ = [
+    "AWBTracker",
+    "ResultCache",
+    "CachePolicy",
+    "MemoryCache",
+    "DiskCache",
+    "CourierSpec",
+    "register_courier",
+]
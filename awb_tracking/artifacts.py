@@ -0,0 +1,287 @@
+"""
+Debug artifacts (raw HTML and JSON responses) captured during lookups.
+
+Trackers hand every raw response to an ArtifactRecord for their lookup
+instead of writing files themselves. The process-wide sink decides what
+is kept and where:
+
+    mode:  "off"       nothing is captured (the default, no overhead)
+           "all"       every lookup
+           "sampled"   a random fraction of lookups (sample_rate)
+           "failures"  only lookups that ended in an error
+    store: "disk"      written to disk when the lookup finishes
+           "async"     written by a background thread, off the hot path
+           "memory"    kept in a ring buffer of the last ring_size artifacts
+
+Files are named per lookup, so concurrent lookups never overwrite each other:
+
+    <path>/<courier>/<YYYYmmdd-HHMMSS>-<awb>-<seq>-<name>
+
+Configure in code with configure(), or with the AWB_ARTIFACTS (mode),
+AWB_ARTIFACTS_STORE and AWB_ARTIFACTS_DIR environment variables.
+"""
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from .utils import ERROR_STATUSES
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "all", "sampled", "failures")
+STORES = ("disk", "async", "memory")
+
+# Lookup sequence number, makes file names unique within the process
+_sequence = itertools.count(1)
+
+class _NullRecord:
+    """Record for lookups whose artifacts are not kept; every call is a no-op."""
+
+    enabled = False
+
+    def add(self, name, content):
+        pass
+
+    def finish(self, result=None, failed=None):
+        pass
+
+NULL_RECORD = _NullRecord()
+
+class ArtifactRecord:
+    """
+    Artifacts of one lookup, held until the lookup finishes.
+
+    Args:
+        sink (ArtifactSink): Sink the artifacts are handed to
+        courier (str): Courier name
+        awb_number (str): The AWB number looked up
+    """
+
+    enabled = True
+
+    def __init__(self, sink, courier, awb_number):
+        self.sink = sink
+        self.courier = courier
+        self.awb_number = str(awb_number)
+        self.started = time.time()
+        self.sequence = next(_sequence)
+        self.items = []
+
+    def add(self, name, content):
+        """
+        Capture one artifact.
+
+        Args:
+            name (str): File name suffix, e.g. "result.html"; repeated names
+                        are numbered ("result-2.html")
+            content: bytes, str, or a JSON-serializable object
+        """
+        count = sum(1 for item in self.items if item[2] == name) + 1
+        if count > 1:
+            base, ext = os.path.splitext(name)
+            self.items.append((f"{base}-{count}{ext}", content, name))
+        else:
+            self.items.append((name, content, name))
+
+    def prefix(self):
+        """Return the per-lookup file name prefix."""
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        awb = re.sub(r"[^A-Za-z0-9_.-]", "_", self.awb_number)
+        return f"{stamp}-{awb}-{self.sequence}"
+
+    def finish(self, result=None, failed=None):
+        """
+        End the lookup and hand its artifacts to the sink if they should be kept.
+
+        Args:
+            result (dict, optional): The tracking result
+            failed (bool, optional): Whether the lookup failed; derived from
+                                     the result status when omitted
+        """
+        if failed is None:
+            failed = not isinstance(result, dict) or str(result.get("status") or "").lower() in ERROR_STATUSES
+        items = [(name, content) for name, content, _ in self.items]
+        self.items = []
+        if items and (self.sink.mode != "failures" or failed):
+            self.sink.keep(self, items)
+
+def _encode(content):
+    """Return artifact content as bytes."""
+    if isinstance(content, (bytes, bytearray)):
+        return bytes(content)
+    if isinstance(content, str):
+        return content.encode("utf-8")
+    return json.dumps(content, indent=4, default=str).encode("utf-8")
+
+class ArtifactSink:
+    """
+    Decides which lookups keep their artifacts and stores them.
+
+    Args:
+        mode (str): "off", "all", "sampled" or "failures"
+        store (str): "disk", "async" or "memory"
+        path (str): Directory for "disk" and "async" stores
+        sample_rate (float): Fraction of lookups kept in "sampled" mode
+        ring_size (int): Artifacts kept by the "memory" store
+        queue_size (int): Artifacts waiting for the "async" writer; more are dropped
+    """
+
+    def __init__(self, mode="off", store="disk", path="out/artifacts", sample_rate=0.01,
+                 ring_size=256, queue_size=1000):
+        if mode not in MODES:
+            raise ValueError(f"Unknown artifact mode: {mode}")
+        if store not in STORES:
+            raise ValueError(f"Unknown artifact store: {store}")
+        self.mode = mode
+        self.store = store
+        self.path = path
+        self.sample_rate = sample_rate
+        self.ring = deque(maxlen=ring_size)
+        self.written = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        self._writer = None
+        if store == "async" and mode != "off":
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+            self._writer.start()
+
+    def start(self, courier, awb_number):
+        """
+        Begin a lookup and return the record its artifacts go to.
+
+        Lookups that will not be kept get a shared no-op record, so callers
+        can always call add() and finish().
+        """
+        if self.mode == "off":
+            return NULL_RECORD
+        if self.mode == "sampled" and random.random() >= self.sample_rate:
+            return NULL_RECORD
+        return ArtifactRecord(self, courier, awb_number)
+
+    def keep(self, record, items):
+        """Store the artifacts of a finished lookup."""
+        if self.store == "memory":
+            with self._lock:
+                for name, content in items:
+                    self.ring.append({
+                        "courier": record.courier,
+                        "awb_number": record.awb_number,
+                        "name": name,
+                        "time": record.started,
+                        "content": content,
+                    })
+            return
+
+        for name, content in items:
+            filename = os.path.join(self.path, record.courier, f"{record.prefix()}-{name}")
+            if self._queue is not None:
+                try:
+                    self._queue.put_nowait((filename, content))
+                except queue.Full:
+                    with self._lock:
+                        self.dropped += 1
+            else:
+                self._write(filename, content)
+
+    def _write(self, filename, content):
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            with open(filename, "wb") as f:
+                f.write(_encode(content))
+            with self._lock:
+                self.written += 1
+        except (OSError, TypeError, ValueError) as e:
+            logger.error("Error saving artifact %s: %s", filename, e)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._write(*job)
+            finally:
+                self._queue.task_done()
+
+    def recent(self, courier=None, awb_number=None):
+        """
+        Return artifacts kept by the "memory" store, oldest first.
+
+        Args:
+            courier (str, optional): Only artifacts of this courier
+            awb_number (str, optional): Only artifacts of this AWB number
+        """
+        with self._lock:
+            items = list(self.ring)
+        return [item for item in items
+                if (courier is None or item["courier"] == courier)
+                and (awb_number is None or item["awb_number"] == str(awb_number))]
+
+    def flush(self):
+        """Wait until the background writer has written everything queued."""
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        """Flush and stop the background writer."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+            self._queue = None
+
+    def stats(self):
+        """
+        Return counters: artifacts written, dropped (async queue full) and in memory.
+        """
+        with self._lock:
+            return {"written": self.written, "dropped": self.dropped, "in_memory": len(self.ring)}
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_sink():
+    """
+    Return the process-wide sink, configured from the environment on first use.
+
+    Invalid settings are logged once and leave capture off.
+    """
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                try:
+                    _sink = ArtifactSink(mode=os.environ.get("AWB_ARTIFACTS", "off"),
+                                         store=os.environ.get("AWB_ARTIFACTS_STORE", "disk"),
+                                         path=os.environ.get("AWB_ARTIFACTS_DIR", "out/artifacts"))
+                except ValueError as e:
+                    logger.warning("Ignoring the AWB_ARTIFACTS settings, artifact capture is off: %s", e)
+                    _sink = ArtifactSink()
+    return _sink
+
+def set_sink(sink):
+    """Replace the process-wide sink, closing the previous one."""
+    global _sink
+    with _sink_lock:
+        previous, _sink = _sink, sink
+    if previous is not None and previous is not sink:
+        previous.close()
+    return sink
+
+def configure(mode="off", store="disk", **kwargs):
+    """
+    Configure the process-wide sink, see ArtifactSink for the arguments.
+
+    Returns:
+        ArtifactSink: The new sink
+    """
+    return set_sink(ArtifactSink(mode=mode, store=store, **kwargs))
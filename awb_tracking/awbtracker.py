@@ -1,29 +1,385 @@
-from .indiapost import IndiaPostTracker
-from .ecomexpress import EcomExpressTracker
-from .dtdc import DTDCTracker
-from .vrl import VRLTracker
+import asyncio
+import functools
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from . import metrics
+from . import registry
+from . import utils
 
 class AWBTracker:
     """
     Central class to manage multiple courier tracking services dynamically.
+
+    Courier trackers come from the courier registry and are built on first
+    use, so only the code of couriers that are actually tracked is loaded.
     """
 
-    def __init__(self):
+    def __init__(self, cache=None, tracker_options=None):
         """
-        Initializes all supported courier trackers.
+        Args:
+            cache (ResultCache, optional): Result cache consulted before every lookup
+            tracker_options (dict, optional): Constructor keyword arguments per
+                                              courier, e.g. {"indiapost": {"pool_size": 16}}
         """
-        self.trackers = {
-            "indiapost": IndiaPostTracker(),
-            "ecomexpress": EcomExpressTracker(),
-            "dtdc": DTDCTracker(),
-            "vrl": VRLTracker(),
-        }
+        self.cache = cache
+        self.tracker_options = tracker_options or {}
+        # Trackers built so far, by courier name
+        self.trackers = {}
+        self._trackers_lock = threading.Lock()
 
     def __getattr__(self, courier_name):
         """
         Dynamically call tracking methods for each courier.
         Allows `tracker.indiapost("AWB123456789")` usage.
         """
-        if courier_name in self.trackers:
-            return self.trackers[courier_name].track
+        if not courier_name.startswith("_") and registry.get_courier(courier_name) is not None:
+            return functools.partial(self.track, courier_name)
         raise AttributeError(f"'AWBTracker' has no attribute '{courier_name}'")
+
+    @staticmethod
+    def couriers():
+        """
+        Return the names of all supported couriers, including plugins.
+        """
+        return registry.list_couriers()
+
+    @staticmethod
+    def capabilities(courier=None):
+        """
+        Return courier capabilities (supports_batch, needs_captcha,
+        max_concurrency) for one courier, or for all couriers keyed by name.
+
+        Raises:
+            ValueError: If the courier is not supported
+        """
+        if courier is None:
+            return {name: registry.get_courier(name).capabilities() for name in registry.list_couriers()}
+        spec = registry.get_courier(courier)
+        if spec is None:
+            raise ValueError(f"Unsupported courier: {courier}")
+        return spec.capabilities()
+
+    def track(self, courier, awb_number, refresh=False):
+        """
+        Track a single shipment with the given courier.
+
+        Args:
+            courier (str): Courier name, e.g. "indiapost"
+            awb_number (str): The AWB / tracking number
+            refresh (bool): Skip the cache lookup and always query the courier
+
+        Returns:
+            dict: Tracking information returned by the courier tracker
+
+        Raises:
+            ValueError: If the courier is not supported
+        """
+        tracker = self._get_tracker(courier)
+        if self.cache is not None and not refresh:
+            cached = self.cache.get(courier, awb_number)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        result = None
+        try:
+            result = tracker.track(awb_number)
+        finally:
+            metrics.record_lookup(str(courier).lower(), result, time.perf_counter() - start)
+        if self.cache is not None:
+            self.cache.put(courier, awb_number, result)
+        return result
+
+    def track_batch(self, courier, awb_numbers, refresh=False):
+        """
+        Track several shipments of one courier.
+
+        Couriers with the supports_batch capability look them up in one
+        track_batch() call (India Post chains them on one session); others
+        are tracked one by one.
+
+        Args:
+            courier (str): Courier name, e.g. "indiapost"
+            awb_numbers (iterable): The AWB / tracking numbers
+            refresh (bool): Skip the cache lookup and always query the courier
+
+        Returns:
+            list: Tracking information in the order of awb_numbers
+
+        Raises:
+            ValueError: If the courier is not supported
+        """
+        tracker = self._get_tracker(courier)
+        key = str(courier).lower()
+        awb_numbers = list(awb_numbers)
+        results = [None] * len(awb_numbers)
+        todo = []
+        for index, awb_number in enumerate(awb_numbers):
+            cached = None
+            if self.cache is not None and not refresh:
+                cached = self.cache.get(courier, awb_number)
+            if cached is not None:
+                results[index] = cached
+            else:
+                todo.append(index)
+        if not todo:
+            return results
+
+        if not self.capabilities(key)["supports_batch"]:
+            for index in todo:
+                results[index] = self.track(courier, awb_numbers[index], refresh=True)
+            return results
+
+        start = time.perf_counter()
+        batch = []
+        try:
+            batch = tracker.track_batch([awb_numbers[index] for index in todo])
+        finally:
+            seconds = (time.perf_counter() - start) / len(todo)
+            for number in range(len(todo)):
+                metrics.record_lookup(key, batch[number] if number < len(batch) else None, seconds)
+        for index, result in zip(todo, batch):
+            results[index] = result
+            if self.cache is not None:
+                self.cache.put(courier, awb_numbers[index], result)
+        return results
+
+    def _get_tracker(self, courier):
+        """
+        Return the tracker for a courier name, building it on first use.
+
+        Raises:
+            ValueError: If the courier is not supported
+        """
+        key = str(courier).lower()
+        tracker = self.trackers.get(key)
+        if tracker is not None:
+            return tracker
+
+        spec = registry.get_courier(key)
+        if spec is None:
+            raise ValueError(f"Unsupported courier: {courier}")
+        with self._trackers_lock:
+            tracker = self.trackers.get(key)
+            if tracker is None:
+                tracker = spec.create(**self.tracker_options.get(key, {}))
+                self.trackers[key] = tracker
+        return tracker
+
+    @staticmethod
+    def _courier_limit(key, courier_limits, default):
+        """
+        Return the concurrency cap for a courier: the caller's override, else
+        the courier's max_concurrency capability, else `default`.
+        """
+        if key in courier_limits:
+            return max(1, courier_limits[key])
+        spec = registry.get_courier(key)
+        if spec is None:
+            return default
+        return max(1, spec.capabilities()["max_concurrency"])
+
+    def _track_item(self, index, courier, awb_number):
+        """
+        Track one bulk item, capturing any failure in the returned item.
+        """
+        item = {
+            "index": index,
+            "courier": courier,
+            "awb_number": awb_number,
+            "result": None,
+            "error": None,
+        }
+        try:
+            item["result"] = self.track(courier, awb_number)
+        except Exception as e:
+            item["error"] = str(e)
+        return item
+
+    def iter_track(self, items, max_workers=8, courier_limits=None, ordered=False, on_progress=None):
+        """
+        Track many shipments concurrently and yield each result as it completes.
+
+        Items are pulled lazily from `items`, so very large inputs are never
+        loaded into memory at once.
+
+        Args:
+            items: Iterable of (courier, awb_number) pairs
+            max_workers (int): Size of the worker pool
+            courier_limits (dict, optional): Maximum concurrent lookups per courier,
+                                             overriding their max_concurrency capability
+            ordered (bool): Yield results in input order instead of completion order
+            on_progress (callable, optional): Called as on_progress(item, completed)
+                                              after every finished lookup
+
+        Yields:
+            dict: {"index", "courier", "awb_number", "result", "error"} for each
+                  input pair; "error" holds the failure message when the lookup raised
+        """
+        limits = {str(k).lower(): v for k, v in (courier_limits or {}).items()}
+
+        # Upper bound on items held in memory (running, held back or buffered)
+        window = max_workers * 4
+
+        source = enumerate(items)
+        exhausted = False
+        running = {}                # future -> courier key
+        active = defaultdict(int)   # courier key -> lookups in flight
+        waiting = defaultdict(deque)  # courier key -> items held back by its limit
+        held = 0
+        finished = {}               # index -> item, only used when ordered
+        next_index = 0
+        completed = 0
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        def start(index, courier, awb_number, key):
+            active[key] += 1
+            future = executor.submit(self._track_item, index, courier, awb_number)
+            running[future] = key
+
+        try:
+            while True:
+                # Pull new items while there is a free worker and room in the window
+                while (not exhausted and len(running) < max_workers
+                       and len(running) + held + len(finished) < window):
+                    try:
+                        index, (courier, awb_number) = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    key = str(courier).lower()
+                    if key not in limits:
+                        limits[key] = self._courier_limit(key, limits, max_workers)
+                    if active[key] >= limits[key]:
+                        waiting[key].append((index, courier, awb_number))
+                        held += 1
+                    else:
+                        start(index, courier, awb_number, key)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    active[key] -= 1
+                    if waiting[key]:
+                        start(*waiting[key].popleft(), key)
+                        held -= 1
+
+                    item = future.result()
+                    completed += 1
+                    if on_progress:
+                        on_progress(item, completed)
+
+                    if ordered:
+                        finished[item["index"]] = item
+                    else:
+                        yield item
+
+                while next_index in finished:
+                    yield finished.pop(next_index)
+                    next_index += 1
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def track_many(self, items, max_workers=8, courier_limits=None, on_progress=None):
+        """
+        Track many shipments concurrently and return all results in input order.
+
+        Args:
+            items: Iterable of (courier, awb_number) pairs
+            max_workers (int): Size of the worker pool
+            courier_limits (dict, optional): Maximum concurrent lookups per courier
+            on_progress (callable, optional): Called as on_progress(item, completed)
+
+        Returns:
+            list: One item dict per input pair, see iter_track()
+        """
+        return list(self.iter_track(items, max_workers=max_workers,
+                                    courier_limits=courier_limits,
+                                    ordered=True, on_progress=on_progress))
+
+    async def track_async(self, courier, awb_number, client=None, refresh=False):
+        """
+        Track a single shipment without blocking the event loop.
+
+        Args:
+            courier (str): Courier name, e.g. "vrl"
+            awb_number (str): The AWB / tracking number
+            client (httpx.AsyncClient, optional): Shared client for API-based couriers
+            refresh (bool): Skip the cache lookup and always query the courier
+
+        Returns:
+            dict: Tracking information returned by the courier tracker
+
+        Raises:
+            ValueError: If the courier is not supported
+        """
+        tracker = self._get_tracker(courier)
+        if self.cache is not None and not refresh:
+            cached = self.cache.get(courier, awb_number)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
+        result = None
+        try:
+            result = await tracker.track_async(awb_number, client=client)
+        finally:
+            metrics.record_lookup(str(courier).lower(), result, time.perf_counter() - start)
+        if self.cache is not None:
+            self.cache.put(courier, awb_number, result)
+        return result
+
+    async def track_many_async(self, items, max_concurrency=100, courier_limits=None):
+        """
+        Track many shipments concurrently on the running event loop.
+
+        API-based couriers share one non-blocking HTTP client, so thousands of
+        lookups can be in flight on a single thread. Captcha-based couriers run
+        in the default executor.
+
+        Args:
+            items: Iterable of (courier, awb_number) pairs
+            max_concurrency (int): Maximum lookups in flight at once
+            courier_limits (dict, optional): Maximum concurrent lookups per courier,
+                                             overriding their max_concurrency capability
+
+        Returns:
+            list: One item dict per input pair in input order, see iter_track()
+        """
+        limits = {str(k).lower(): v for k, v in (courier_limits or {}).items()}
+
+        overall = asyncio.Semaphore(max_concurrency)
+        per_courier = {}
+
+        async def run(index, courier, awb_number, client):
+            key = str(courier).lower()
+            if key not in per_courier:
+                per_courier[key] = asyncio.Semaphore(self._courier_limit(key, limits, max_concurrency))
+
+            item = {
+                "index": index,
+                "courier": courier,
+                "awb_number": awb_number,
+                "result": None,
+                "error": None,
+            }
+            async with per_courier[key], overall:
+                try:
+                    item["result"] = await self.track_async(courier, awb_number, client=client)
+                except Exception as e:
+                    item["error"] = str(e)
+            return item
+
+        async with utils.new_async_client() as client:
+            return await asyncio.gather(*(
+                run(index, courier, awb_number, client)
+                for index, (courier, awb_number) in enumerate(items)
+            ))
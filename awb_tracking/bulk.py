@@ -0,0 +1,241 @@
+"""
+Streaming, resumable bulk tracking of CSV files.
+
+Input rows are read one at a time and every result is appended to the
+output CSV as soon as it and all rows before it are done, so memory use
+does not grow with the file (at most `max_pending` rows are held) and a
+crash loses at most the lookups in flight. The output file is the checkpoint: its N-th data row belongs to
+the N-th input row, so a rerun skips the rows already written and carries
+on from there.
+
+    python -m awb_tracking.bulk shipments.csv -o shipments.tracked.csv
+
+The input needs "courier" and "awb_number" columns. Rows that already
+have a status, or lack a courier or AWB number, are copied unchanged.
+Results go to the "status", "location" and "date_time" columns, which are
+added if missing; an input with a "date" column (as in csv_template.csv)
+gets the date there instead.
+"""
+import argparse
+import csv
+import os
+import sys
+from collections import deque
+
+# Columns filled from the tracking result
+RESULT_FIELDS = ("status", "location", "date_time")
+
+# Other names of result columns in input files
+FIELD_ALIASES = {"date_time": "date"}
+
+def default_output_path(input_path):
+    """Return "<name>.tracked.csv" next to the input file."""
+    base, _ = os.path.splitext(input_path)
+    return f"{base}.tracked.csv"
+
+def checkpoint(output_path):
+    """
+    Return the number of complete data rows in an output file.
+
+    A row cut short by a crash (no trailing newline) is truncated away, so
+    appending can continue from a clean row boundary.
+
+    Returns:
+        int: Data rows already written, or -1 if there is no output (not
+             even a header) yet
+    """
+    if not os.path.exists(output_path):
+        return -1
+
+    with open(output_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        # Find the end of the last complete line, reading backwards in blocks
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            block = f.read(end - start)
+            newline = block.rfind(b"\n")
+            if newline != -1:
+                end = start + newline + 1
+                break
+            end = start
+        if end != size:
+            f.truncate(end)
+
+    with open(output_path, newline="") as f:
+        records = sum(1 for _ in csv.reader(f))
+    return records - 1
+
+def row_to_item(row):
+    """
+    Return the (courier, awb_number) pair to track for a row, or None if
+    the row is copied unchanged.
+    """
+    courier = (row.get("courier") or "").strip()
+    awb_number = (row.get("awb_number") or "").strip()
+    if row.get("status") or not courier or not awb_number:
+        return None
+    return courier, awb_number
+
+def apply_result(row, item):
+    """
+    Fill the result columns of a row from an iter_track() item.
+    """
+    result = item["result"]
+    if item["error"]:
+        row["status"] = f"Error: {item['error']}"
+    elif isinstance(result, dict):
+        for field in RESULT_FIELDS:
+            row[field] = result.get(field) or ""
+        for field, alias in FIELD_ALIASES.items():
+            if alias in row:
+                row[alias] = row[field]
+        if result.get("status") == "error" and isinstance(result.get("status_txt"), str):
+            row["status"] = f"Error: {result['status_txt']}"
+    else:
+        row["status"] = str(result)
+    return row
+
+def run_bulk(input_path, output_path=None, tracker=None, max_workers=8, courier_limits=None,
+             restart=False, sync_every=100, on_progress=None, max_pending=10000):
+    """
+    Track every row of a CSV file, appending results to the output as they complete.
+
+    Args:
+        input_path (str): CSV with "courier" and "awb_number" columns
+        output_path (str, optional): Output CSV, see default_output_path()
+        tracker (AWBTracker, optional): Tracker to use; a default one is built if omitted
+        max_workers (int): Size of the worker pool
+        courier_limits (dict, optional): Maximum concurrent lookups per courier
+        restart (bool): Ignore an existing output file instead of resuming from it
+        sync_every (int): Flush the output to disk (fsync) after this many rows
+        on_progress (callable, optional): Called as on_progress(row_number, row)
+                                          after every row written
+        max_pending (int): Most rows read but not written yet, e.g. behind a
+                           slow lookup; when reached, reading pauses until the
+                           lookups in flight are done
+
+    Returns:
+        dict: {"skipped": rows resumed from the checkpoint, "written": rows
+               written in this run, "tracked": rows looked up, "errors": failed lookups}
+    """
+    if tracker is None:
+        from .awbtracker import AWBTracker
+        tracker = AWBTracker()
+    output_path = output_path or default_output_path(input_path)
+    if restart and os.path.exists(output_path):
+        os.remove(output_path)
+
+    done = checkpoint(output_path)
+    summary = {"skipped": max(done, 0), "written": 0, "tracked": 0, "errors": 0}
+
+    with open(input_path, newline="") as infile:
+        reader = csv.DictReader(infile)
+        fieldnames = list(reader.fieldnames or [])
+        fieldnames += [field for field in RESULT_FIELDS
+                       if field not in fieldnames and FIELD_ALIASES.get(field) not in fieldnames]
+
+        with open(output_path, "a", newline="") as outfile:
+            writer = csv.DictWriter(outfile, fieldnames=fieldnames, extrasaction="ignore")
+            if done < 0:
+                writer.writeheader()
+                done = 0
+
+            # Rows read but not written yet, in input order: [row, tracked?]
+            pending = deque()
+            rows_written = done
+
+            def write_ready():
+                # Write rows from the front of the queue that need no lookup
+                while pending and not pending[0][1]:
+                    write(pending.popleft()[0])
+
+            def write(row):
+                nonlocal rows_written
+                writer.writerow(row)
+                rows_written += 1
+                summary["written"] += 1
+                if summary["written"] % sync_every == 0:
+                    outfile.flush()
+                    os.fsync(outfile.fileno())
+                if on_progress:
+                    on_progress(rows_written, row)
+
+            rows = enumerate(reader)
+            exhausted = False
+
+            def items():
+                nonlocal exhausted
+                # Ending the items lets iter_track() finish the lookups in
+                # flight, which empties the queue for the next round
+                while len(pending) < max(1, max_pending):
+                    try:
+                        number, row = next(rows)
+                    except StopIteration:
+                        exhausted = True
+                        return
+                    if number < done:
+                        continue
+                    item = row_to_item(row)
+                    pending.append([row, item is not None])
+                    if item is None:
+                        write_ready()
+                    else:
+                        yield item
+
+            while not exhausted:
+                for item in tracker.iter_track(items(), max_workers=max_workers,
+                                               courier_limits=courier_limits, ordered=True):
+                    # Results arrive in input order, so this is the first tracked row pending
+                    write_ready()
+                    row, _ = pending.popleft()
+                    write(apply_result(row, item))
+                    summary["tracked"] += 1
+                    if row["status"] in ("error", "timeout") or row["status"].startswith("Error:"):
+                        summary["errors"] += 1
+                    write_ready()
+                write_ready()
+
+            outfile.flush()
+            os.fsync(outfile.fileno())
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Track every shipment of a CSV file, resuming after interruptions')
+    parser.add_argument('csv_file', help="CSV file with 'courier' and 'awb_number' columns")
+    parser.add_argument('-o', '--output', help='Output CSV (default: <csv_file>.tracked.csv)')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent lookups')
+    parser.add_argument('--limit', action='append', default=[], metavar='COURIER=N',
+                        help='Maximum concurrent lookups for a courier, e.g. dtdc=2')
+    parser.add_argument('--restart', action='store_true', help='Start over instead of resuming')
+    parser.add_argument('--in-place', action='store_true', help='Replace the input file with the output when done')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.csv_file):
+        print(f"Error: File {args.csv_file} not found.")
+        return 1
+
+    courier_limits = {}
+    for limit in args.limit:
+        courier, _, value = limit.partition("=")
+        courier_limits[courier] = int(value)
+
+    output_path = args.output or default_output_path(args.csv_file)
+
+    def progress(row_number, row):
+        print(f"{row_number}: {row.get('courier', '')} {row.get('awb_number', '')} {row.get('status', '')}")
+
+    summary = run_bulk(args.csv_file, output_path, max_workers=args.workers,
+                       courier_limits=courier_limits, restart=args.restart, on_progress=progress)
+    print(f"Resumed after {summary['skipped']} rows, wrote {summary['written']} "
+          f"({summary['tracked']} tracked, {summary['errors']} errors) to {output_path}")
+
+    if args.in_place:
+        os.replace(output_path, args.csv_file)
+        print(f"Successfully updated tracking information in {args.csv_file}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
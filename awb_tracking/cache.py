@@ -0,0 +1,252 @@
+"""
+Result cache for tracking lookups, keyed by (courier, AWB).
+
+How long a result is kept depends on its status class: terminal results
+(e.g. delivered or returned shipments) never change and are kept
+indefinitely, in-transit results expire after a short TTL and error
+results are not cached at all.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from . import metrics
+from . import utils
+
+logger = logging.getLogger(__name__)
+
+# Statuses that describe a failed lookup rather than the shipment
+ERROR_STATUSES = utils.ERROR_STATUSES
+
+# Default TTL in seconds per status class; None means never expire and
+# 0 means do not cache
+DEFAULT_TTLS = {
+    "terminal": None,
+    "active": 15 * 60,
+    "error": 0,
+}
+
+class CachePolicy:
+    """
+    Decides how long a tracking result may be served from the cache.
+
+    Args:
+        ttls (dict, optional): TTL in seconds per status class ("terminal",
+                               "active", "error") or per exact status value
+                               (e.g. "attempted"), merged over DEFAULT_TTLS.
+                               None means never expire, 0 means do not cache.
+    """
+
+    def __init__(self, ttls=None):
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+
+    def classify(self, result):
+        """
+        Return the status class of a tracking result: "terminal", "active" or "error".
+        """
+        if not isinstance(result, dict):
+            return "error"
+        status = str(result.get("status") or "").strip().lower()
+        if not status or status in ERROR_STATUSES:
+            return "error"
+        if utils.is_terminal_status(status):
+            return "terminal"
+        return "active"
+
+    def ttl_for(self, result):
+        """
+        Return the TTL for a tracking result, checking the exact status
+        before its status class.
+        """
+        if isinstance(result, dict):
+            status = str(result.get("status") or "").strip().lower()
+            if status in self.ttls:
+                return self.ttls[status]
+        return self.ttls.get(self.classify(result), 0)
+
+class MemoryCache:
+    """
+    Thread-safe in-memory LRU cache backend.
+
+    Args:
+        max_entries (int): Number of entries kept before the least recently
+                           used one is evicted
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class DiskCache:
+    """
+    On-disk cache backend storing one JSON file per entry, so cached results
+    survive restarts and can be shared by several processes.
+
+    Args:
+        path (str): Directory holding the cache files
+    """
+
+    def __init__(self, path=os.path.join("out", "cache")):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        return os.path.join(self.path, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._file(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, entry):
+        filename = self._file(key)
+        # Write to a temporary file first so readers never see a partial entry
+        tmp = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp, filename)
+        except (OSError, TypeError, ValueError) as e:
+            logger.error("Error writing cache entry: %s", e)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def delete(self, key):
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith(".json"):
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.path) if name.endswith(".json"))
+
+class ResultCache:
+    """
+    Cache of tracking results in front of the courier trackers.
+
+    Args:
+        backend: Storage backend, MemoryCache (default) or DiskCache
+        policy (CachePolicy, optional): TTL policy, see CachePolicy
+    """
+
+    def __init__(self, backend=None, policy=None):
+        self.backend = backend if backend is not None else MemoryCache()
+        self.policy = policy or CachePolicy()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(courier, awb_number):
+        """Return the cache key for a (courier, AWB) pair."""
+        return f"{str(courier).strip().lower()}:{str(awb_number).strip()}"
+
+    def get(self, courier, awb_number):
+        """
+        Return the cached result for a shipment, or None on a miss or expired entry.
+        """
+        key = self.key(courier, awb_number)
+        entry = self.backend.get(key)
+        if entry is not None and entry.get("expires_at") is not None and entry["expires_at"] <= time.time():
+            self.backend.delete(key)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.CACHE_REQUESTS.inc(result="miss" if entry is None else "hit")
+        return entry["result"] if entry is not None else None
+
+    def put(self, courier, awb_number, result):
+        """
+        Store a result according to the TTL policy.
+
+        Returns:
+            bool: True if the result was cached
+        """
+        ttl = self.policy.ttl_for(result)
+        if ttl is not None and ttl <= 0:
+            return False
+
+        entry = {
+            "result": result,
+            "stored_at": time.time(),
+            "expires_at": None if ttl is None else time.time() + ttl,
+        }
+        self.backend.set(self.key(courier, awb_number), entry)
+        with self._lock:
+            self.stores += 1
+        return True
+
+    def invalidate(self, courier, awb_number):
+        """Remove a shipment from the cache."""
+        self.backend.delete(self.key(courier, awb_number))
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        self.backend.clear()
+        with self._lock:
+            self.hits = self.misses = self.stores = 0
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: hits, misses, stores, hit_rate and entries
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.backend),
+            }
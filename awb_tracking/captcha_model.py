@@ -0,0 +1,340 @@
+"""
+Lightweight captcha recognizer for short fixed-font captchas.
+
+India Post and DTDC captchas use a handful of characters in one font, so a
+general OCR model is not needed. The recognizer binarizes the image,
+segments characters by column projection and classifies each one with a
+k-nearest-neighbour lookup against glyph templates learned from a labeled
+folder. Only NumPy is used at solve time and a solve takes well under a
+millisecond.
+
+Train a model from a folder of labeled captchas (labels.csv with file and
+text columns, or the file name without extension as the text):
+
+    python -m awb_tracking.captcha_model train corpus/dtdc -o dtdc.npz
+    python -m awb_tracking.captcha_model predict dtdc.npz captcha.png
+
+and use it as an OCR engine:
+
+    from awb_tracking import captcha_model
+    captcha_model.register_model("dtdc", "dtdc.npz")
+    ocr.ocr_processor(image, ocr="model:dtdc")
+"""
+import argparse
+import csv
+import os
+import sys
+import threading
+
+IMAGE_EXTENSIONS = ('.gif', '.png', '.jpg', '.jpeg', '.bmp')
+
+# Model file format version, stored in every .npz
+MODEL_VERSION = 1
+
+def to_gray(image):
+    """
+    Return the image as a 2-D uint8 NumPy array.
+
+    Args:
+        image: File path, raw image bytes, PIL Image or NumPy array
+    """
+    import numpy as np
+    if isinstance(image, np.ndarray):
+        if image.ndim == 3:
+            # ITU-R 601 luma, same weights as PIL's "L" conversion
+            image = image[..., :3] @ np.array([0.299, 0.587, 0.114])
+        return image.astype(np.uint8, copy=False)
+
+    from .ocr import load_image
+    img = load_image(image)
+    if img is None:
+        return None
+    return np.asarray(img.convert("L"))
+
+def binarize(gray):
+    """
+    Threshold a grayscale image with Otsu's method.
+
+    Returns:
+        Boolean array, True for text (dark) pixels
+    """
+    import numpy as np
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    weight_bg = np.cumsum(hist)
+    weight_fg = weight_bg[-1] - weight_bg
+    sum_bg = np.cumsum(hist * levels)
+    mean_bg = sum_bg / np.maximum(weight_bg, 1)
+    mean_fg = (sum_bg[-1] - sum_bg) / np.maximum(weight_fg, 1)
+    variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    mask = gray <= int(np.argmax(variance))
+    # Text covers less of the image than the background
+    if mask.mean() > 0.5:
+        mask = ~mask
+    return mask
+
+def segment(mask, min_pixels=6, max_width_ratio=1.6):
+    """
+    Split a binarized captcha into character boxes by column projection.
+
+    Columns without text separate characters. Segments much wider than the
+    median are assumed to be touching characters and are split at their
+    weakest column.
+
+    Args:
+        mask: Boolean text mask
+        min_pixels: Segments with fewer text pixels are dropped as noise
+        max_width_ratio: Segments wider than this times the median are split
+
+    Returns:
+        list: Boolean glyph arrays cropped to their content, left to right
+    """
+    import numpy as np
+    projection = mask.sum(axis=0)
+    filled = np.concatenate(([0], (projection > 0).astype(np.int8), [0]))
+    edges = np.flatnonzero(np.diff(filled))
+    spans = [(start, end) for start, end in zip(edges[::2], edges[1::2])
+             if projection[start:end].sum() >= min_pixels]
+    if not spans:
+        return []
+
+    median_width = float(np.median([end - start for start, end in spans]))
+    split = []
+    stack = list(reversed(spans))
+    while stack:
+        start, end = stack.pop()
+        width = end - start
+        if width > max_width_ratio * median_width and width >= 4:
+            # Cut at the weakest column of the middle half
+            lo, hi = start + width // 4, end - width // 4
+            cut = lo + int(np.argmin(projection[lo:hi]))
+            stack.extend([(cut, end), (start, cut)])
+            continue
+        split.append((start, end))
+
+    glyphs = []
+    for start, end in split:
+        column = mask[:, start:end]
+        rows = np.flatnonzero(column.any(axis=1))
+        if len(rows):
+            glyphs.append(column[rows[0]:rows[-1] + 1])
+    return glyphs
+
+def features(glyph, size=16):
+    """
+    Turn a glyph into a fixed-length, unit-norm feature vector.
+
+    The glyph is padded to a square (keeping its aspect ratio) and
+    resampled to size x size.
+    """
+    import numpy as np
+    height, width = glyph.shape
+    side = max(height, width)
+    square = np.zeros((side, side), dtype=np.float32)
+    top, left = (side - height) // 2, (side - width) // 2
+    square[top:top + height, left:left + width] = glyph
+    index = ((np.arange(size) + 0.5) * side / size).astype(np.intp)
+    vector = square[np.ix_(index, index)].ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class CaptchaModel:
+    """
+    Template/kNN captcha recognizer.
+
+    Args:
+        templates: Feature vectors, one row per training glyph
+        labels: Character of each template
+        size (int): Glyph resampling size used for the features
+        k (int): Number of neighbours voting on each character
+        preprocess (str, optional): Preprocessing pipeline applied before
+                                    segmentation, see awb_tracking.preprocess
+    """
+
+    def __init__(self, templates, labels, size=16, k=1, preprocess=None):
+        import numpy as np
+        self.templates = np.asarray(templates, dtype=np.float32)
+        self.labels = np.asarray(labels)
+        self.size = int(size)
+        self.k = max(1, int(k))
+        self.preprocess = preprocess or None
+
+    def glyphs(self, image):
+        """Return the segmented glyphs of an image."""
+        if self.preprocess:
+            from .preprocess import get_pipeline
+            from .ocr import load_image
+            image = get_pipeline(self.preprocess)(load_image(image))
+        gray = to_gray(image)
+        if gray is None:
+            return []
+        return segment(binarize(gray))
+
+    def predict(self, image):
+        """
+        Recognize the characters of a captcha image.
+
+        Args:
+            image: File path, raw image bytes, PIL Image or NumPy array
+
+        Returns:
+            str: The recognized text, empty if no characters were found
+        """
+        import numpy as np
+        glyphs = self.glyphs(image)
+        if not glyphs or not len(self.templates):
+            return ""
+        vectors = np.stack([features(glyph, self.size) for glyph in glyphs])
+        # Cosine similarity, the vectors are unit-norm
+        similarity = vectors @ self.templates.T
+        if self.k == 1:
+            return "".join(self.labels[np.argmax(similarity, axis=1)])
+
+        k = min(self.k, similarity.shape[1])
+        nearest = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        text = []
+        for row, neighbours in enumerate(nearest):
+            votes = {}
+            for index in neighbours:
+                label = self.labels[index]
+                votes[label] = votes.get(label, 0.0) + similarity[row, index]
+            text.append(max(votes, key=votes.get))
+        return "".join(text)
+
+    def save(self, path):
+        """
+        Write the model to a .npz file.
+        """
+        import numpy as np
+        np.savez_compressed(path, version=MODEL_VERSION, templates=self.templates,
+                            labels=self.labels, size=self.size, k=self.k,
+                            preprocess=self.preprocess or "")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a model written by save().
+
+        Raises:
+            ValueError: If the file was written by a newer, incompatible version
+        """
+        import numpy as np
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"])
+            if version > MODEL_VERSION:
+                raise ValueError(f"Unsupported captcha model version {version} in {path}")
+            return cls(data["templates"], data["labels"], size=int(data["size"]),
+                       k=int(data["k"]), preprocess=str(data["preprocess"]))
+
+def load_labels(folder):
+    """
+    Return (image path, text) pairs for a labeled captcha folder.
+
+    Uses labels.csv (file and text columns) when present, otherwise the
+    file name without extension is the text.
+    """
+    labels_path = os.path.join(folder, "labels.csv")
+    if os.path.exists(labels_path):
+        with open(labels_path, newline='') as f:
+            rows = [(row["file"], row.get("text") or "") for row in csv.DictReader(f)]
+    else:
+        rows = [(name, os.path.splitext(name)[0]) for name in sorted(os.listdir(folder))
+                if name.lower().endswith(IMAGE_EXTENSIONS)]
+    return [(os.path.join(folder, name), text.replace(" ", "")) for name, text in rows]
+
+def train(samples, size=16, k=1, preprocess=None):
+    """
+    Build a model from labeled captchas.
+
+    Only images that segment into exactly as many glyphs as their label has
+    characters are used, so one bad segmentation cannot teach wrong templates.
+
+    Args:
+        samples: (image, text) pairs; the image is anything load_image() accepts
+        size, k, preprocess: See CaptchaModel
+
+    Returns:
+        tuple: (CaptchaModel, number of images used, number skipped)
+    """
+    import numpy as np
+    model = CaptchaModel(np.zeros((0, size * size)), [], size=size, k=k, preprocess=preprocess)
+    templates = []
+    labels = []
+    used = skipped = 0
+    for image, text in samples:
+        glyphs = model.glyphs(image)
+        if not text or len(glyphs) != len(text):
+            skipped += 1
+            continue
+        used += 1
+        for glyph, char in zip(glyphs, text):
+            templates.append(features(glyph, size))
+            labels.append(char)
+
+    if templates:
+        model.templates = np.stack(templates).astype(np.float32)
+        model.labels = np.asarray(labels)
+    return model, used, skipped
+
+_models = {}
+_models_lock = threading.Lock()
+
+def register_model(name, model):
+    """
+    Make a model available to ocr_processor as engine "model:<name>"
+    ("model" alone uses the name "default").
+
+    Args:
+        name (str): Model name, e.g. a courier name
+        model: CaptchaModel or path to a .npz model file
+
+    Returns:
+        CaptchaModel: The registered model
+    """
+    if not isinstance(model, CaptchaModel):
+        model = CaptchaModel.load(model)
+    with _models_lock:
+        _models[name] = model
+    return model
+
+def get_model(name="default"):
+    """
+    Return the model registered under a name, or None.
+    """
+    return _models.get(name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train and run the lightweight captcha recognizer')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train_parser = commands.add_parser('train', help='Train a model from a labeled captcha folder')
+    train_parser.add_argument('folder', help='Folder of captchas with labels.csv or labeled file names')
+    train_parser.add_argument('-o', '--output', default='captcha_model.npz', help='Model file to write')
+    train_parser.add_argument('--size', type=int, default=16, help='Glyph resampling size')
+    train_parser.add_argument('-k', type=int, default=1, help='Neighbours voting on each character')
+    train_parser.add_argument('--preprocess', help='Preprocessing pipeline applied before segmentation')
+
+    predict_parser = commands.add_parser('predict', help='Recognize captcha images with a model')
+    predict_parser.add_argument('model', help='Model file written by train')
+    predict_parser.add_argument('images', nargs='+', help='Captcha images')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'train':
+        samples = load_labels(args.folder)
+        model, used, skipped = train(samples, size=args.size, k=args.k, preprocess=args.preprocess)
+        if not used:
+            print(f"No usable captchas in {args.folder} ({skipped} could not be segmented)")
+            return 1
+        model.save(args.output)
+        print(f"Trained on {used} captchas ({skipped} skipped), "
+              f"{len(model.labels)} templates for {len(set(model.labels.tolist()))} characters")
+        print(f"Model written to {args.output}")
+    else:
+        model = CaptchaModel.load(args.model)
+        for path in args.images:
+            print(f"{path}: {model.predict(path)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+Structured answers for India Post captcha questions.
+
+The captcha question on the tracking page says how to answer the image:
+
+    "Enter characters as displayed in image"  -> the characters, lower-cased
+    "Evaluate the Expression"                  -> the integer result, e.g. "12 + 7 ="
+    "Enter the First/Second/... number"        -> one digit of the image
+
+OCR text is corrected for common confusions (O/0, l/1, S/5, B/8, x/*...)
+before it is interpreted, and answers that cannot be right (an expression
+that does not parse, a digit that is not there) raise CaptchaSolveError.
+The caller can then fetch a fresh captcha instead of spending a form
+submission on a wrong answer. Expressions are tokenized and evaluated
+here; nothing is passed to eval(). For a question of an unknown type the
+cleaned OCR text is submitted as is.
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+class CaptchaSolveError(ValueError):
+    """The OCR text does not give a plausible answer to the captcha question."""
+
+# Characters OCR engines return for digits in a numeric captcha
+DIGIT_CONFUSIONS = {
+    "O": "0", "o": "0", "D": "0", "Q": "0", "U": "0",
+    "l": "1", "I": "1", "i": "1", "|": "1", "!": "1", "j": "1", "L": "1",
+    "Z": "2", "z": "2",
+    "A": "4",
+    "S": "5", "s": "5",
+    "G": "6", "b": "6",
+    "T": "7",
+    "B": "8",
+    "g": "9", "q": "9",
+}
+
+# Characters OCR engines return for arithmetic operators
+OPERATOR_CONFUSIONS = {
+    "+": "+", "t": "+", "÷": "/", "/": "/", ":": "/",
+    "-": "-", "—": "-", "–": "-", "_": "-", "~": "-",
+    "*": "*", "x": "*", "X": "*", "×": "*",
+}
+
+# Characters that carry no information in an expression captcha
+IGNORED = " \t\r\n=?.,'\"`"
+
+ORDINALS = ("first", "second", "third", "fourth", "fifth", "sixth")
+
+# Plausibility limits for India Post captchas
+MAX_OPERANDS = 4
+MAX_OPERAND_DIGITS = 3
+MAX_ANSWER = 10000
+CHARACTERS_LENGTH = (3, 8)
+
+def classify_question(question):
+    """
+    Return the type of a captcha question.
+
+    Returns:
+        tuple: ("characters", None), ("expression", None) or
+               ("nth_number", zero-based position)
+
+    Raises:
+        CaptchaSolveError: If the question is not one India Post uses
+    """
+    text = " ".join((question or "").split()).lower()
+    if "characters as displayed" in text:
+        return "characters", None
+    if "evaluate the expression" in text:
+        return "expression", None
+    match = re.search(r"enter the (\w+) number", text)
+    if match and match.group(1) in ORDINALS:
+        return "nth_number", ORDINALS.index(match.group(1))
+    raise CaptchaSolveError(f"Unknown captcha question type: {question}")
+
+def correct_digits(text):
+    """
+    Map OCR confusions to digits and drop separators.
+
+    Raises:
+        CaptchaSolveError: If a character is neither a digit nor a known confusion
+    """
+    digits = []
+    for char in text:
+        if char.isdigit():
+            digits.append(char)
+        elif char in DIGIT_CONFUSIONS:
+            digits.append(DIGIT_CONFUSIONS[char])
+        elif char not in IGNORED:
+            raise CaptchaSolveError(f"Unexpected character {char!r} in number captcha {text!r}")
+    return "".join(digits)
+
+def tokenize(expression):
+    """
+    Split OCR text of an arithmetic captcha into numbers and operators.
+
+    A character is read as an operator only where an operator can appear
+    (after a number), and as a digit otherwise, so "l2 x 3" becomes
+    [12, "*", 3].
+
+    Returns:
+        list: Alternating ints and operator strings
+
+    Raises:
+        CaptchaSolveError: If the text is not number (operator number)*
+    """
+    tokens = []
+    number = ""
+    for char in expression:
+        if char in IGNORED:
+            continue
+        if char.isdigit() or (char in DIGIT_CONFUSIONS and char not in OPERATOR_CONFUSIONS):
+            number += DIGIT_CONFUSIONS.get(char, char)
+        elif char in OPERATOR_CONFUSIONS and number:
+            tokens.append(int(number))
+            tokens.append(OPERATOR_CONFUSIONS[char])
+            number = ""
+        else:
+            raise CaptchaSolveError(f"Unexpected character {char!r} in expression {expression!r}")
+    if not number:
+        raise CaptchaSolveError(f"Incomplete expression {expression!r}")
+    tokens.append(int(number))
+
+    operands = tokens[::2]
+    if len(operands) < 2 or len(operands) > MAX_OPERANDS:
+        raise CaptchaSolveError(f"Implausible number of operands in {expression!r}")
+    if any(value >= 10 ** MAX_OPERAND_DIGITS for value in operands):
+        raise CaptchaSolveError(f"Implausible operand in {expression!r}")
+    return tokens
+
+def evaluate(tokens):
+    """
+    Evaluate tokens from tokenize() with the usual operator precedence.
+
+    Raises:
+        CaptchaSolveError: On division by zero or a non-integer result
+    """
+    # Multiplication and division first, collecting the terms to add up
+    terms = [tokens[0]]
+    signs = [1]
+    for operator, value in zip(tokens[1::2], tokens[2::2]):
+        if operator == "*":
+            terms[-1] *= value
+        elif operator == "/":
+            if value == 0 or terms[-1] % value:
+                raise CaptchaSolveError(f"Division {terms[-1]} / {value} has no integer result")
+            terms[-1] //= value
+        else:
+            terms.append(value)
+            signs.append(1 if operator == "+" else -1)
+    return sum(sign * term for sign, term in zip(signs, terms))
+
+def solve(question, ocr_text):
+    """
+    Answer an India Post captcha question from the OCR text of its image.
+
+    Args:
+        question (str): The captcha question shown on the page
+        ocr_text (str): Text recognized in the captcha image
+
+    Returns:
+        str: The answer to submit; for an unknown question, the letters and
+             digits of the OCR text
+
+    Raises:
+        CaptchaSolveError: If the text does not give a plausible answer
+    """
+    try:
+        kind, position = classify_question(question)
+    except CaptchaSolveError:
+        # Better a guess than discarding every attempt
+        logger.warning("Unknown captcha question %r, submitting the OCR text", question)
+        kind, position = None, None
+    text = (ocr_text or "").strip()
+    if not text:
+        raise CaptchaSolveError("Empty OCR text")
+
+    if kind is None:
+        answer = "".join(char for char in text if char.isalnum()).lower()
+        if not answer:
+            raise CaptchaSolveError(f"No characters in {text!r}")
+        return answer
+
+    if kind == "characters":
+        answer = "".join(char for char in text if char.isalnum()).lower()
+        low, high = CHARACTERS_LENGTH
+        if not low <= len(answer) <= high:
+            raise CaptchaSolveError(f"Implausible captcha length in {text!r}")
+        return answer
+
+    if kind == "expression":
+        result = evaluate(tokenize(text))
+        if not 0 <= result < MAX_ANSWER:
+            raise CaptchaSolveError(f"Implausible expression result {result} for {text!r}")
+        return str(result)
+
+    digits = correct_digits(text)
+    if len(digits) <= position:
+        raise CaptchaSolveError(f"No {ORDINALS[position]} number in {text!r}")
+    return digits[position]
@@ -0,0 +1,212 @@
+"""
+Parsed HTML documents shared by the tracker helpers.
+
+A courier response is parsed once into an HtmlDocument and every helper
+queries that object, instead of each helper re-parsing the raw HTML.
+The parser backend is pluggable: selectolax (lexbor) is used when it is
+installed, then BeautifulSoup with lxml, then BeautifulSoup with the
+standard library html.parser. Parser libraries are imported on first use.
+"""
+
+BACKENDS = ("selectolax", "lxml", "html.parser")
+
+_default_backend = None
+
+def available_backends():
+    """
+    Return the names of the parser backends that can be used in this environment,
+    fastest first.
+    """
+    backends = []
+    try:
+        from selectolax.lexbor import LexborHTMLParser  # noqa: F401
+        backends.append("selectolax")
+    except ImportError:
+        pass
+    try:
+        import lxml  # noqa: F401
+        backends.append("lxml")
+    except ImportError:
+        pass
+    backends.append("html.parser")
+    return backends
+
+def get_default_backend():
+    """Return the backend used when HtmlDocument is created without one."""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = available_backends()[0]
+    return _default_backend
+
+def set_default_backend(backend):
+    """
+    Choose the parser backend used by all trackers.
+
+    Args:
+        backend (str): One of "selectolax", "lxml" or "html.parser"
+    """
+    global _default_backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown HTML backend: {backend}")
+    _default_backend = backend
+
+class _SoupBackend:
+    """BeautifulSoup backend, with either lxml or html.parser underneath."""
+
+    def __init__(self, content, parser):
+        from bs4 import BeautifulSoup
+        self.soup = BeautifulSoup(content, parser)
+
+    def find(self, element_id, tag=None):
+        if tag:
+            return self.soup.find(tag, id=element_id)
+        return self.soup.find(id=element_id)
+
+    def inner_html(self, element_id):
+        element = self.find(element_id)
+        return element.decode_contents() if element else None
+
+    def attr(self, element_id, name, tag=None):
+        element = self.find(element_id, tag)
+        if element and element.has_attr(name):
+            return element[name]
+        return None
+
+    def inputs(self):
+        return [(tag.get('name'), tag.get('value', ''), tag.get('type')) for tag in self.soup.find_all('input')]
+
+    def selects(self):
+        selects = []
+        for select_tag in self.soup.find_all('select'):
+            # Use the selected option, or the first one if none is selected
+            option = select_tag.find('option', selected=True) or select_tag.find('option')
+            selects.append((select_tag.get('name'), option.get('value', '') if option else None))
+        return selects
+
+    def table_rows(self, element_id):
+        element = self.find(element_id)
+        if not element:
+            return None
+        return [[cell.get_text().strip() for cell in row.find_all(['th', 'td'])]
+                for row in element.find_all('tr')]
+
+class _SelectolaxBackend:
+    """selectolax (lexbor) backend."""
+
+    def __init__(self, content):
+        from selectolax.lexbor import LexborHTMLParser
+        self.tree = LexborHTMLParser(content)
+
+    def find(self, element_id, tag=None):
+        return self.tree.css_first(f'{tag or ""}[id="{element_id}"]')
+
+    def inner_html(self, element_id):
+        element = self.find(element_id)
+        if element is None:
+            return None
+        inner = getattr(element, 'inner_html', None)
+        if inner is None:
+            inner = "".join(child.html or "" for child in element.iter(include_text=True))
+        return inner
+
+    def attr(self, element_id, name, tag=None):
+        element = self.find(element_id, tag)
+        if element is None:
+            return None
+        return element.attributes.get(name)
+
+    def inputs(self):
+        return [(node.attributes.get('name'), node.attributes.get('value') or '', node.attributes.get('type'))
+                for node in self.tree.css('input')]
+
+    def selects(self):
+        selects = []
+        for node in self.tree.css('select'):
+            options = node.css('option')
+            # Use the selected option, or the first one if none is selected
+            option = next((o for o in options if 'selected' in o.attributes), options[0] if options else None)
+            selects.append((node.attributes.get('name'), (option.attributes.get('value') or '') if option else None))
+        return selects
+
+    def table_rows(self, element_id):
+        element = self.find(element_id)
+        if element is None:
+            return None
+        return [[cell.text(strip=True) for cell in row.css('th, td')] for row in element.css('tr')]
+
+class HtmlDocument:
+    """
+    An HTML response parsed once and queried by all helpers.
+
+    Args:
+        content (bytes or str): The HTML content to parse
+        backend (str, optional): Parser backend, see set_default_backend()
+    """
+
+    def __init__(self, content, backend=None):
+        self.content = content
+        self.backend = backend or get_default_backend()
+        if self.backend == "selectolax":
+            self._impl = _SelectolaxBackend(content)
+        else:
+            self._impl = _SoupBackend(content, self.backend)
+
+    def inner_html(self, element_id):
+        """
+        Return the inner HTML of the element with the given ID, or None if not found.
+        """
+        return self._impl.inner_html(element_id)
+
+    def attr(self, element_id, name, tag=None):
+        """
+        Return an attribute of the element with the given ID (optionally
+        restricted to a tag name), or None if missing.
+        """
+        return self._impl.attr(element_id, name, tag)
+
+    def form_fields(self):
+        """
+        Extract all form fields that need to be submitted, including hidden fields.
+
+        Returns:
+            dict: Dictionary of form field names and values
+        """
+        form_data = {}
+
+        # Extract all input fields, skipping the submit buttons
+        for name, value, input_type in self._impl.inputs():
+            if input_type == 'submit':
+                continue
+            if name:
+                form_data[name] = value
+
+        # Extract all select fields
+        for name, value in self._impl.selects():
+            if name and value is not None:
+                form_data[name] = value
+
+        return form_data
+
+    def table_rows(self, element_id):
+        """
+        Return the stripped cell texts of every row in the table with the given ID.
+
+        Returns:
+            list: One list of cell texts (th and td) per row, or None if not found
+        """
+        return self._impl.table_rows(element_id)
+
+def parse(content, backend=None):
+    """
+    Return an HtmlDocument for the content, reusing it if it is already parsed.
+
+    Args:
+        content (bytes, str or HtmlDocument): The HTML content
+        backend (str, optional): Parser backend for unparsed content
+
+    Returns:
+        HtmlDocument: The parsed document
+    """
+    if isinstance(content, HtmlDocument):
+        return content
+    return HtmlDocument(content, backend)
@@ -1,28 +1,83 @@
+import asyncio
+import logging
 import requests
-import json
 import re
 import base64
-import os
-from bs4 import BeautifulSoup
 from awb_tracking.ocr import ocr_processor
+from . import artifacts
+from . import document
+from . import metrics
+from . import presolve
+from . import transport
 from . import utils
 
+logger = logging.getLogger(__name__)
+
+COURIER = "dtdc"
+
+TRACKING_URL = "https://www.dtdc.in/trace.asp"
+
+# Captcha preprocessing pipeline for the OCR engines, see preprocess.PIPELINE_SPECS
+PREPROCESS = "dtdc"
+
+# Error messages of the re-rendered search form when the captcha answer is
+# wrong, e.g. "Invalid Captcha", "Captcha is incorrect", "Wrong captcha code"
+CAPTCHA_ERROR_PATTERN = re.compile(
+    r"\b(?:invalid|incorrect|wrong)\s+captcha\b"
+    r"|\bcaptcha\b[^<]{0,30}?\b(?:is\s+)?(?:invalid|incorrect|wrong|does\s+not\s+match|mismatch)",
+    re.IGNORECASE)
+
 class DTDCTracker:
     """
     Tracker implementation for DTDC courier service.
+    
+    Args:
+        max_captcha_attempts (int): Maximum number of captchas to solve per lookup
+        ocr_engines (tuple): OCR engines to cycle through on successive attempts
+        preprocess (str, optional): Captcha preprocessing pipeline, the DTDC one
+                                    by default; None uses the OCR engine default,
+                                    "none" disables preprocessing. Captcha
+                                    models skip the DTDC pipeline, they apply
+                                    the one they were trained with
+        artifact_sink (ArtifactSink, optional): Where the raw pages of each lookup
+                                                go; defaults to artifacts.get_sink()
+        timeout (float): Time budget in seconds of one lookup across all of its
+                         steps; a lookup that runs out returns a "timeout" result
+        presolve_size (int): Sessions with a solved captcha kept ready by background
+                             threads, see presolve.PresolvePool; 0 disables it
+        presolve_ttl (float): Seconds a pre-solved captcha stays usable
     """
 
-    def fetch_captcha_image(self, session):
+    def __init__(self, max_captcha_attempts=3, ocr_engines=("easyocr",), preprocess=PREPROCESS, artifact_sink=None,
+                 timeout=utils.DEFAULT_LOOKUP_TIMEOUT, presolve_size=0, presolve_ttl=60.0):
+        self.max_captcha_attempts = max_captcha_attempts
+        self.ocr_engines = tuple(ocr_engines)
+        self.preprocess = preprocess
+        self.artifact_sink = artifact_sink
+        self.captcha_stats = utils.CaptchaStats(COURIER)
+        self.timeout = timeout
+        self.presolver = None
+        if presolve_size:
+            self.presolver = presolve.PresolvePool(COURIER, self._presolve, lambda prepared: prepared.session.close(),
+                                                   size=presolve_size, ttl=presolve_ttl)
+
+    def fetch_captcha_image(self, session, ocr_engine="easyocr", deadline=None):
         """
         Fetch captcha image directly from the DTDC captcha API service.
         This function mimics the JavaScript fetch operation in the DTDC website.
         
         Args:
             session (requests.Session): The session to use for making the request
+            ocr_engine (str): OCR engine to use ('easyocr' or 'tesseract')
+            deadline (Deadline, optional): Time budget of the lookup
             
         Returns:
             tuple: (captcha_text, captcha_key)
+            
+        Raises:
+            LookupTimeout: If a step timed out or the deadline is spent
         """
+        deadline = deadline or utils.Deadline()
         # CAPTCHA API URL and endpoint from the JavaScript code
         captcha_api_url = "https://d-captcha-com.dtdc.com/captch-service/captcha/generate"
         
@@ -33,7 +88,10 @@ class DTDCTracker:
         
         try:
             # Make the request to get the captcha
-            response = session.get(captcha_api_url, headers=headers)
+            with metrics.stage(COURIER, "captcha_download"):
+                response = session.get(captcha_api_url, headers=headers,
+                                       timeout=deadline.request_timeout("captcha_download"))
+            metrics.record_response(COURIER, response)
             response.raise_for_status()
             
             data = response.json()
@@ -42,79 +100,203 @@ class DTDCTracker:
             captcha_image_base64 = data.get("image")
             captcha_key = data.get("key")
             
-            # Save the captcha image
+            # Decode the captcha image in memory
             if captcha_image_base64:
-                with open("out/captcha_dtdc.png", "wb") as f:
-                    f.write(base64.b64decode(captcha_image_base64))
+                captcha_image = base64.b64decode(captcha_image_base64)
                 
-                # Process the captcha with OCR
-                captcha_text = ocr_processor("out/captcha_dtdc.png")
+                # Process the captcha with OCR; it cannot be interrupted,
+                # so the budget is checked before and after it
+                preprocess = self.preprocess
+                # The captcha model applies the pipeline it was trained with
+                if preprocess == PREPROCESS and ocr_engine.lower().startswith("model"):
+                    preprocess = None
+                remaining = deadline.check("ocr")
+                try:
+                    with metrics.stage(COURIER, "ocr"):
+                        captcha_text = ocr_processor(captcha_image, ocr=ocr_engine, debug=False,
+                                                     preprocess=preprocess, timeout=remaining)
+                except TimeoutError as e:
+                    raise utils.LookupTimeout("ocr", "OCR worker did not answer in time") from e
+                deadline.check("ocr")
                 return captcha_text, captcha_key
             else:
-                print("No captcha image returned from API")
+                logger.warning("No captcha image returned from API")
                 return "", ""
                 
+        except utils.LookupTimeout:
+            raise
+        except requests.Timeout as e:
+            metrics.record_response(COURIER, None)
+            raise utils.LookupTimeout("captcha_download", e) from e
         except Exception as e:
-            print(f"Error fetching captcha: {str(e)}")
+            logger.error("Error fetching captcha: %s", e)
             return "", ""
 
-    def track(self, awb_number):
-        # Create a session for maintaining cookies
-        session = requests.Session()
-        os.makedirs("out", exist_ok=True)
+    @staticmethod
+    def is_captcha_rejected(html):
+        """
+        Check whether a tracking response was rejected because of the captcha.
+        
+        DTDC re-renders the search form with a captcha error message instead
+        of the result block ("printdiv") when the captcha answer is wrong. A
+        response with neither is not a captcha rejection; the lookup then
+        reports that no tracking information was found.
+        
+        Args:
+            html (str): The tracking response HTML
+            
+        Returns:
+            bool: True if the captcha was rejected
+        """
+        has_result = re.search(r'id\s*=\s*["\']?printdiv\b', html) is not None
+        return not has_result and CAPTCHA_ERROR_PATTERN.search(html) is not None
+
+    def prepare(self, deadline=None):
+        """
+        Run every step of a lookup that does not depend on the AWB number:
+        load the tracking page for its cookies and CSRF token, then fetch
+        and solve a captcha.
         
+        Args:
+            deadline (Deadline, optional): Time budget for the preparation
+            
+        Returns:
+            PreparedCaptcha: Session with the page, CSRF token and captcha key
+                             as state; its answer is None if no captcha could
+                             be solved
+            
+        Raises:
+            requests.RequestException: If the tracking page could not be loaded
+            LookupTimeout: If a step timed out or the deadline is spent
+        """
+        deadline = deadline or utils.Deadline()
+        # A session for this lookup's cookies, on the shared connection pools
+        session = transport.get_transport().session()
         try:
             # Step 1: Fetch the tracking page
-            tracking_url = "https://www.dtdc.in/trace.asp"
-            response = session.get(tracking_url)
+            try:
+                with metrics.stage(COURIER, "page_fetch"):
+                    response = session.get(TRACKING_URL, timeout=deadline.request_timeout("page_fetch"))
+            except requests.Timeout as e:
+                raise utils.LookupTimeout("page_fetch", e) from e
+            metrics.record_response(COURIER, response)
             response.raise_for_status()
             
-            # Save the home page HTML
-            with open("out/dtdc_tracking_home.html", "w", encoding="utf-8") as f:
-                f.write(response.text)
-            
             # Step 2: Extract CSRF token from the page
-            soup = BeautifulSoup(response.text, 'html.parser')
-            csrf_token = soup.find('input', {'name': 'formDtdc'}).get('value', '')
+            page = document.parse(response.content)
+            csrf_token = page.form_fields().get('formDtdc', '')
+            
+            prepared = presolve.PreparedCaptcha(session, content=response.content, csrf_token=csrf_token)
+            self.resolve_captcha(prepared, deadline)
+            return prepared
+        except BaseException:
+            session.close()
+            raise
+
+    def resolve_captcha(self, prepared, deadline=None):
+        """
+        Fetch and solve fresh captchas on a prepared session until one is
+        read or max_captcha_attempts is reached.
+        
+        Returns:
+            str: The new answer, also set as prepared.answer; None if none was read
+        """
+        prepared.answer = None
+        while prepared.attempts < self.max_captcha_attempts:
+            ocr_engine = self.ocr_engines[prepared.attempts % len(self.ocr_engines)]
+            prepared.attempts += 1
             
             # Step 3: Fetch captcha image using the API directly
-            captcha_text, captcha_key = self.fetch_captcha_image(session)
+            captcha_text, captcha_key = self.fetch_captcha_image(prepared.session, ocr_engine, deadline)
+            if captcha_text and captcha_key:
+                prepared.answer = captcha_text
+                prepared.state["captcha_key"] = captcha_key
+                break
+            prepared.discarded += 1
+        return prepared.answer
+
+    def _presolve(self):
+        """Prepare a session in the background, see prepare()."""
+        prepared = self.prepare(utils.Deadline(self.timeout))
+        if not prepared.answer:
+            prepared.session.close()
+            return None
+        return prepared
+
+    def track(self, awb_number):
+        prepared = None
+        if self.presolver is not None:
+            prepared = self.presolver.start().take()
+        # Raw pages of this lookup go to the debug artifact sink
+        record = (self.artifact_sink or artifacts.get_sink()).start(COURIER, awb_number)
+        tracking_result = None
+        try:
+            tracking_result = self._track(awb_number, record, utils.Deadline(self.timeout), prepared)
+            return tracking_result
+        finally:
+            record.finish(tracking_result)
+
+    def _track(self, awb_number, record, deadline, prepared=None):
+        # Step in progress, reported if a request times out
+        step = "page_fetch"
+        
+        try:
+            if prepared is None:
+                prepared = self.prepare(deadline)
+            session = prepared.session
+            record.add("home.html", prepared.state["content"])
             
-            if not captcha_text or not captcha_key:
-                return {
-                    "tracking_number": awb_number,
-                    "status": "error",
-                    "status_txt": "Failed to fetch or process captcha"
+            # Step 4 is retried with a fresh captcha while DTDC rejects it;
+            # the session, its cookies and the CSRF token are reused
+            accepted = False
+            while prepared.answer:
+                # Step 4: Submit the tracking form with captcha
+                payload = {
+                    'formDtdc': prepared.state["csrf_token"],
+                    'action': 'track',
+                    'captchaKeyval': prepared.state["captcha_key"],
+                    'sec': 'tr',
+                    'ctlActiveVal': '1',
+                    'Ttype': '',
+                    'GES': '',
+                    'flag': '1',
+                    'trackingType': 'consignmentNo',
+                    'trackingNumber': awb_number,
+                    'captchaInput': prepared.answer
                 }
-            
-            # Step 4: Submit the tracking form with captcha
-            payload = {
-                'formDtdc': csrf_token,
-                'action': 'track',
-                'captchaKeyval': captcha_key,
-                'sec': 'tr',
-                'ctlActiveVal': '1',
-                'Ttype': '',
-                'GES': '',
-                'flag': '1',
-                'trackingType': 'consignmentNo',
-                'trackingNumber': awb_number,
-                'captchaInput': captcha_text
-            }
 
-            print(payload)
-            print("Submitting tracking request...")
+                logger.debug("Submitting tracking request: %s", payload)
+                
+                # Make the POST request
+                step = "submit"
+                with metrics.stage(COURIER, "submit"):
+                    response = session.post(TRACKING_URL, data=payload, timeout=deadline.request_timeout(step))
+                metrics.record_response(COURIER, response)
+                response.raise_for_status()
+                
+                record.add("status.html", response.content)
+                
+                if not self.is_captcha_rejected(response.text):
+                    accepted = True
+                    break
+                
+                logger.info("Captcha rejected (attempt %d of %d)", prepared.attempts, self.max_captcha_attempts)
+                self.resolve_captcha(prepared, deadline)
             
-            # Make the POST request
-            response = session.post(tracking_url, data=payload)
-            response.raise_for_status()
+            attempts = prepared.attempts
+            self.captcha_stats.record(attempts, accepted, prepared.discarded)
             
-            # Save the tracking result page
-            with open("out/dtdc_tracking_status.html", "w", encoding="utf-8") as f:
-                f.write(response.text)
+            if not accepted:
+                return {
+                    "tracking_number": awb_number,
+                    "status": "error",
+                    "status_txt": f"Failed to fetch, process or submit captcha after {attempts} attempts",
+                    "captcha_attempts": attempts
+                }
             
             # Parse the tracking information
-            tracking_details = utils.get_html_value_by_id(response.content, "printdiv")
+            with metrics.stage(COURIER, "parse"):
+                tracking_details = utils.get_html_value_by_id(response.content, "printdiv")
             if tracking_details is not None:
                
                 # Initialize variables to extract
@@ -131,7 +313,8 @@ class DTDCTracker:
                     "status": status,
                     "location": location,
                     "date_time": date_time,
-                    "status_txt": tracking_details
+                    "status_txt": tracking_details,
+                    "captcha_attempts": attempts
                 }
                 
                 return tracking_info
@@ -139,16 +322,45 @@ class DTDCTracker:
                 return {
                     "tracking_number": awb_number,
                     "status": "error",
-                    "status_txt": "Could not find tracking information"
+                    "status_txt": "Could not find tracking information",
+                    "captcha_attempts": attempts
                 }
             
             
                 
+        except utils.LookupTimeout as e:
+            logger.warning("Lookup of %s stopped: %s", awb_number, e)
+            return utils.timeout_result(awb_number, e, captcha_attempts=prepared.attempts if prepared else 0)
+        except requests.Timeout as e:
+            metrics.record_response(COURIER, None)
+            error = utils.LookupTimeout(step, e)
+            logger.warning("Lookup of %s stopped: %s", awb_number, error)
+            return utils.timeout_result(awb_number, error, captcha_attempts=prepared.attempts if prepared else 0)
         except requests.RequestException as e:
+            if e.response is None:
+                metrics.record_response(COURIER, None)
             return {
                 "tracking_number": awb_number,
                 "status": "error",
                 "status_txt": f"Request failed: {str(e)}"
             }
+        finally:
+            if prepared is not None:
+                # Drops the lookup's cookies; pooled connections stay open
+                prepared.session.close()
 
-
+    async def track_async(self, awb_number, client=None):
+        """
+        Track a DTDC shipment without blocking the event loop.
+        
+        The lookup is a multi-step captcha flow whose OCR step is CPU-bound,
+        so the whole flow runs in the default thread pool executor.
+        
+        Args:
+            awb_number: The tracking number
+            client: Accepted for interface compatibility; not used
+            
+        Returns:
+            Dictionary with tracking information
+        """
+        return await asyncio.to_thread(self.track, awb_number)
@@ -1,71 +1,148 @@
 import requests
-import json
-import os
+
+from . import artifacts
+from . import metrics
+from . import transport
+from . import utils
+
+COURIER = "ecomexpress"
+
+# API endpoint for EcomExpress tracking
+TRACKING_URL = "https://www.ecomexpress.in/api/track-awb"
 
 '''
 Install required packages using pip:
 pip install requests
+pip install httpx  # optional, only needed for track_async()
 '''
 
 class EcomExpressTracker:
     """
     Tracker implementation for EcomExpress courier service.
+    
+    Args:
+        artifact_sink (ArtifactSink, optional): Where raw API responses go;
+                                                defaults to artifacts.get_sink()
     """
 
+    def __init__(self, artifact_sink=None):
+        self.artifact_sink = artifact_sink
+
+    def _start_record(self, awb_number):
+        return (self.artifact_sink or artifacts.get_sink()).start(COURIER, awb_number)
+
+    def _parse_result(self, awb_number, data):
+        """
+        Convert the EcomExpress JSON response into the common tracking format.
+        """
+        if data.get("success"):
+            result = data.get("result", {})
+            
+            # Get the latest status (last item in shipment_status array)
+            shipment_status = result.get("shipment_status", [])
+            latest_status = shipment_status[-1] if shipment_status else {}
+            
+            # Create a dictionary with the tracking information
+            tracking_info = {
+                "tracking_number": awb_number,
+                "status": latest_status.get("external_status_desc", ""),
+                "location": latest_status.get("service_center_name", ""),
+                "date_time": latest_status.get("scan_date", ""),
+                "status_txt": result  # Including the full details for reference
+            }
+                            
+            # Return the tracking information as a JSON string
+            return tracking_info
+
+        return {
+            "tracking_number": awb_number,
+            "status": "error",
+            "status_txt": f"Error extracting status: {data}"
+        }
+
     def track(self, awb_number):
-        # In a real implementation, this would make an API call to EcomExpress
-        # For demonstration, we'll return a mock response
-        # API endpoint for EcomExpress tracking
-        url = "https://www.ecomexpress.in/api/track-awb"
-        
         # Request payload
         payload = {"awb_field": awb_number}
+        record = self._start_record(awb_number)
+        tracking_result = None
         
         try:
             # Make the POST request to the API
-            response = requests.post(url, json=payload)
+            with metrics.stage(COURIER, "request"):
+                response = transport.get_transport().post(TRACKING_URL, json=payload)
+            metrics.record_response(COURIER, response)
+            record.add("tracking.json", response.content)
             response.raise_for_status()  # Raise exception for bad status codes
             
             # Parse the JSON response
-            data = response.json()
-           
-            if data.get("success"):
-                result = data.get("result", {})
-
-                # Save tracking result to JSON file
-                try:
-                    # Write tracking info to JSON file
-                    with open("out/ecomexpress_tracking.json", "w") as f:
-                        json.dump(result, f, indent=4)
-                except Exception as e:
-                    print(f"Error saving tracking info to file: {str(e)}")
-                
-                # Get the latest status (last item in shipment_status array)
-                shipment_status = result.get("shipment_status", [])
-                latest_status = shipment_status[-1] if shipment_status else {}
+            with metrics.stage(COURIER, "parse"):
+                tracking_result = self._parse_result(awb_number, response.json())
                 
-                # Create a dictionary with the tracking information
-                tracking_info = {
-                    "tracking_number": awb_number,
-                    "status": latest_status.get("external_status_desc", ""),
-                    "location": latest_status.get("service_center_name", ""),
-                    "date_time": latest_status.get("scan_date", ""),
-                    "status_txt": result  # Including the full details for reference
-                }
-                                
-                # Return the tracking information as a JSON string
-                return tracking_info
-
-            return {
+        except requests.Timeout as e:
+            metrics.record_response(COURIER, None)
+            tracking_result = utils.timeout_result(awb_number, utils.LookupTimeout("request", e))
+        except requests.RequestException as e:
+            if e.response is None:
+                metrics.record_response(COURIER, None)
+            tracking_result = {
                 "tracking_number": awb_number,
                 "status": "error",
-                "status_txt": f"Error extracting status: {data}"
+                "status_txt": f"Request failed: {str(e)}"
             }
+        finally:
+            record.finish(tracking_result)
+        return tracking_result
+
+    async def track_async(self, awb_number, client=None):
+        """
+        Track an EcomExpress shipment without blocking the event loop.
+        
+        Args:
+            awb_number: The AWB number to track
+            client: Optional shared httpx.AsyncClient
+            
+        Returns:
+            Dictionary with tracking information
+        """
+        import httpx
+
+        # Request payload
+        payload = {"awb_field": awb_number}
+        record = self._start_record(awb_number)
+        tracking_result = None
+        
+        try:
+            with metrics.stage(COURIER, "request"):
+                if client is None:
+                    async with utils.new_async_client() as client:
+                        response = await client.post(TRACKING_URL, json=payload)
+                else:
+                    response = await client.post(TRACKING_URL, json=payload)
+            metrics.record_response(COURIER, response)
+            record.add("tracking.json", response.content)
+            response.raise_for_status()
+            
+            with metrics.stage(COURIER, "parse"):
+                tracking_result = self._parse_result(awb_number, response.json())
                 
-        except requests.RequestException as e:
-            return {
+        except httpx.TimeoutException as e:
+            metrics.record_response(COURIER, None)
+            tracking_result = utils.timeout_result(awb_number, utils.LookupTimeout("request", e))
+        except httpx.HTTPError as e:
+            if not isinstance(e, httpx.HTTPStatusError):
+                metrics.record_response(COURIER, None)
+            tracking_result = {
                 "tracking_number": awb_number,
                 "status": "error",
                 "status_txt": f"Request failed: {str(e)}"
             }
-
+        except ValueError as e:
+            # Not JSON; requests raises a RequestException for this in track()
+            tracking_result = {
+                "tracking_number": awb_number,
+                "status": "error",
+                "status_txt": f"Request failed: {str(e)}"
+            }
+        finally:
+            record.finish(tracking_result)
+        return tracking_result
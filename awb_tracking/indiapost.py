@@ -1,99 +1,207 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import contextmanager
 import requests
-import os
-from bs4 import BeautifulSoup
 from urllib.parse import urljoin
-import re
 
+from . import artifacts
+from . import captcha_solver
+from . import document
+from . import metrics
 from . import ocr
+from . import presolve
+from . import transport
+from . import utils
 
-# Create a session object to maintain cookies and state
-session = requests.Session()
+logger = logging.getLogger(__name__)
+
+COURIER = "indiapost"
+
+TRACKING_URL = "https://www.indiapost.gov.in/_layouts/15/DOP.Portal.Tracking/TrackConsignment.aspx"
+
+CAPTCHA_QUESTION_ID = "ctl00_PlaceHolderMain_ucNewLegacyControl_ucCaptcha1_lblCaptcha"
+
+CAPTCHA_IMAGE_IDS = (
+    "ctl00_PlaceHolderMain_ucNewLegacyControl_ucCaptcha1_imgMathCaptcha",
+    "ctl00_PlaceHolderMain_ucNewLegacyControl_ucCaptcha1_imgCaptcha",
+)
+
+# Captcha preprocessing pipeline for the OCR engines, see preprocess.PIPELINE_SPECS
+PREPROCESS = "indiapost"
+
+# Seconds the page state of a session can be carried forward to the next
+# lookup; older state is reloaded (the server session times out when idle)
+CHAIN_TTL = 300.0
+
+class IndiaPostSession:
+    """
+    Context for India Post lookups on one HTTP session.
+    
+    The tracking page keeps the captcha and ASP.NET ViewState in the server
+    session, so the page fetch, captcha download and form submit of one
+    lookup must all use the same cookies. Each concurrent lookup therefore
+    needs its own IndiaPostSession.
+    """
+    
+    def __init__(self):
+        # Own cookies, connections from the shared transport pools
+        self.http = transport.get_transport().session()
+        # Last tracking page loaded on this session
+        self.content = None
+        # Number of lookups run on this session
+        self.uses = 0
+        # Debug artifacts of the lookup running on this session
+        self.artifacts = artifacts.NULL_RECORD
+        # Page state and captcha answer carried forward from the last lookup
+        self.chain = None
+
+    def close(self):
+        """Close the underlying HTTP session; pooled connections stay open for other sessions."""
+        self.http.close()
+
+class IndiaPostSessionPool:
+    """
+    Thread-safe pool of reusable IndiaPostSession objects.
+    
+    Sessions keep their cookies and keep-alive connections between lookups,
+    so a returned session is already warm for the next caller. At most
+    `max_size` sessions exist at once; further callers wait for a free one.
+    """
+    
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Take a session from the pool, creating one if the pool is not full.
+        Blocks while all sessions are in use.
+        
+        Returns:
+            IndiaPostSession: A session owned by the caller until release()
+        """
+        with self._cond:
+            while True:
+                # Prefer the most recently used session, it is the warmest
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.max_size:
+                    self._created += 1
+                    return IndiaPostSession()
+                self._cond.wait()
+
+    def release(self, session, discard=False):
+        """
+        Return a session to the pool.
+        
+        Args:
+            session (IndiaPostSession): The session to return
+            discard (bool): Close the session instead of reusing it, e.g.
+                            after a failed lookup left it in an unknown state
+        """
+        if discard:
+            session.close()
+        with self._cond:
+            if discard:
+                # Let a waiting caller create a replacement
+                self._created -= 1
+            else:
+                self._idle.append(session)
+            self._cond.notify()
+
+    @contextmanager
+    def session(self):
+        """
+        Context manager that acquires a session and releases it afterwards.
+        The session is discarded if the block raises.
+        """
+        session = self.acquire()
+        try:
+            yield session
+        except BaseException:
+            self.release(session, discard=True)
+            raise
+        else:
+            self.release(session)
+
+    def warm(self, count=None):
+        """
+        Pre-create sessions and load the tracking page on them, so the first
+        lookups do not pay for connection setup and session cookies.
+        
+        Args:
+            count (int, optional): Number of sessions to warm, defaults to max_size
+            
+        Returns:
+            int: Number of sessions that were warmed successfully
+        """
+        count = self.max_size if count is None else min(count, self.max_size)
+        sessions = []
+        warmed = 0
+        try:
+            for _ in range(count):
+                sessions.append(self.acquire())
+            for session in sessions:
+                try:
+                    if fetch_tracking_page(session):
+                        warmed += 1
+                except utils.LookupTimeout as e:
+                    logger.warning("Warming a session failed: %s", e)
+        finally:
+            # Every session goes back, also when warming is interrupted
+            for session in sessions:
+                self.release(session)
+        return warmed
+
+    def close(self):
+        """Close all idle sessions."""
+        with self._cond:
+            sessions, self._idle = self._idle, []
+            self._created -= len(sessions)
+        for session in sessions:
+            session.close()
 
 def captcha2answer(captcha_question, ocr_text):
     """
     Process the captcha question and OCR text to determine the correct answer.
     
+    OCR confusions are corrected and implausible answers are rejected, see
+    captcha_solver.solve().
+    
     :param captcha_question: The captcha question text
     :param ocr_text: The text extracted from the captcha image via OCR
-    :return: The answer to the captcha
+    :return: The answer to the captcha, or None if no plausible answer was found
     """
+    logger.debug("Processing captcha - Question: '%s', OCR Text: '%s'", captcha_question, ocr_text)
     try:
-        print(f"Processing captcha - Question: '{captcha_question}', OCR Text: '{ocr_text}'")
-        
-        # Case 1: Enter characters as displayed in image
-        if "Enter characters as displayed in image" in captcha_question:
-            return ocr_text.strip().lower()
-        
-        # Case 2: Evaluate the Expression
-        elif "Evaluate the Expression" in captcha_question:
-            # Clean up OCR text to make it evaluable
-            expression = ocr_text.strip()
-            expression = re.sub(r'=', '', expression)
-            # Replace common OCR mistakes
-            expression = expression.replace('x', '*')
-            expression = expression.replace('X', '*')
-            expression = expression.replace('×', '*')
-            expression = expression.replace('÷', '/')
-        
-            # Safely evaluate the expression
-            result = eval(expression)
-            return str(int(result))  # Convert to integer then string
-        
-        # Case 3: Enter the 1-5 number
-        elif "Enter the First number" in captcha_question:
-            return ocr_text[0]
-        elif "Enter the Second number" in captcha_question:
-            return ocr_text[1]
-        elif "Enter the Third number" in captcha_question:
-            return ocr_text[2]
-        elif "Enter the Fourth number" in captcha_question:
-            return ocr_text[3]
-        elif "Enter the Fifth number" in captcha_question:
-            return ocr_text[4]
-        
-        # Default case: Return the OCR text as is
-        else:
-            print(f"Unknown captcha question type: {captcha_question}")
-            return ocr_text
-            
-    except Exception as e:
-        print(f"Error processing captcha: {e}")
-        return ocr_text  # Return original text if any error occurs
+        return captcha_solver.solve(captcha_question, ocr_text)
+    except captcha_solver.CaptchaSolveError as e:
+        logger.info("Captcha answer rejected before submission: %s", e)
+        return None
 
 def get_html_value_by_id(html_content, element_id):
     """
     Extract the HTML value of an element with the specified ID from HTML content.
     
     Args:
-        html_content (bytes or str): The HTML content to parse
+        html_content (bytes, str or HtmlDocument): The HTML content or parsed document
         element_id (str): The ID of the element to find
         
     Returns:
         str: The inner HTML of the element if found, None otherwise
     """
-    try:
-        # Create a BeautifulSoup object to parse the HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Find the element with the specified ID
-        element = soup.find(id=element_id)
-        
-        # Return the inner HTML if element is found
-        if element:
-            return element.decode_contents()
-        else:
-            print(f"Element with ID '{element_id}' not found")
-            return None
-    except Exception as e:
-        print(f"Error parsing HTML: {e}")
-        return None
+    return utils.get_html_value_by_id(html_content, element_id)
 
 def get_img_src_by_id(html_content, img_id, base_url="https://www.indiapost.gov.in"):
     """
     Extract the 'src' attribute of an image element with the specified ID from HTML content.
     
     Args:
-        html_content (bytes or str): The HTML content to parse
+        html_content (bytes, str or HtmlDocument): The HTML content or parsed document
         img_id (str): The ID of the image element to find
         base_url (str): The base URL to create absolute URLs from relative paths
         
@@ -101,102 +209,117 @@ def get_img_src_by_id(html_content, img_id, base_url="https://www.indiapost.gov.
         str: The absolute 'src' attribute URL if found, None otherwise
     """
     try:
-        # Create a BeautifulSoup object to parse the HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Parse the HTML unless the caller already did
+        doc = document.parse(html_content)
         
-        # Find the image element with the specified ID
-        img_element = soup.find('img', id=img_id)
+        # Find the src attribute of the image element with the specified ID
+        src = doc.attr(img_id, 'src', tag='img')
         
         # Return the src attribute if the element is found
-        if img_element and img_element.has_attr('src'):
+        if src:
             # Convert relative URL to absolute URL
-            return urljoin(base_url, img_element['src'])
+            return urljoin(base_url, src)
         else:
-            print(f"Image with ID '{img_id}' not found or has no src attribute")
+            logger.debug("Image with ID '%s' not found or has no src attribute", img_id)
             return None
     except Exception as e:
-        print(f"Error parsing HTML: {e}")
+        logger.error("Error parsing HTML: %s", e)
         return None
 
-def get_captcha_img_url(html_content):
+def get_captcha_img_url(html_content, required=True):
     """
     Try to find the captcha image URL by checking multiple possible image IDs.
     
     Args:
-        html_content (bytes or str): The HTML content to parse
-        base_url (str): The base URL to create absolute URLs from relative paths
+        html_content (bytes, str or HtmlDocument): The HTML content or parsed document
+        required (bool): Log a warning when no captcha image is found
         
     Returns:
         str: The absolute URL of the captcha image if found, None otherwise
     """
-    captcha_image_ids = [
-        "ctl00_PlaceHolderMain_ucNewLegacyControl_ucCaptcha1_imgMathCaptcha",
-        "ctl00_PlaceHolderMain_ucNewLegacyControl_ucCaptcha1_imgCaptcha"
-    ]
-
-    base_url="https://www.indiapost.gov.in/_layouts/15/DOP.Portal.Tracking/TrackConsignment.aspx"
+    # Parse once and check every candidate ID against the same document
+    doc = document.parse(html_content)
     
-    for img_id in captcha_image_ids:
-        img_url = get_img_src_by_id(html_content, img_id, base_url)
+    for img_id in CAPTCHA_IMAGE_IDS:
+        img_url = get_img_src_by_id(doc, img_id, TRACKING_URL)
         if img_url:
             return img_url
     
-    print("No captcha image found with the specified IDs")
+    if required:
+        logger.warning("No captcha image found with the specified IDs")
     return None
 
-def fetch_image(url, output_path=None):
+def fetch_image(url, session, output_path=None, deadline=None):
     """
-    Fetch an image from a URL and save it to the specified path.
+    Fetch an image from a URL and return its raw bytes.
     
     Args:
         url (str): The URL of the image to fetch
-        output_path (str, optional): The path where to save the image.
-                                    If None, saves to 'out/captcha.jpg'
+        session (IndiaPostSession): The session the captcha belongs to
+        output_path (str, optional): If given, also save the image to this
+                                    path (useful for debugging only)
+        deadline (Deadline, optional): Time budget of the lookup
     
     Returns:
-        str: The path where the image was saved if successful, None otherwise
+        bytes: The image content if successful, None otherwise
+        
+    Raises:
+        LookupTimeout: If the request timed out or the budget is spent
     """
+    timeout = (deadline or utils.Deadline()).request_timeout("captcha_download")
     try:
-        print(f"Fetching image from {url}...")
-        # Use session instead of requests directly
-        response = session.get(url, stream=True)
+        logger.debug("Fetching image from %s", url)
+        # Use the lookup's session so the captcha matches its cookies
+        with metrics.stage(COURIER, "captcha_download"):
+            response = session.http.get(url, timeout=timeout)
+        metrics.record_response(COURIER, response)
         response.raise_for_status()
         
         # Check if the content is an image
         content_type = response.headers.get('Content-Type', '')
         if not any(img_type in content_type.lower() for img_type in ['jpeg', 'jpg', 'png', 'gif']):
-            print(f"Warning: URL might not be an image. Content-Type: {content_type}")
+            logger.warning("URL might not be an image. Content-Type: %s", content_type)
         
-        # Set default output path if not specified
-        output_path = os.path.join("out", "captcha.gif")
+        if output_path:
+            save_content(response.content, output_path)
         
-        # Save the image
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-        
-        print(f"Image successfully saved to {output_path}")
-        return output_path
+        return response.content
     
+    except requests.exceptions.Timeout as e:
+        metrics.record_response(COURIER, None)
+        raise utils.LookupTimeout("captcha_download", e) from e
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching image: {e}")
-        return None
-    except IOError as e:
-        print(f"Error saving image: {e}")
+        if e.response is None:
+            metrics.record_response(COURIER, None)
+        logger.error("Error fetching image: %s", e)
         return None
 
-def fetch_tracking_page():
-    """Fetch the India Post tracking page and return the content"""
-    url = "https://www.indiapost.gov.in/_layouts/15/DOP.Portal.Tracking/TrackConsignment.aspx"
+def fetch_tracking_page(session, deadline=None):
+    """
+    Fetch the India Post tracking page on the given session and return the content.
+    The content is also kept on the session as `session.content`.
+    
+    Raises:
+        LookupTimeout: If the request timed out or the deadline is spent
+    """
+    url = TRACKING_URL
+    timeout = (deadline or utils.Deadline()).request_timeout("page_fetch")
     try:
-        print(f"Fetching data from {url}...")
-        # Use session instead of requests directly
-        response = session.get(url)
+        logger.debug("Fetching data from %s", url)
+        with metrics.stage(COURIER, "page_fetch"):
+            response = session.http.get(url, timeout=timeout)
+        metrics.record_response(COURIER, response)
         response.raise_for_status()
+        session.content = response.content
+        session.artifacts.add("page.html", response.content)
         return response.content
+    except requests.exceptions.Timeout as e:
+        metrics.record_response(COURIER, None)
+        raise utils.LookupTimeout("page_fetch", e) from e
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching data: {e}")
+        if e.response is None:
+            metrics.record_response(COURIER, None)
+        logger.error("Error fetching data: %s", e)
         return None
 
 def save_content(content, filename):
@@ -204,10 +327,10 @@ def save_content(content, filename):
     try:
         with open(filename, "wb") as f:
             f.write(content)
-        print(f"Data successfully saved to {filename}")
+        logger.debug("Data successfully saved to %s", filename)
         return True
     except IOError as e:
-        print(f"Error saving file: {e}")
+        logger.error("Error saving file: %s", e)
         return False
 
 def extract_form_fields(html_content):
@@ -215,64 +338,47 @@ def extract_form_fields(html_content):
     Extract all form fields that need to be submitted, including hidden fields
     
     Args:
-        html_content: HTML content of the page
+        html_content: HTML content of the page or its parsed HtmlDocument
         
     Returns:
         dict: Dictionary of form field names and values
     """
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        form_data = {}
-        
-        # Extract all input fields
-        for input_tag in soup.find_all('input'):
-            # Skip the submit button
-            if input_tag.get('type') == 'submit':
-                continue
-                
-            name = input_tag.get('name')
-            value = input_tag.get('value', '')
-            
-            if name:
-                form_data[name] = value
-                
-        # Extract all select fields
-        for select_tag in soup.find_all('select'):
-            name = select_tag.get('name')
-            if name:
-                # Find the selected option
-                selected_option = select_tag.find('option', selected=True)
-                if selected_option:
-                    form_data[name] = selected_option.get('value', '')
-                else:
-                    # If no option is selected, use the first one
-                    first_option = select_tag.find('option')
-                    if first_option:
-                        form_data[name] = first_option.get('value', '')
-                        
-        return form_data
+        return document.parse(html_content).form_fields()
     except Exception as e:
-        print(f"Error extracting form fields: {e}")
+        logger.error("Error extracting form fields: %s", e)
         return {}
 
-def submit_tracking_form(tracking_number, captcha_answer, html_content):
+def submit_tracking_form(tracking_number, captcha_answer, html_content, session, deadline=None, form_fields=None):
     """
     Submit the tracking form with the tracking number and captcha text
     
     Args:
         tracking_number: The tracking/article number to search
-        captcha_text: The text extracted from the captcha
-        html_content: The original HTML content containing the form
+        captcha_answer: The answer to the captcha question
+        html_content: The original HTML content (or parsed HtmlDocument) containing the form
+        session (IndiaPostSession): The session the form was loaded on
+        deadline (Deadline, optional): Time budget of the lookup
+        form_fields (dict, optional): Current form fields, e.g. carried forward
+                                      by apply_delta(); html_content is not
+                                      parsed when given
         
     Returns:
         str: HTML content of the response page or None if submission failed
+        
+    Raises:
+        LookupTimeout: If the request timed out or the deadline is spent
     """
+    timeout = (deadline or utils.Deadline()).request_timeout("submit")
     try:
         # URL for form submission
-        url = "https://www.indiapost.gov.in/_layouts/15/DOP.Portal.Tracking/TrackConsignment.aspx"
+        url = TRACKING_URL
         
         # Extract all existing form fields including hidden ones
-        form_data = extract_form_fields(html_content)
+        if form_fields is not None:
+            form_data = dict(form_fields)
+        else:
+            form_data = extract_form_fields(html_content)
         
         # Set form-specific fields - using correct field names
         form_data['ctl00$PlaceHolderMain$ucNewLegacyControl$txtOrignlPgTranNo'] = tracking_number
@@ -303,7 +409,7 @@ def submit_tracking_form(tracking_number, captcha_answer, html_content):
         form_data['__EVENTARGUMENT'] = ''
         
         # Print form data for debugging
-        print(f"Submitting form with tracking number: {tracking_number} and captcha: {captcha_answer}")
+        logger.debug("Submitting form with tracking number: %s and captcha: %s", tracking_number, captcha_answer)
         
         # Set appropriate headers for form submission
         headers = {
@@ -329,43 +435,135 @@ def submit_tracking_form(tracking_number, captcha_answer, html_content):
         '''
 
         # Submit the form
-        print(f"Submitting form")
-        response = session.post(url, data=form_data, headers=headers)
+        with metrics.stage(COURIER, "submit"):
+            response = session.http.post(url, data=form_data, headers=headers, timeout=timeout)
+        metrics.record_response(COURIER, response)
         response.raise_for_status()
         
         # Check if response contains tracking results
         if "No Records Found" in response.text:
-            print("No tracking records found for the given number")
+            logger.info("No tracking records found for %s", tracking_number)
         elif "Invalid Captcha" in response.text:
-            print("Invalid captcha entered")
+            logger.info("Invalid captcha entered for %s", tracking_number)
         else:
-            print("Form submitted successfully")
+            logger.debug("Form submitted successfully")
             
-        # Save the response
-        save_content(response.content, os.path.join("out", "indiapost_tracking_result.html"))
+        # Keep the response for debugging, see artifacts
+        session.artifacts.add("result.html", response.content)
         
         return response.content
+    except requests.exceptions.Timeout as e:
+        metrics.record_response(COURIER, None)
+        raise utils.LookupTimeout("submit", e) from e
     except Exception as e:
-        print(f"Error submitting form: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error submitting form: %s", e)
         return None
 
-def details_tables_to_json(content):
-    print(f"Parsing details table from content...")
+def parse_delta(content):
+    """
+    Parse an ASP.NET AJAX async postback ("delta") response.
+    
+    The response is a sequence of "length|type|id|content|" records, e.g.
+    "updatePanel" records with the new HTML of an update panel and
+    "hiddenField" records with the new __VIEWSTATE, __EVENTVALIDATION...
+    
+    Args:
+        content (bytes or str): The response of submit_tracking_form
+        
+    Returns:
+        list: (type, id, content) tuples
+        
+    Raises:
+        ValueError: If the content is not a delta response
+    """
+    text = content.decode("utf-8", errors="replace") if isinstance(content, bytes) else content
+    records = []
+    pos = 0
+    while pos < len(text):
+        length_end = text.index("|", pos)
+        length = int(text[pos:length_end])
+        type_end = text.index("|", length_end + 1)
+        id_end = text.index("|", type_end + 1)
+        start = id_end + 1
+        end = start + length
+        if end >= len(text) or text[end] != "|":
+            raise ValueError(f"Malformed delta record at offset {pos}")
+        records.append((text[length_end + 1:type_end], text[type_end + 1:id_end], text[start:end]))
+        pos = end + 1
+    return records
+
+def apply_delta(prepared, content):
+    """
+    Carry the page state of a prepared session forward from a submit response,
+    so the next lookup can submit again without reloading the page.
+    
+    Hidden fields (ViewState, event validation...) and any inputs of updated
+    panels replace the form fields. If an updated panel shows a different
+    captcha question or image, the captcha answer is dropped, so the next
+    submit solves the new captcha first.
+    
+    Args:
+        prepared (PreparedCaptcha): State from prepare_captcha()
+        content (bytes or str): The response of submit_tracking_form
+        
+    Returns:
+        bool: True if the response carried fresh page state; False if the
+              state cannot be carried forward (not a delta, server error
+              or redirect, e.g. on session expiry)
+    """
     try:
-        detail_soup = BeautifulSoup(content, 'html.parser')
-        table_rows = detail_soup.find_all('tr')
+        records = parse_delta(content)
+    except ValueError:
+        return False
+    
+    fields = prepared.state["fields"]
+    updated = {}
+    fresh = False
+    for kind, key, value in records:
+        if kind in ("error", "pageRedirect"):
+            logger.debug("Delta response %s: %s", kind, value[:200])
+            return False
+        if kind == "hiddenField":
+            updated[key] = value
+            fresh = fresh or key == "__VIEWSTATE"
+        elif kind == "updatePanel":
+            panel = document.parse(value)
+            updated.update(panel.form_fields())
+            question = get_html_value_by_id(panel, CAPTCHA_QUESTION_ID)
+            img_url = get_captcha_img_url(panel, required=False)
+            if question and question != prepared.state["question"]:
+                prepared.state["question"] = question
+                prepared.answer = None
+            if img_url and img_url != prepared.state["img_url"]:
+                prepared.state["img_url"] = img_url
+                prepared.answer = None
+    if not fresh:
+        return False
+    
+    fields.update(updated)
+    prepared.created = time.monotonic()
+    return True
 
+def details_tables_to_json(table_rows):
+    """
+    Convert the article details table rows into the tracking details dictionary.
+    
+    Args:
+        table_rows (list): Rows of cell texts, see HtmlDocument.table_rows()
+        
+    Returns:
+        dict: Booking and delivery details, or None on error
+    """
+    logger.debug("Parsing details table from content")
+    try:
         result = {}  # Change this from list to dictionary
         
         if len(table_rows) > 1:  # Ensure we have header and data rows
-            # Get column headers (from first row th elements)
-            headers = [th.get_text().strip() for th in table_rows[0].find_all('th')]
+            # Get column headers (from first row)
+            headers = table_rows[0]
             
             # Get data from second row (first data row)
-            data_cells = table_rows[1].find_all('td')
-            data_values = [td.get_text().strip() for td in data_cells]
+            data_values = table_rows[1]
             
             # Create dictionary from headers and values
             detail_dict = dict(zip(headers, data_values))
@@ -397,7 +595,7 @@ def details_tables_to_json(content):
             
         return result  # Add a return statement
     except Exception as e:
-        print(f"Error parsing detail table: {e}")
+        logger.error("Error parsing detail table: %s", e)
         return None  # Return None on error
 
 def get_delivery_status(content, tracking_number):
@@ -405,29 +603,33 @@ def get_delivery_status(content, tracking_number):
     Extract delivery status from the tracking results HTML content.
     
     Args:
-        content (bytes or str): The HTML content of the tracking results page
+        content (bytes, str or HtmlDocument): The HTML content of the tracking results page
         tracking_number (str): The tracking number being tracked
         
     Returns:
         dict: JSON-like dictionary with tracking number, status, and complete status text
     """
     try:
+        # Parse the result page once for all lookups below
+        doc = document.parse(content)
+        
         # ID of the status element
         status_element_id = "ctl00_PlaceHolderMain_ucNewLegacyControl_lblMailArticleCurrentStatusOER"
-        delivery_status = get_html_value_by_id(content, status_element_id)
+        delivery_status = get_html_value_by_id(doc, status_element_id)
         
         # If status element was not found or is empty
         if not delivery_status:
-            print("Status information not found in the response")
+            logger.warning("Status information not found in the response")
             return {
                 "tracking_number": tracking_number,
                 "status": "unknown",
                 "status_txt": "Status information not available"
             }
 
-        # ID of the status element
+        # ID of the details table
         detail_table_id = "ctl00_PlaceHolderMain_ucNewLegacyControl_gvTrckMailArticleDtlsOER"
-        detail_table = get_html_value_by_id(content, detail_table_id)
+        details_table_json = None
+        detail_table = doc.table_rows(detail_table_id)
         if detail_table:
             details_table_json = details_tables_to_json(detail_table)
             #print(f"Details Table JSON: {details_table_json}")
@@ -463,7 +665,7 @@ def get_delivery_status(content, tracking_number):
         return tracking_info
     
     except Exception as e:
-        print(f"Error extracting delivery status: {e}")
+        logger.error("Error extracting delivery status: %s", e)
         return {
             "tracking_number": tracking_number,
             "status": "error",
@@ -471,68 +673,446 @@ def get_delivery_status(content, tracking_number):
         }
     
 #################################################
-def track_consignment(tracking_number):
+def is_invalid_captcha(content):
+    """
+    Check whether a form submission response says the captcha was rejected.
+    
+    Args:
+        content (bytes or str): The response content of submit_tracking_form
+        
+    Returns:
+        bool: True if India Post rejected the captcha answer
+    """
+    if not content:
+        return False
+    if isinstance(content, bytes):
+        return b"Invalid Captcha" in content
+    return "Invalid Captcha" in content
+
+def solve_captcha(captcha_question, captcha_img_url, session, ocr_engine="easyocr", preprocess=PREPROCESS, deadline=None):
+    """
+    Download a fresh captcha image on the session and answer the captcha question.
+    
+    Requesting the image again makes the server generate a new captcha for the
+    session, so the already-loaded page and its form fields stay usable.
+    
+    Args:
+        captcha_question: The captcha question text from the page
+        captcha_img_url: The captcha image URL from the page
+        session (IndiaPostSession): The session the page was loaded on
+        ocr_engine: OCR engine to use ('easyocr' or 'tesseract')
+        preprocess: Preprocessing pipeline name, None for the engine default;
+                    captcha models skip the India Post pipeline, they apply
+                    the one they were trained with
+        deadline (Deadline, optional): Time budget of the lookup
+        
+    Returns:
+        str: The captcha answer, or None if the captcha could not be solved
+             or the answer is implausible
+        
+    Raises:
+        LookupTimeout: If a step timed out or the deadline is spent
+    """
+    deadline = deadline or utils.Deadline()
+    # The captcha model applies the pipeline it was trained with
+    if preprocess == PREPROCESS and ocr_engine.lower().startswith("model"):
+        preprocess = None
+    
+    # Download the captcha image (kept in memory)
+    captcha_image = fetch_image(captcha_img_url, session, deadline=deadline)
+    if not captcha_image:
+        return None
+    
+    # Process the captcha; OCR in this thread cannot be interrupted, so the
+    # budget is checked before and after it
+    remaining = deadline.check("ocr")
+    try:
+        with metrics.stage(COURIER, "ocr"):
+            captcha_text = ocr.ocr_processor(captcha_image, ocr=ocr_engine, debug=False, preprocess=preprocess,
+                                             timeout=remaining)
+    except TimeoutError as e:
+        raise utils.LookupTimeout("ocr", "OCR worker did not answer in time") from e
+    deadline.check("ocr")
+    if not captcha_text:
+        return None
+    
+    captcha_answer = captcha2answer(captcha_question, captcha_text)
+    logger.debug("Captcha Answer: %s", captcha_answer)
+    return captcha_answer
+
+def track_consignment(tracking_number, session=None, max_captcha_attempts=3, ocr_engines=("easyocr",), stats=None,
+                      preprocess=PREPROCESS, artifact_sink=None, deadline=None, prepared=None):
     """
     Main function to track a consignment using the tracking number
     
+    Rejected or unreadable captchas are retried on the same page: only the
+    captcha image is fetched again, re-solved and the form resubmitted.
+    Implausible answers are retried without submitting the form at all.
+    
+    Every step (page fetch, captcha download, OCR, submit) runs within the
+    deadline; when it runs out the lookup stops with a "timeout" result.
+    
     Args:
         tracking_number: The tracking/article number to search
+        session (IndiaPostSession, optional): Session to run the lookup on;
+                                              a fresh one is used if omitted
+        max_captcha_attempts (int): Maximum number of captchas to solve
+        ocr_engines (tuple): OCR engines to cycle through on successive attempts,
+                             e.g. ("easyocr", "tesseract")
+        stats (CaptchaStats, optional): Counters updated with the captcha attempts
+        preprocess (str, optional): Captcha preprocessing pipeline, the India Post
+                                    one by default; None uses the OCR engine
+                                    default, "none" disables preprocessing
+        artifact_sink (ArtifactSink, optional): Where the raw pages of the lookup
+                                                go; defaults to artifacts.get_sink()
+        deadline (Deadline, optional): Time budget of the lookup; without one
+                                       only the per-request timeouts apply
+        prepared (PreparedCaptcha, optional): Page state and solved captcha from
+                                              prepare_captcha() on this session, or
+                                              carried forward from the previous
+                                              lookup (session.chain); the lookup
+                                              then starts at the submit, and
+                                              reloads the page if the site
+                                              does not take carried-forward state
         
     Returns:
-        str: HTML content of the result page or None if tracking failed
+        dict: Tracking information including "captcha_attempts", or None if
+              the tracking page could not be loaded
     """
+    deadline = deadline or utils.Deadline()
+    if session is None:
+        session = IndiaPostSession()
+    session.uses += 1
 
-    output_dir = "out"
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    sink = artifact_sink or artifacts.get_sink()
+    session.artifacts = sink.start(COURIER, tracking_number)
+    tracking_result = None
+    try:
+        tracking_result = _track_consignment(tracking_number, session, max_captcha_attempts,
+                                             ocr_engines, stats, preprocess, deadline, prepared)
+        return tracking_result
+    except utils.LookupTimeout as e:
+        logger.warning("Lookup of %s stopped: %s", tracking_number, e)
+        tracking_result = utils.timeout_result(tracking_number, e)
+        return tracking_result
+    finally:
+        session.artifacts.finish(tracking_result)
+        session.artifacts = artifacts.NULL_RECORD
 
+def prepare_captcha(session, max_captcha_attempts=3, ocr_engines=("easyocr",), preprocess=PREPROCESS, deadline=None):
+    """
+    Load the tracking page on a session and solve its captcha: every step of
+    a lookup that does not depend on the tracking number.
+    
+    Args:
+        session (IndiaPostSession): The session to prepare
+        max_captcha_attempts (int): Maximum number of captchas to solve
+        ocr_engines (tuple): OCR engines to cycle through on successive attempts
+        preprocess (str, optional): Captcha preprocessing pipeline
+        deadline (Deadline, optional): Time budget for the preparation
+        
+    Returns:
+        PreparedCaptcha: With the page, its form fields, captcha question and
+                         image URL as state; its answer is None if no captcha
+                         could be solved. None if the page could not be loaded.
+        
+    Raises:
+        LookupTimeout: If a step timed out or the deadline is spent
+    """
     # Fetch the tracking page
-    content = fetch_tracking_page()
+    content = fetch_tracking_page(session, deadline)
     if not content:
         return None
     
+    # Parse the page once; every helper below queries the same document
+    page = document.parse(content)
+    
     # Extract the captcha question
-    captcha_question_id = "ctl00_PlaceHolderMain_ucNewLegacyControl_ucCaptcha1_lblCaptcha"
-    captcha_question = get_html_value_by_id(content, captcha_question_id)
+    captcha_question = get_html_value_by_id(page, CAPTCHA_QUESTION_ID)
     if not captcha_question:
-        print("Captcha question not found, ID: {captcha_question_id}")
+        logger.warning("Captcha question not found, ID: %s", CAPTCHA_QUESTION_ID)
         return None
     else:
-        print(f"Captcha Question: {captcha_question}")
+        logger.debug("Captcha Question: %s", captcha_question)
     
     # Extract the captcha image URL
-    captcha_img_url = get_captcha_img_url(content)
+    captcha_img_url = get_captcha_img_url(page)
     if not captcha_img_url:
         return None
     
-    # Download the captcha image
-    captcha_img_path = fetch_image(captcha_img_url)
-    if not captcha_img_path:
-        return None
-    
-    # Process the captcha
-    captcha_img_path = 'out/captcha.gif'
-    captcha_text = ocr.ocr_processor(captcha_img_path)
-    if not captcha_text:
-        return None
+    prepared = presolve.PreparedCaptcha(session, content=content, fields=extract_form_fields(page),
+                                        question=captcha_question, img_url=captcha_img_url)
+    resolve_captcha(prepared, max_captcha_attempts, ocr_engines, preprocess, deadline)
+    return prepared
+
+def resolve_captcha(prepared, max_captcha_attempts, ocr_engines, preprocess=PREPROCESS, deadline=None):
+    """
+    Solve fresh captchas on a prepared session until one gives a plausible
+    answer or `max_captcha_attempts` is reached.
     
-    captcha_answer = captcha2answer(captcha_question, captcha_text)
-    print(f"Captcha Answer: {captcha_answer}")
+    Returns:
+        str: The new answer, also set as prepared.answer; None if none was found
+    """
+    prepared.answer = None
+    while prepared.attempts < max_captcha_attempts:
+        ocr_engine = ocr_engines[prepared.attempts % len(ocr_engines)]
+        prepared.attempts += 1
+        
+        prepared.answer = solve_captcha(prepared.state["question"], prepared.state["img_url"],
+                                        prepared.session, ocr_engine, preprocess, deadline)
+        if prepared.answer:
+            break
+        # Nothing worth submitting, try a fresh captcha image
+        prepared.discarded += 1
+    return prepared.answer
 
-    # Submit the form with the tracking number and captcha
-    content = submit_tracking_form(tracking_number, captcha_answer, content)
+def _submit_captcha(tracking_number, session, prepared, max_captcha_attempts, ocr_engines, preprocess, deadline):
+    """
+    Submit the form on a prepared session until the site accepts a captcha or
+    `max_captcha_attempts` captchas are solved.
+    
+    An answer on `prepared` without any attempts counted was carried forward
+    from an earlier lookup; it is submitted as is.
+    
+    Returns:
+        tuple: (content, accepted, chainable, reused): the last response,
+               whether its captcha was accepted, whether it carried fresh page
+               state (see apply_delta) and whether the answer it was submitted
+               with was carried forward
+    """
+    reused = bool(prepared.answer) and prepared.attempts == 0
+    accepted = False
+    chainable = False
+    content = None
+    while True:
+        if not prepared.answer:
+            # No answer yet, or the site showed a new captcha
+            reused = False
+            if not resolve_captcha(prepared, max_captcha_attempts, ocr_engines, preprocess, deadline):
+                break
+        
+        # Submit the form with the tracking number and captcha
+        content = submit_tracking_form(tracking_number, prepared.answer, None, session, deadline,
+                                       form_fields=prepared.state["fields"])
+        if content is None:
+            break
+        # Keep ViewState and hidden fields current for the next submit
+        chainable = apply_delta(prepared, content)
+        if not is_invalid_captcha(content):
+            accepted = True
+            break
+        
+        logger.info("Captcha rejected (attempt %d of %d)", prepared.attempts, max_captcha_attempts)
+        prepared.answer = None
+    return content, accepted, chainable, reused
 
-    tracking_result = get_delivery_status(content, tracking_number)
+def _track_consignment(tracking_number, session, max_captcha_attempts, ocr_engines, stats, preprocess, deadline,
+                       prepared=None):
+    """Run the lookup steps of track_consignment() on a session."""
 
+    session.chain = None
+    # State carried forward from an earlier lookup no longer has its page
+    carried = prepared is not None and "content" not in prepared.state
+    if carried:
+        # Captchas are counted per lookup, the answer was solved for an earlier one
+        prepared.attempts = prepared.discarded = 0
+    elif prepared is None:
+        prepared = prepare_captcha(session, max_captcha_attempts, ocr_engines, preprocess, deadline)
+        if prepared is None:
+            return None
+    else:
+        # Loaded in the background, keep it with this lookup's artifacts
+        session.artifacts.add("page.html", prepared.state["content"])
+    # The page itself is only needed once, later lookups use the form fields
+    prepared.state.pop("content", None)
+    
+    # Captchas solved on carried-forward state that had to be reloaded
+    attempts = discarded = 0
+    try:
+        content, accepted, chainable, reused = _submit_captcha(tracking_number, session, prepared,
+                                                               max_captcha_attempts, ocr_engines, preprocess,
+                                                               deadline)
+        if carried and not chainable:
+            # The site did not take the carried-forward state (e.g. its
+            # session expired), start over from a fresh page
+            logger.debug("Page state of the session not accepted, reloading for %s", tracking_number)
+            attempts, discarded = prepared.attempts, prepared.discarded
+            prepared = prepare_captcha(session, max_captcha_attempts, ocr_engines, preprocess, deadline)
+            if prepared is not None:
+                prepared.state.pop("content", None)
+                content, accepted, chainable, reused = _submit_captcha(tracking_number, session, prepared,
+                                                                       max_captcha_attempts, ocr_engines,
+                                                                       preprocess, deadline)
+    except utils.LookupTimeout:
+        if stats is not None:
+            if prepared is not None:
+                attempts, discarded = attempts + prepared.attempts, discarded + prepared.discarded
+            stats.record(attempts, False, discarded)
+        raise
+    
+    if prepared is None:
+        if stats is not None:
+            stats.record(attempts, False, discarded)
+        return None
+    attempts += prepared.attempts
+    if stats is not None:
+        stats.record(attempts, accepted, discarded + prepared.discarded, chained=reused)
+    
+    if accepted:
+        with metrics.stage(COURIER, "parse"):
+            tracking_result = get_delivery_status(content, tracking_number)
+    elif is_invalid_captcha(content):
+        tracking_result = {
+            "tracking_number": tracking_number,
+            "status": "error",
+            "status_txt": f"Captcha rejected after {attempts} attempts"
+        }
+    else:
+        tracking_result = {
+            "tracking_number": tracking_number,
+            "status": "error",
+            "status_txt": "Failed to solve or submit captcha"
+        }
+    
+    tracking_result["captcha_attempts"] = attempts
+    if accepted and chainable:
+        # The next lookup on this session can start at the submit
+        session.chain = prepared
     return tracking_result
 
 class IndiaPostTracker:
     """
     Tracker implementation for India Post courier service.
+    
+    Each lookup runs on its own IndiaPostSession taken from a pool, so
+    concurrent lookups never share cookies or ViewState. Each lookup has a
+    time budget of `timeout` seconds across all of its steps.
+    
+    Lookups are chained on pooled sessions: the page state (ViewState and
+    hidden fields) of each async postback response and its captcha answer
+    are carried forward, so the next lookup on the session submits right
+    away. The page is reloaded when the state is older than `chain_ttl`
+    seconds (0 disables chaining) or the site does not accept it, and the
+    captcha is re-solved only when the site shows a new one or rejects it.
+    
+    With `presolve_size` > 0, background threads keep that many pooled sessions
+    with a loaded page and solved captcha ready (see presolve.PresolvePool),
+    so a lookup only submits the form. Ready captchas older than
+    `presolve_ttl` seconds are discarded. Pre-solved sessions count against
+    `pool_size`.
     """
     
+    def __init__(self, pool_size=8, max_captcha_attempts=3, ocr_engines=("easyocr",), preprocess=PREPROCESS,
+                 artifact_sink=None, timeout=utils.DEFAULT_LOOKUP_TIMEOUT, presolve_size=0, presolve_ttl=120.0,
+                 chain_ttl=CHAIN_TTL):
+        self.pool = IndiaPostSessionPool(max_size=pool_size)
+        self.max_captcha_attempts = max_captcha_attempts
+        self.ocr_engines = tuple(ocr_engines)
+        self.preprocess = preprocess
+        self.artifact_sink = artifact_sink
+        self.captcha_stats = utils.CaptchaStats(COURIER)
+        self.timeout = timeout
+        self.chain_ttl = chain_ttl
+        self.presolver = None
+        if presolve_size:
+            self.presolver = presolve.PresolvePool(COURIER, self._presolve, self._discard_presolved,
+                                                   size=min(presolve_size, pool_size), ttl=presolve_ttl)
+    
+    def _presolve(self):
+        """Prepare a pooled session in the background, see prepare_captcha()."""
+        session = self.pool.acquire()
+        try:
+            prepared = prepare_captcha(session, self.max_captcha_attempts, self.ocr_engines, self.preprocess,
+                                       utils.Deadline(self.timeout))
+        except BaseException:
+            self.pool.release(session, discard=True)
+            raise
+        if prepared is None or not prepared.answer:
+            self.pool.release(session, discard=True)
+            return None
+        return prepared
+    
+    def _discard_presolved(self, prepared):
+        # The captcha expired, the session itself is still good
+        self.pool.release(prepared.session)
+    
+    def _chained(self, session):
+        """Return the page state carried forward on a session, or None if there is none or it is stale."""
+        prepared, session.chain = session.chain, None
+        if prepared is None or prepared.age() > self.chain_ttl:
+            return None
+        return prepared
+    
+    def _track_on(self, session, awb_number, prepared=None):
+        """Run one lookup on a session, continuing its chain when there is one."""
+        if prepared is None:
+            prepared = self._chained(session)
+        return track_consignment(awb_number, session,
+                                 max_captcha_attempts=self.max_captcha_attempts,
+                                 ocr_engines=self.ocr_engines,
+                                 stats=self.captcha_stats,
+                                 preprocess=self.preprocess,
+                                 artifact_sink=self.artifact_sink,
+                                 deadline=utils.Deadline(self.timeout),
+                                 prepared=prepared)
+    
     def track(self, awb_number):
-        # Call the track_consignment function to get real tracking data
-        tracking_result = track_consignment(awb_number)
+        prepared = None
+        if self.presolver is not None:
+            prepared = self.presolver.start().take()
+        # Call the track_consignment function on a pooled (or pre-solved) session
+        session = prepared.session if prepared is not None else self.pool.acquire()
+        tracking_result = None
+        try:
+            tracking_result = self._track_on(session, awb_number, prepared)
+        finally:
+            # Failed lookups may leave the session mid-flow, start fresh next time
+            failed = tracking_result is None or tracking_result.get("status") in ("error", "timeout")
+            self.pool.release(session, discard=failed)
         return tracking_result
+    
+    def track_batch(self, awb_numbers):
+        """
+        Track several shipments one after another on one session.
+        
+        The page is loaded and a captcha solved once; every following lookup
+        submits with the page state carried forward from the previous
+        response, see the class documentation.
+        
+        Args:
+            awb_numbers (iterable): The tracking numbers
+            
+        Returns:
+            list: Tracking results in the order of awb_numbers
+        """
+        results = []
+        session = self.pool.acquire()
+        try:
+            for awb_number in awb_numbers:
+                tracking_result = self._track_on(session, awb_number)
+                results.append(tracking_result)
+                if tracking_result is None or tracking_result.get("status") in ("error", "timeout"):
+                    # Continue on a clean session
+                    failed, session = session, None
+                    self.pool.release(failed, discard=True)
+                    session = self.pool.acquire()
+        finally:
+            if session is not None:
+                self.pool.release(session)
+        return results
 
+    async def track_async(self, awb_number, client=None):
+        """
+        Track an India Post shipment without blocking the event loop.
+        
+        The lookup is a multi-step captcha flow whose OCR step is CPU-bound,
+        so the whole flow runs in the default thread pool executor.
+        
+        Args:
+            awb_number: The tracking number
+            client: Accepted for interface compatibility; not used
+            
+        Returns:
+            Dictionary with tracking information
+        """
+        return await asyncio.to_thread(self.track, awb_number)
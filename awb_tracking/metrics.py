@@ -0,0 +1,290 @@
+"""
+In-process metrics for tracking lookups.
+
+Every tracker records into the process-wide REGISTRY:
+
+    awb_lookups_total{courier, outcome}           lookups by result class
+    awb_lookup_seconds{courier}                    end-to-end lookup latency
+    awb_stage_seconds{courier, stage}              latency per lookup step
+                                                   (page_fetch, captcha_download,
+                                                   ocr, submit, request, parse...)
+    awb_captcha_attempts_total{courier, outcome}   accepted, rejected, discarded
+    awb_http_responses_total{courier, code}        HTTP status codes ("error"
+                                                   when no response arrived)
+    awb_cache_requests_total{result}               result cache hits and misses
+
+Read them in-process with REGISTRY.snapshot(), render them with an
+exporter (render("prometheus") or render("json"), or your own registered
+with register_exporter()), or serve them over HTTP for Prometheus:
+
+    from awb_tracking import metrics
+    metrics.serve(9108)   # GET /metrics, /metrics/json
+"""
+import bisect
+import json
+import threading
+import time
+
+from . import utils
+
+# Latency buckets in seconds, from a cached API call to a slow captcha flow
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class _Metric:
+    """Base class for metrics with labelled series."""
+
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def series(self):
+        """Return [(labels dict, value)] for every labelled series."""
+        with self._lock:
+            items = list(self._series.items())
+        return [(dict(zip(self.labelnames, key)), self._value(value)) for key, value in items]
+
+    def _value(self, value):
+        return value
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+class Histogram(_Metric):
+    """
+    A distribution of observed values (e.g. latencies) in cumulative buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def time(self, **labels):
+        """Context manager observing the seconds spent in its block."""
+        return _Timer(self, labels)
+
+    def _value(self, value):
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), value["counts"]):
+            total += count
+            cumulative.append((bound, total))
+        return {"buckets": cumulative, "sum": value["sum"], "count": value["count"]}
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+class Registry:
+    """
+    A set of named metrics.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        """Return the counter with this name, creating it on first use."""
+        return self._get_or_create(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Return the histogram with this name, creating it on first use."""
+        return self._get_or_create(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def metrics(self):
+        """Return all registered metrics."""
+        with self._lock:
+            return list(self._metrics.values())
+
+    def snapshot(self):
+        """
+        Return every metric as plain data.
+
+        Returns:
+            dict: {name: {"type", "help", "series": [{"labels", "value"}]}}
+        """
+        return {
+            metric.name: {
+                "type": metric.kind,
+                "help": metric.help,
+                "series": [{"labels": labels, "value": value} for labels, value in metric.series()],
+            }
+            for metric in self.metrics()
+        }
+
+REGISTRY = Registry()
+
+LOOKUPS = REGISTRY.counter("awb_lookups_total", "Tracking lookups by outcome", ("courier", "outcome"))
+LOOKUP_SECONDS = REGISTRY.histogram("awb_lookup_seconds", "End-to-end lookup latency", ("courier",))
+STAGE_SECONDS = REGISTRY.histogram("awb_stage_seconds", "Latency of each lookup step", ("courier", "stage"))
+CAPTCHA_ATTEMPTS = REGISTRY.counter("awb_captcha_attempts_total", "Captcha attempts by outcome", ("courier", "outcome"))
+HTTP_RESPONSES = REGISTRY.counter("awb_http_responses_total", "Courier HTTP responses by status code", ("courier", "code"))
+CACHE_REQUESTS = REGISTRY.counter("awb_cache_requests_total", "Result cache lookups", ("result",))
+
+def stage(courier, name):
+    """
+    Time one step of a lookup:
+
+        with metrics.stage("indiapost", "ocr"):
+            text = ocr.ocr_processor(image)
+    """
+    return STAGE_SECONDS.time(courier=courier, stage=name)
+
+def outcome(result):
+    """Return the outcome label of a tracking result: terminal, active or the error status."""
+    if not isinstance(result, dict):
+        return "error"
+    status = str(result.get("status") or "").strip().lower()
+    if not status or status in utils.ERROR_STATUSES:
+        return status or "error"
+    return "terminal" if utils.is_terminal_status(status) else "active"
+
+def record_lookup(courier, result, seconds):
+    """Record one finished lookup."""
+    LOOKUPS.inc(courier=courier, outcome=outcome(result))
+    LOOKUP_SECONDS.observe(seconds, courier=courier)
+
+def record_response(courier, response):
+    """Count an HTTP response by status code; None counts as "error"."""
+    code = getattr(response, "status_code", None)
+    HTTP_RESPONSES.inc(courier=courier, code=code if code is not None else "error")
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels, extra=None):
+    items = list(labels.items()) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def render_prometheus(registry=None):
+    """Render a registry in the Prometheus text exposition format."""
+    lines = []
+    for metric in (registry or REGISTRY).metrics():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in metric.series():
+            if metric.kind == "histogram":
+                for bound, count in value["buckets"]:
+                    lines.append(f"{metric.name}_bucket{_labels(labels, {'le': _number(bound)})} {count}")
+                lines.append(f"{metric.name}_sum{_labels(labels)} {_number(value['sum'])}")
+                lines.append(f"{metric.name}_count{_labels(labels)} {value['count']}")
+            else:
+                lines.append(f"{metric.name}{_labels(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+def render_json(registry=None):
+    """Render a registry snapshot as JSON; the +Inf bucket bound is written as a string."""
+    snapshot = (registry or REGISTRY).snapshot()
+    for metric in snapshot.values():
+        if metric["type"] == "histogram":
+            for series in metric["series"]:
+                series["value"]["buckets"] = [[_number(bound), count] for bound, count in series["value"]["buckets"]]
+    return json.dumps(snapshot)
+
+# Exporters by name: (content type, render function taking a registry)
+EXPORTERS = {
+    "prometheus": ("text/plain; version=0.0.4; charset=utf-8", render_prometheus),
+    "json": ("application/json", render_json),
+}
+
+def register_exporter(name, content_type, render_function):
+    """
+    Add an exporter, served over HTTP as /metrics/<name>.
+
+    Args:
+        name (str): Exporter name
+        content_type (str): HTTP content type of the rendered output
+        render_function: Called with a Registry, returns str
+    """
+    EXPORTERS[name] = (content_type, render_function)
+
+def render(exporter="prometheus", registry=None):
+    """Render a registry with a named exporter."""
+    return EXPORTERS[exporter][1](registry or REGISTRY)
+
+def serve(port=9108, addr="", registry=None):
+    """
+    Serve metrics over HTTP from a background thread: /metrics in the
+    Prometheus format, /metrics/<exporter> for any registered exporter.
+
+    Returns:
+        http.server.ThreadingHTTPServer: Call shutdown() to stop it
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split("?", 1)[0].rstrip("/")
+            name = "prometheus" if path == "/metrics" else path[len("/metrics/"):] if path.startswith("/metrics/") else None
+            if name not in EXPORTERS:
+                self.send_error(404)
+                return
+            content_type, render_function = EXPORTERS[name]
+            body = render_function(registry or REGISTRY).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -1,129 +1,234 @@
 """
 OCR utilities for processing India Post captcha images.
+
+The OCR and image libraries (easyocr and torch, cv2, pytesseract, PIL and
+NumPy) are imported on first captcha use rather than at module import, so
+processes that only track API-based couriers never load them.
+
+Besides EasyOCR and Tesseract, the "model" engine runs a small NumPy-only
+recognizer trained for a courier's captcha font, see captcha_model.
 """
-import easyocr
-import os
-from PIL import Image
-import pytesseract
-import cv2
-import numpy as np
+import io
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from .preprocess import get_pipeline
+
+logger = logging.getLogger(__name__)
+
+# EasyOCR readers are expensive to build (they load the detector and
+# recognizer weights), so one reader per configuration is kept for the
+# whole process and shared between threads.
+_easyocr_readers = {}
+_easyocr_lock = threading.Lock()
+
+# Shared micro-batching worker used by ocr_processor, see enable_batching()
+_batch_worker = None
+
+# Preprocessing pipeline used by each engine when the caller does not choose one
+DEFAULT_PREPROCESS = {
+    "easyocr": None,
+    "tesseract": "default",
+    # The captcha model applies the pipeline it was trained with
+    "model": None,
+}
+
+# Tesseract settings for captchas: a single word of ASCII letters and digits
+TESSERACT_WHITELIST = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+TESSERACT_CONFIG = f"--psm 8 --oem 3 -c tessedit_char_whitelist={TESSERACT_WHITELIST}"
+
+# In-process Tesseract handles (tesserocr), one per thread since a handle
+# is not thread-safe. None until first checked, False if not installed.
+_tesseract_local = threading.local()
+_tesserocr_available = None
 
 
-def convert_to_jpg(image_path, output_jpg=None):
+def load_image(image):
     """
-    Convert image (gif,png) to JPG format for better OCR processing.
+    Decode a captcha image into an RGB PIL Image, exactly once and in memory.
+    
+    Args:
+        image: File path, raw image bytes, PIL Image or NumPy array
+        
     Returns:
-        Path to the JPG image
+        PIL Image in RGB mode, or None if the image could not be decoded
     """
-    # Check if file exists
-    if not os.path.exists(image_path):
-        print(f"File not found: {image_path}")
-        return None
+    import numpy as np
+    from PIL import Image
     
-    # Check if already a jpg/jpeg
-    if image_path.lower().endswith(('.jpg', '.jpeg')):
-        # For JPG files, just verify we can open it
-        try:
-            with Image.open(image_path) as img:
-                # Validate image dimensions
-                width, height = img.size
-                if width == 0 or height == 0:
-                    print(f"Invalid image dimensions: {width}x{height}")
-                    return None
-                return image_path
-        except Exception as e:
-            print(f"Failed to verify existing JPG: {e}")
+    try:
+        if isinstance(image, Image.Image):
+            img = image
+        elif isinstance(image, np.ndarray):
+            img = Image.fromarray(image)
+        elif isinstance(image, (bytes, bytearray, memoryview)):
+            img = Image.open(io.BytesIO(image))
+        else:
+            img = Image.open(image)
+        
+        # Convert to RGB if needed (GIF captchas are palette images)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        
+        # Validate image dimensions
+        width, height = img.size
+        if width == 0 or height == 0:
+            logger.warning("Invalid image dimensions: %dx%d", width, height)
             return None
+        
+        return img
+    except Exception as e:
+        logger.error("Image decoding failed: %s", e)
+        return None
+
+def get_easyocr_reader(lang_list=("en",), gpu=False):
+    """
+    Return the process-wide EasyOCR reader for the given configuration,
+    creating it on first use.
     
-    # Generate output filename if not provided
-    if not output_jpg:
-        output_dir = "out"
-        output_jpg = os.path.join(output_dir, "captcha.jpg")
+    Args:
+        lang_list: Languages the reader should recognize
+        gpu: Whether the reader should run on the GPU
+        
+    Returns:
+        easyocr.Reader instance
+    """
+    key = (tuple(lang_list), bool(gpu))
+    reader = _easyocr_readers.get(key)
+    if reader is None:
+        with _easyocr_lock:
+            # Another thread may have built it while we waited for the lock
+            reader = _easyocr_readers.get(key)
+            if reader is None:
+                import easyocr
+                reader = easyocr.Reader(list(lang_list), gpu=gpu, verbose=False)
+                _easyocr_readers[key] = reader
+    return reader
+
+def warm_up(ocr="easyocr", lang_list=("en",), gpu=False):
+    """
+    Load the OCR engine ahead of time so the first captcha does not pay
+    the model load cost. Services should call this once at boot.
     
+    Args:
+        ocr: OCR engine to prepare ('tesseract', 'easyocr' or 'model[:name]')
+        lang_list: Languages for the EasyOCR reader
+        gpu: Whether the EasyOCR reader should run on the GPU
+        
+    Returns:
+        True if the engine is ready, False otherwise
+    """
     try:
-        # Open and convert image
-        with Image.open(image_path) as img:
-            # Convert to RGB if needed
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Validate image dimensions
-            width, height = img.size
-            if width == 0 or height == 0:
-                print(f"Invalid image dimensions: {width}x{height}")
-                return None
-            
-            # Save as JPG
-            img.save(output_jpg, 'JPEG')
-            
-        # Verify the output file exists
-        if not os.path.exists(output_jpg) or os.path.getsize(output_jpg) == 0:
-            print(f"Failed to save output JPG or file is empty: {output_jpg}")
-            return None
-            
-        print(f"Converted {image_path} to {output_jpg}")
-        return output_jpg
-    
+        if ocr.lower().startswith("model"):
+            return get_captcha_model(ocr) is not None
+        if ocr.lower() == "easyocr":
+            get_easyocr_reader(lang_list, gpu)
+        elif get_tesseract_api() is None:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+        return True
     except Exception as e:
-        print(f"Image conversion failed: {e}")
+        logger.error("OCR warm-up failed for %s: %s", ocr, e)
+        return False
+
+def get_tesseract_api():
+    """
+    Return this thread's in-process Tesseract handle, creating it on first use.
+    
+    The handle keeps the model loaded and is preset once for captchas
+    (single word, letters and digits only), so images are recognized in
+    memory without starting a tesseract process per captcha.
+    
+    Returns:
+        tesserocr.PyTessBaseAPI, or None if tesserocr is not installed or
+        cannot load its model (e.g. no tessdata); callers then fall back to
+        pytesseract
+    """
+    global _tesserocr_available
+    if _tesserocr_available is False:
         return None
+    
+    api = getattr(_tesseract_local, "api", None)
+    if api is None:
+        try:
+            import tesserocr
+        except ImportError:
+            _tesserocr_available = False
+            return None
+        try:
+            api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.SINGLE_WORD, oem=tesserocr.OEM.DEFAULT)
+            api.SetVariable("tessedit_char_whitelist", TESSERACT_WHITELIST)
+        except Exception as e:
+            # Missing tessdata or a bad TESSDATA_PREFIX fails the same way every time
+            if _tesserocr_available is not False:
+                logger.warning("tesserocr is unusable, falling back to pytesseract: %s", e)
+            _tesserocr_available = False
+            return None
+        _tesserocr_available = True
+        _tesseract_local.api = api
+    return api
+
+def join_detections(results):
+    """
+    Combine EasyOCR detections into one captcha string without spaces.
+    """
+    return "".join([detection[1].replace(" ", "") for detection in results])
 
-def ocr_easyocr(image_path, debug=False):
+def ocr_easyocr(image, debug=False, lang_list=("en",), gpu=False, preprocess=None):
     """
     Process captcha image and extract text using EasyOCR.
+    
+    Args:
+        image: File path, raw image bytes, PIL Image or NumPy array
+        debug: Whether to log debug information
+        lang_list: Languages for the EasyOCR reader
+        gpu: Whether the EasyOCR reader should run on the GPU
+        preprocess: Preprocessing pipeline name or Pipeline, None for raw pixels
+        
     Returns:
         Extracted text string or None if processing failed
     """
-    # Convert to JPG (will use out/captcha.jpg by default)
-    jpg_path = convert_to_jpg(image_path)
-    if not jpg_path:
-        print(f"Failed to convert image to JPG: {image_path}")
+    img = load_image(image)
+    if img is None:
+        logger.error("Failed to decode captcha image")
         return None
     
     try:
-        # Verify the image file before processing
-        if not os.path.exists(jpg_path) or os.path.getsize(jpg_path) == 0:
-            print(f"Invalid or empty JPG file: {jpg_path}")
-            return None
-            
-        # Test that we can open the image
-        try:
-            with Image.open(jpg_path) as test_img:
-                img_width, img_height = test_img.size
-                if debug:
-                    print(f"Image dimensions: {img_width}x{img_height}")
-        except Exception as img_error:
-            print(f"Failed to verify image before OCR: {img_error}")
-            return None
+        if debug:
+            logger.debug("Image dimensions: %dx%d", img.size[0], img.size[1])
         
-        # Initialize EasyOCR with minimal verbosity
-        reader = easyocr.Reader(['en'], gpu=False, verbose=False)
+        # Reuse the cached EasyOCR reader for this configuration
+        reader = get_easyocr_reader(lang_list, gpu)
         
-        # Perform OCR
-        if debug:
-            print(f"Processing image with EasyOCR: {jpg_path}")
-        results = reader.readtext(jpg_path)
+        # Perform OCR directly on the decoded (and optionally preprocessed) pixels
+        if preprocess:
+            pixels = get_pipeline(preprocess)(img)
+        else:
+            import numpy as np
+            pixels = np.asarray(img)
+        results = reader.readtext(pixels)
         
         # Process results - combine all detections and remove spaces
         if results:
-            text = "".join([detection[1].replace(" ", "") for detection in results])
+            text = join_detections(results)
             if debug:
-                print(f"OCR extracted: '{text}'")
+                logger.debug("OCR extracted: '%s'", text)
             return text
         else:
-            print("No text detected in captcha")
+            logger.info("No text detected in captcha")
             return ""
     
     except Exception as e:
-        print(f"OCR processing failed: {e}")
-        # Print more detailed error information
-        import traceback
-        traceback.print_exc()
+        logger.exception("OCR processing failed: %s", e)
         return None
 
 def opencv_preprocess_image(image):
     """
-    Preprocess image for better OCR results with Tesseract.
+    Preprocess image for better OCR results with Tesseract, using the
+    "default" pipeline (grayscale, Otsu threshold, median blur).
     
     Args:
         image: PIL Image object
@@ -131,80 +236,298 @@ def opencv_preprocess_image(image):
     Returns:
         Preprocessed PIL Image
     """
-    # Convert PIL Image to cv2 format
-    img = np.array(image)
-    
-    # Convert to grayscale if it's not already
-    if len(img.shape) == 3:
-        img = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-    
-    # Apply thresholding to make text more distinct
-    _, img = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    
-    # Optional: Remove noise
-    img = cv2.medianBlur(img, 3)
-    
-    # Convert back to PIL Image
-    return Image.fromarray(img)
+    from PIL import Image
+    return Image.fromarray(get_pipeline("default")(image))
 
-def ocr_tesseract(image_path, debug=False):
+def ocr_tesseract(image, debug=False, preprocess="default"):
     """
     Process captcha image and extract text using Tesseract OCR.
     
+    Uses the in-process tesserocr binding when it is installed and falls
+    back to pytesseract otherwise.
+    
     Args:
-        image_path: Path to the image file
-        debug: Whether to print debug information
+        image: File path, raw image bytes, PIL Image or NumPy array
+        debug: Whether to log debug information
+        preprocess: Preprocessing pipeline name or Pipeline, None for raw pixels
         
     Returns:
         Extracted text string or None if processing failed
     """
+    img = load_image(image)
+    if img is None:
+        logger.error("Failed to decode captcha image")
+        return None
+    
     try:
-        # Open the image
-        image = Image.open(image_path)
-        
         # Print image info if debug is enabled
         if debug:
-            print(f"Image format: {image.format}, Size: {image.size}, Mode: {image.mode}")
+            logger.debug("Image size: %s, Mode: %s", img.size, img.mode)
         
-        # Preprocess the image for better OCR results
-        preprocessed = opencv_preprocess_image(image)
+        # Preprocess the image for better OCR results and recognize the result
+        if preprocess:
+            from PIL import Image
+            img = Image.fromarray(get_pipeline(preprocess)(img))
         
-        # Save preprocessed image if debug is enabled
-        if debug:
-            debug_path = f"{os.path.splitext(image_path)[0]}_preprocessed.png"
-            preprocessed.save(debug_path)
-            print(f"Saved preprocessed image to {debug_path}")
-        
-        # Configure Tesseract options for captcha
-        config = '--psm 8 --oem 3 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
-        
-        # Use Tesseract to do OCR with custom configuration
-        text = pytesseract.image_to_string(image, config=config)
+        api = get_tesseract_api()
+        if api is not None:
+            # In-process Tesseract, already configured for captchas
+            api.SetImage(img)
+            text = api.GetUTF8Text()
+        else:
+            # Fall back to pytesseract, which runs the tesseract binary per call
+            import pytesseract
+            text = pytesseract.image_to_string(img, config=TESSERACT_CONFIG)
         
         # Clean up the result
         text = text.strip()
         
         if debug:
-            print(f"Tesseract OCR results: '{text}'")
+            logger.debug("Tesseract OCR results: '%s'", text)
             
         return text
     except Exception as e:
-        print(f"Error processing {image_path} with Tesseract: {e}")
+        logger.error("Error processing captcha with Tesseract: %s", e)
         return None
 
-def ocr_processor(image_path, ocr="easyocr", debug=True):
+def get_captcha_model(engine="model"):
+    """
+    Return the captcha model for an engine name, "model" for the model
+    registered as "default" or "model:<name>" for a named one.
+    
+    Returns:
+        captcha_model.CaptchaModel, or None if no such model is registered
+    """
+    from . import captcha_model
+    _, _, name = engine.partition(":")
+    return captcha_model.get_model(name or "default")
+
+def ocr_model(image, debug=False, engine="model", preprocess=None):
+    """
+    Process captcha image and extract text using a trained captcha model.
+    
+    Args:
+        image: File path, raw image bytes, PIL Image or NumPy array
+        debug: Whether to log debug information
+        engine: "model" or "model:<name>", see get_captcha_model()
+        preprocess: Preprocessing pipeline applied before the model's own
+        
+    Returns:
+        Extracted text string or None if processing failed
+    """
+    model = get_captcha_model(engine)
+    if model is None:
+        logger.error("No captcha model registered for engine %s", engine)
+        return None
+    
+    try:
+        if preprocess:
+            img = load_image(image)
+            if img is None:
+                return None
+            image = get_pipeline(preprocess)(img)
+        text = model.predict(image)
+        if debug:
+            logger.debug("Captcha model result: %s", text)
+        return text or None
+    except Exception as e:
+        logger.error("Error processing captcha with the captcha model: %s", e)
+        return None
+
+class BatchOCRWorker:
+    """
+    Shared OCR worker that solves captchas from many threads in micro-batches.
+    
+    Callers submit images from any thread. A background thread collects
+    pending images until `max_batch_size` is reached or `max_wait` seconds
+    have passed since the first one arrived, then runs one batched
+    recognizer call and hands each caller its own answer. Images of the
+    same size are batched together, which is the normal case for captchas
+    of one courier.
+    
+    Only EasyOCR recognizes images in batches. Other engines run in the
+    caller's thread, where concurrent lookups use every core instead of
+    queueing up behind one worker thread.
+    
+    Args:
+        ocr: OCR engine, 'easyocr'
+        max_batch_size (int): Maximum number of images per recognizer call
+        max_wait (float): Maximum seconds the first image waits for a batch to fill
+        lang_list: Languages for the EasyOCR reader
+        gpu: Whether the EasyOCR reader should run on the GPU
+    """
+    
+    def __init__(self, ocr="easyocr", max_batch_size=16, max_wait=0.01, lang_list=("en",), gpu=False):
+        if ocr.lower() != "easyocr":
+            raise ValueError(f"OCR engine {ocr} cannot recognize images in batches, only easyocr can")
+        self.ocr = ocr.lower()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.lang_list = tuple(lang_list)
+        self.gpu = gpu
+        self.batches = 0
+        self.images = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ocr-batch-worker", daemon=True)
+        self._thread.start()
+    
+    def submit(self, image):
+        """
+        Queue an image for recognition.
+        
+        Args:
+            image: File path, raw image bytes, PIL Image or NumPy array
+            
+        Returns:
+            concurrent.futures.Future: Resolves to the extracted text, or None on failure
+        """
+        future = Future()
+        self._queue.put((image, future))
+        return future
+    
+    def solve(self, image, timeout=None):
+        """
+        Recognize an image and wait for the answer.
+        
+        Returns:
+            Extracted text string or None if processing failed
+        """
+        return self.submit(image).result(timeout=timeout)
+    
+    def stop(self):
+        """Stop the worker thread after the pending images are solved."""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            
+            # Collect more images until the batch is full or the wait expires
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            
+            self._process(batch)
+            if stop:
+                return
+    
+    def _process(self, batch):
+        self.batches += 1
+        self.images += len(batch)
+        
+        import numpy as np
+        
+        # Decode every image once and group them by size
+        groups = {}
+        for image, future in batch:
+            img = load_image(image)
+            if img is None:
+                future.set_result(None)
+                continue
+            pixels = np.asarray(img)
+            groups.setdefault(pixels.shape, []).append((pixels, future))
+        
+        for (height, width, _), items in groups.items():
+            try:
+                reader = get_easyocr_reader(self.lang_list, self.gpu)
+                results = reader.readtext_batched([pixels for pixels, _ in items],
+                                                  n_width=width, n_height=height,
+                                                  batch_size=len(items))
+                for (_, future), detections in zip(items, results):
+                    future.set_result(join_detections(detections))
+            except Exception as e:
+                logger.error("Batched OCR processing failed: %s", e)
+                for _, future in items:
+                    if not future.done():
+                        future.set_result(None)
+
+def enable_batching(ocr="easyocr", max_batch_size=16, max_wait=0.01, lang_list=("en",), gpu=False):
+    """
+    Route ocr_processor calls for the given engine through a shared
+    BatchOCRWorker, so concurrent India Post and DTDC lookups are solved
+    in batches.
+    
+    Returns:
+        BatchOCRWorker: The shared worker
+        
+    Raises:
+        ValueError: If the engine cannot batch, see BatchOCRWorker
+    """
+    global _batch_worker
+    worker = BatchOCRWorker(ocr, max_batch_size, max_wait, lang_list, gpu)
+    disable_batching()
+    _batch_worker = worker
+    return _batch_worker
+
+def disable_batching():
+    """Stop the shared batching worker; ocr_processor solves images directly again."""
+    global _batch_worker
+    worker, _batch_worker = _batch_worker, None
+    if worker is not None:
+        worker.stop()
+
+def ocr_processor(image, ocr="easyocr", debug=True, lang_list=("en",), gpu=False, preprocess=None, timeout=None):
     """
     Process captcha image and extract text using the specified OCR engine.
+    The image is decoded once in memory; nothing is written to disk. When
+    batching is enabled for the engine, the image goes to the shared worker.
     
     Args:
-        image_path: Path to the image file
-        ocr: OCR engine to use ('tesseract' or 'easyocr')
-        debug: Whether to print debug information
+        image: File path, raw image bytes, PIL Image or NumPy array
+        ocr: OCR engine to use ('tesseract', 'easyocr' or 'model[:name]')
+        debug: Whether to log debug information
+        lang_list: Languages for the EasyOCR reader
+        gpu: Whether the EasyOCR reader should run on the GPU
+        preprocess: Preprocessing pipeline name (e.g. "dtdc") or Pipeline;
+                    None uses the engine default, "none" disables it
+        timeout: Seconds to wait for the batching worker; recognition in
+                 the calling thread cannot be interrupted
         
     Returns:
         Extracted text string or None if processing failed
+        
+    Raises:
+        TimeoutError: If the batching worker did not answer within `timeout`
     """
-    if ocr.lower() == "easyocr":
-        return ocr_easyocr(image_path, debug)
+    if ocr.lower().startswith("model"):
+        # Sub-millisecond solves, batching would only add latency
+        if preprocess == "none":
+            preprocess = None
+        return ocr_model(image, debug, ocr, preprocess)
+    
+    engine = ocr.lower() if ocr.lower() == "easyocr" else "tesseract"
+    if preprocess is None:
+        preprocess = DEFAULT_PREPROCESS[engine]
+    if preprocess == "none":
+        preprocess = None
+    
+    worker = _batch_worker
+    if (worker is not None and worker.ocr == engine
+            and worker.lang_list == tuple(lang_list) and worker.gpu == gpu):
+        if preprocess:
+            # Preprocess in the calling thread, the worker only recognizes
+            img = load_image(image)
+            if img is None:
+                return None
+            image = get_pipeline(preprocess)(img)
+        return worker.solve(image, timeout=timeout)
+    
+    if engine == "easyocr":
+        return ocr_easyocr(image, debug, lang_list, gpu, preprocess)
     else:  # default to tesseract
-        return ocr_tesseract(image_path, debug)
+        return ocr_tesseract(image, debug, preprocess)
@@ -0,0 +1,247 @@
+"""
+Composable captcha preprocessing pipelines.
+
+A pipeline is an ordered list of vectorized NumPy/OpenCV stages (crop,
+scale, threshold, denoise, line removal, deskew...). Stages work on one
+array and modify it in place where OpenCV allows, so a pipeline makes a
+single copy of the decoded image. Every run records per-stage timings, so
+accuracy gains can be weighed against latency with test/bench_ocr.py.
+
+Pipelines are described as data and looked up by name, e.g. per courier:
+
+    register_pipeline("dtdc", [
+        ("grayscale", {}),
+        ("threshold", {"method": "otsu"}),
+        ("remove_lines", {"size": 2}),
+    ])
+"""
+import threading
+import time
+
+def grayscale(img):
+    """Convert an RGB image to a single-channel grayscale image."""
+    import cv2
+    if img.ndim == 3:
+        return cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    return img
+
+def crop(img, left=0, top=0, right=None, bottom=None):
+    """Crop to a box in pixels; returns a view, no pixels are copied."""
+    return img[top:bottom, left:right]
+
+def scale(img, factor=2.0):
+    """Resize by a factor; cubic when enlarging, area when shrinking."""
+    import cv2
+    interpolation = cv2.INTER_CUBIC if factor > 1 else cv2.INTER_AREA
+    return cv2.resize(img, None, fx=factor, fy=factor, interpolation=interpolation)
+
+def threshold(img, method="otsu", value=127, block_size=15, c=8, invert=False):
+    """
+    Binarize a grayscale image in place.
+
+    Args:
+        method: "otsu", "adaptive" (Gaussian, for uneven backgrounds) or "fixed"
+        value: Threshold for the "fixed" method
+        block_size, c: Neighbourhood size and offset for the "adaptive" method
+        invert: Produce white text on a black background
+    """
+    import cv2
+    img = _writable(img)
+    mode = cv2.THRESH_BINARY_INV if invert else cv2.THRESH_BINARY
+    if method == "adaptive":
+        cv2.adaptiveThreshold(img, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, mode, block_size, c, dst=img)
+    elif method == "fixed":
+        cv2.threshold(img, value, 255, mode, dst=img)
+    else:
+        cv2.threshold(img, 0, 255, mode + cv2.THRESH_OTSU, dst=img)
+    return img
+
+def denoise(img, ksize=3):
+    """Remove salt-and-pepper noise with a median blur."""
+    import cv2
+    img = _writable(img)
+    cv2.medianBlur(img, ksize, dst=img)
+    return img
+
+def remove_lines(img, size=2):
+    """
+    Remove thin strike-through lines from a binarized image (dark text on a
+    light background) with a morphological opening of the text mask.
+
+    Args:
+        size: Lines thinner than this many pixels are removed
+    """
+    import cv2
+    import numpy as np
+    img = _writable(img)
+    kernel = np.ones((size + 1, size + 1), np.uint8)
+    # Work on the text mask (text white) and flip back afterwards
+    np.subtract(255, img, out=img)
+    cv2.morphologyEx(img, cv2.MORPH_OPEN, kernel, dst=img)
+    np.subtract(255, img, out=img)
+    return img
+
+def deskew(img, max_angle=15.0):
+    """
+    Rotate a binarized image (dark text on a light background) so the
+    text baseline is horizontal.
+
+    Args:
+        max_angle: Larger detected angles are treated as noise and ignored
+    """
+    import cv2
+    import numpy as np
+    coords = np.column_stack(np.nonzero(img < 128)).astype(np.float32)
+    if len(coords) < 10:
+        return img
+    angle = cv2.minAreaRect(coords[:, ::-1])[-1]
+    # minAreaRect reports angles in [0, 90); map to the smallest rotation
+    if angle > 45:
+        angle -= 90
+    if abs(angle) < 0.5 or abs(angle) > max_angle:
+        return img
+    height, width = img.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(img, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+def _writable(img):
+    """Return img itself if it can be modified in place, else a contiguous copy."""
+    import numpy as np
+    if img.flags.writeable and img.flags.c_contiguous:
+        return img
+    return np.ascontiguousarray(img).copy()
+
+# Stage functions available to pipelines, by name
+STAGES = {
+    "grayscale": grayscale,
+    "crop": crop,
+    "scale": scale,
+    "threshold": threshold,
+    "denoise": denoise,
+    "remove_lines": remove_lines,
+    "deskew": deskew,
+}
+
+class Pipeline:
+    """
+    An ordered list of preprocessing stages.
+
+    Args:
+        stages: List of (stage name, keyword arguments) pairs or callables
+        name (str, optional): Pipeline name used in reports
+    """
+
+    def __init__(self, stages, name=None):
+        self.name = name or "custom"
+        self.stages = []
+        for stage in stages:
+            if callable(stage):
+                self.stages.append((getattr(stage, "__name__", "stage"), stage, {}))
+                continue
+            stage_name, params = stage if isinstance(stage, (tuple, list)) else (stage, {})
+            if stage_name not in STAGES:
+                raise ValueError(f"Unknown preprocessing stage: {stage_name}")
+            self.stages.append((stage_name, STAGES[stage_name], dict(params or {})))
+        self.runs = 0
+        self.total_ms = {stage_name: 0.0 for stage_name, _, _ in self.stages}
+        self._lock = threading.Lock()
+
+    def run(self, image):
+        """
+        Apply every stage to an image.
+
+        Args:
+            image: PIL Image or NumPy array; it is copied once, never modified
+
+        Returns:
+            tuple: (processed NumPy array, {stage name: milliseconds})
+        """
+        import numpy as np
+        img = np.array(image)
+        timings = {}
+        for stage_name, func, params in self.stages:
+            start = time.perf_counter()
+            img = func(img, **params)
+            timings[stage_name] = timings.get(stage_name, 0.0) + (time.perf_counter() - start) * 1000.0
+
+        with self._lock:
+            self.runs += 1
+            for stage_name, ms in timings.items():
+                self.total_ms[stage_name] = self.total_ms.get(stage_name, 0.0) + ms
+        return img, timings
+
+    def __call__(self, image):
+        """Apply the pipeline and return only the processed array."""
+        return self.run(image)[0]
+
+    def stage_timings(self):
+        """
+        Return the mean milliseconds per stage over all runs so far.
+        """
+        with self._lock:
+            runs = self.runs or 1
+            return {stage_name: ms / runs for stage_name, ms in self.total_ms.items()}
+
+# Built-in pipelines. "default" is the classic grayscale -> Otsu -> median
+# chain; the courier presets are starting points to tune with test/bench_ocr.py.
+PIPELINE_SPECS = {
+    "default": [
+        ("grayscale", {}),
+        ("threshold", {"method": "otsu"}),
+        ("denoise", {"ksize": 3}),
+    ],
+    "indiapost": [
+        ("grayscale", {}),
+        ("scale", {"factor": 2.0}),
+        ("threshold", {"method": "otsu"}),
+        ("denoise", {"ksize": 3}),
+    ],
+    "dtdc": [
+        ("grayscale", {}),
+        ("threshold", {"method": "adaptive", "block_size": 31, "c": 15}),
+        ("remove_lines", {"size": 2}),
+        ("denoise", {"ksize": 3}),
+        ("deskew", {}),
+    ],
+}
+
+_pipelines = {}
+_pipelines_lock = threading.Lock()
+
+def register_pipeline(name, stages):
+    """
+    Register (or replace) a named pipeline.
+
+    Args:
+        name (str): Pipeline name, e.g. a courier name
+        stages: List of (stage name, keyword arguments) pairs or callables
+
+    Returns:
+        Pipeline: The registered pipeline
+    """
+    pipeline = Pipeline(stages, name=name)
+    with _pipelines_lock:
+        PIPELINE_SPECS[name] = list(stages)
+        _pipelines[name] = pipeline
+    return pipeline
+
+def get_pipeline(name):
+    """
+    Return a pipeline by name, or the given Pipeline unchanged.
+
+    Raises:
+        ValueError: If no pipeline is registered under the name
+    """
+    if isinstance(name, Pipeline):
+        return name
+    pipeline = _pipelines.get(name)
+    if pipeline is None:
+        if name not in PIPELINE_SPECS:
+            raise ValueError(f"Unknown preprocessing pipeline: {name}")
+        with _pipelines_lock:
+            pipeline = _pipelines.get(name)
+            if pipeline is None:
+                pipeline = Pipeline(PIPELINE_SPECS[name], name=name)
+                _pipelines[name] = pipeline
+    return pipeline
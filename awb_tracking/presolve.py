@@ -0,0 +1,191 @@
+"""
+Background captcha pre-solving.
+
+Loading the tracking page and solving its captcha does not depend on the
+AWB number, so it can happen before the lookup is even requested. A
+PresolvePool keeps a number of sessions with solved captchas ready; a
+lookup takes one and only has to submit the form:
+
+    tracker = DTDCTracker(presolve_size=4)   # or AWBTracker(tracker_options=...)
+    tracker.track("D12345678")               # one POST on the critical path
+
+Solved captchas expire on the courier's side, so ready items older than
+`ttl` seconds are discarded and replaced. When no item is ready, the
+lookup prepares its own captcha inline, as without a pool.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+PRESOLVE_EVENTS = metrics.REGISTRY.counter(
+    "awb_presolve_total", "Pre-solved captchas by outcome", ("courier", "event"))
+
+# Seconds a worker waits after a failed prepare, doubled up to MAX_BACKOFF
+BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+class PreparedCaptcha:
+    """
+    A session with a solved captcha, ready for the submit step of one lookup.
+
+    Args:
+        session: The HTTP session the captcha belongs to
+        answer (str, optional): The captcha answer; None if it could not be solved
+        attempts (int): Captchas solved so far
+        discarded (int): Attempts dropped before submission
+        **state: Courier-specific data for the submit, e.g. the form page
+    """
+
+    def __init__(self, session, answer=None, attempts=0, discarded=0, **state):
+        self.session = session
+        self.answer = answer
+        self.attempts = attempts
+        self.discarded = discarded
+        self.state = state
+        self.created = time.monotonic()
+
+    def age(self):
+        """Return the seconds since the captcha was prepared."""
+        return time.monotonic() - self.created
+
+class PresolvePool:
+    """
+    Keeps `size` PreparedCaptcha items ready, prepared by background threads.
+
+    Args:
+        courier (str): Courier name, used in logs and metrics
+        prepare: Called without arguments in a worker thread; returns a
+                 PreparedCaptcha with an answer, or None if preparing failed
+        discard: Called with an item that expired or is left over at close(),
+                 to release its session
+        size (int): Number of items to keep ready
+        ttl (float): Seconds a solved captcha stays usable
+        workers (int, optional): Background threads, defaults to `size`
+    """
+
+    def __init__(self, courier, prepare, discard, size=2, ttl=120.0, workers=None):
+        self.courier = courier
+        self.prepare = prepare
+        self.discard = discard
+        self.size = size
+        self.ttl = ttl
+        self.workers = workers or size
+        self.counts = {"prepared": 0, "taken": 0, "missed": 0, "expired": 0, "failed": 0}
+        self._ready = deque()
+        self._preparing = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        """Start the background workers; does nothing if they are running."""
+        with self._cond:
+            if self._threads or self._closed:
+                return self
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"presolve-{self.courier}-{number}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        return self
+
+    def _count(self, event):
+        # Called with the condition held
+        self.counts[event] += 1
+        PRESOLVE_EVENTS.inc(courier=self.courier, event=event)
+
+    def _expired_items(self):
+        # Called with the condition held; ready items are in preparation order
+        expired = []
+        while self._ready and self._ready[0].age() > self.ttl:
+            expired.append(self._ready.popleft())
+            self._count("expired")
+        return expired
+
+    def _release(self, items):
+        for item in items:
+            try:
+                self.discard(item)
+            except Exception as e:
+                logger.warning("Discarding a pre-solved %s captcha failed: %s", self.courier, e)
+
+    def take(self):
+        """
+        Return a ready, unexpired item, or None if there is none.
+
+        Returns:
+            PreparedCaptcha: Owned by the caller, who submits with its session
+        """
+        with self._cond:
+            expired = self._expired_items()
+            item = self._ready.popleft() if self._ready else None
+            self._count("taken" if item is not None else "missed")
+            # Wake a worker to refill
+            self._cond.notify()
+        self._release(expired)
+        return item
+
+    def _run(self):
+        backoff = BACKOFF
+        while True:
+            with self._cond:
+                while not self._closed and len(self._ready) + self._preparing >= self.size:
+                    # Wake up in time to replace the oldest item when it expires
+                    timeout = self.ttl - self._ready[0].age() if self._ready else None
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                expired = self._expired_items()
+                self._preparing += 1
+            self._release(expired)
+
+            item = None
+            try:
+                item = self.prepare()
+            except Exception as e:
+                logger.warning("Pre-solving a %s captcha failed: %s", self.courier, e)
+
+            with self._cond:
+                self._preparing -= 1
+                if item is None:
+                    self._count("failed")
+                    # Do not hammer a courier that keeps failing
+                    self._cond.wait(backoff)
+                    backoff = min(backoff * 2, MAX_BACKOFF)
+                    continue
+                backoff = BACKOFF
+                if not self._closed:
+                    self._ready.append(item)
+                    self._count("prepared")
+                    self._cond.notify_all()
+                    continue
+            # Prepared while closing
+            self._release([item])
+
+    def stats(self):
+        """
+        Return counters: items prepared, taken by lookups, missed (no item
+        ready), expired and failed, and the number ready now.
+        """
+        with self._cond:
+            stats = dict(self.counts)
+            stats["ready"] = len(self._ready)
+            return stats
+
+    def close(self):
+        """Stop the workers and discard the ready items."""
+        with self._cond:
+            self._closed = True
+            items = list(self._ready)
+            self._ready.clear()
+            self._cond.notify_all()
+            threads, self._threads = self._threads, []
+        self._release(items)
+        for thread in threads:
+            thread.join()
@@ -0,0 +1,264 @@
+"""
+Adaptive rate limiting and circuit breaking per courier host.
+
+Every request to a courier host first takes a token from that host's
+bucket. The refill rate adapts to how the site responds (AIMD):
+
+    fast, successful response     rate grows by `increase` requests/s per second
+    429, 5xx, error or slow       rate is cut by `decrease` (at most once per
+    response (> latency_target)   cooldown), and a 429 Retry-After pauses the host
+
+so bulk runs settle close to the fastest rate a site accepts. After
+`failure_threshold` consecutive failures (errors and 5xx, not 429) the
+host's circuit opens: requests fail fast with CircuitOpenError for
+`reset_timeout` seconds, then one probe request decides whether it closes
+again.
+
+The shared transport applies the limiter to every request, see
+transport.Transport. Limits per host are merged over DEFAULT_LIMITS:
+
+    transport.configure(rate_limits={"www.dtdc.in": {"rate": 1, "max_rate": 4}})
+"""
+import logging
+import threading
+import time
+
+import requests
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Limiter settings per courier host, see HostLimiter for the keys
+DEFAULT_LIMITS = {
+    "www.indiapost.gov.in": {"rate": 4.0, "max_rate": 20.0, "latency_target": 5.0},
+    "www.dtdc.in": {"rate": 2.0, "max_rate": 10.0, "latency_target": 5.0},
+    "d-captcha-com.dtdc.com": {"rate": 2.0, "max_rate": 10.0, "latency_target": 3.0},
+    "www.ecomexpress.in": {"rate": 20.0, "max_rate": 100.0},
+    "vrlgroup.in": {"rate": 20.0, "max_rate": 100.0},
+}
+
+# Settings for hosts not listed above
+DEFAULT_HOST_LIMIT = {"rate": 50.0, "max_rate": 200.0}
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+RATE_LIMIT_EVENTS = metrics.REGISTRY.counter(
+    "awb_ratelimit_events_total", "Rate limiter backoffs and circuit breaker events", ("host", "event"))
+
+class CircuitOpenError(requests.RequestException):
+    """A request was refused without being sent because the host's circuit is open."""
+
+class HostLimiter:
+    """
+    Token bucket with AIMD rate control and a circuit breaker for one host.
+
+    Args:
+        host (str): Host name, used in logs and metrics
+        rate (float): Initial requests per second
+        min_rate (float): Lowest rate backoff goes down to
+        max_rate (float): Highest rate growth goes up to
+        burst (float): Bucket size, requests that may go out at once
+        increase (float): Additive increase, requests/s gained per second of success
+        decrease (float): Multiplicative decrease factor on congestion
+        latency_target (float): Responses slower than this (seconds) count as congestion
+        cooldown (float): Minimum seconds between two decreases, so one
+                          burst of errors only cuts the rate once
+        failure_threshold (int): Consecutive failures that open the circuit
+        reset_timeout (float): Seconds the circuit stays open before a probe
+    """
+
+    def __init__(self, host, rate=10.0, min_rate=0.2, max_rate=100.0, burst=None, increase=1.0, decrease=0.5,
+                 latency_target=10.0, cooldown=2.0, failure_threshold=5, reset_timeout=30.0):
+        self.host = host
+        self.rate = float(rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.tokens = self.burst
+        self.state = CLOSED
+        self.failures = 0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._open_until = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Take a token and return how long the caller must wait before sending.
+
+        Returns:
+            float: Seconds to wait
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now < self._open_until:
+                    raise CircuitOpenError(f"Circuit open for {self.host}, "
+                                           f"retry in {self._open_until - now:.1f}s")
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN:
+                # Only one probe request until it tells whether the host is back
+                if self._probing:
+                    raise CircuitOpenError(f"Circuit half-open for {self.host}, probe in flight")
+                self._probing = True
+
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens may go negative: later callers queue up behind this one
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def cancel(self):
+        """
+        Give back a reservation whose request is not sent: its token, and the
+        half-open probe slot so another request can probe the host.
+        """
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def acquire(self, timeout=None):
+        """
+        Block until a request may be sent to the host.
+
+        Args:
+            timeout (float, optional): Longest wait in seconds, e.g. what is
+                                       left of the request's timeout
+
+        Raises:
+            CircuitOpenError: If the circuit is open
+            requests.Timeout: If the request would have to wait longer than
+                              `timeout`; nothing is reserved then
+        """
+        wait = self.reserve()
+        if wait <= 0:
+            return
+        if timeout is not None and wait > timeout:
+            self.cancel()
+            raise requests.Timeout(f"Rate limit for {self.host} would delay the request by {wait:.1f}s, "
+                                   f"longer than its {timeout:.1f}s timeout")
+        try:
+            time.sleep(wait)
+        except BaseException:
+            self.cancel()
+            raise
+
+    def record(self, latency=None, status_code=None, error=False, retry_after=None):
+        """
+        Adapt the rate and the circuit to the outcome of a request.
+
+        Args:
+            latency (float, optional): Seconds until the response arrived
+            status_code (int, optional): HTTP status code of the response
+            error (bool): The request failed without a response (connection
+                          error, timeout)
+            retry_after (float, optional): Seconds from a 429 Retry-After header
+        """
+        failed = error or (status_code is not None and status_code >= 500)
+        throttled = status_code == 429
+        slow = latency is not None and latency > self.latency_target
+
+        with self._lock:
+            now = time.monotonic()
+            if failed:
+                self.failures += 1
+                if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                    if self.state != OPEN:
+                        logger.warning("Circuit opened for %s after %d failures", self.host, self.failures)
+                        RATE_LIMIT_EVENTS.inc(host=self.host, event="circuit_open")
+                    self.state = OPEN
+                    self._open_until = now + self.reset_timeout
+            else:
+                self.failures = 0
+                if self.state == HALF_OPEN:
+                    logger.info("Circuit closed for %s", self.host)
+                    RATE_LIMIT_EVENTS.inc(host=self.host, event="circuit_close")
+                    self.state = CLOSED
+
+            if failed or throttled or slow:
+                if now - self._last_decrease >= self.cooldown:
+                    self._last_decrease = now
+                    self.rate = max(self.min_rate, self.rate * self.decrease)
+                    RATE_LIMIT_EVENTS.inc(host=self.host, event="backoff")
+                    logger.debug("Rate for %s cut to %.2f/s", self.host, self.rate)
+                if throttled and retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            else:
+                # Additive increase: about `increase` requests/s more per second
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def snapshot(self):
+        """Return the current rate, tokens and circuit state."""
+        with self._lock:
+            return {"rate": self.rate, "tokens": self.tokens, "state": self.state, "failures": self.failures}
+
+def wait_budget(timeout):
+    """
+    Return the longest rate limit wait allowed by a request timeout: a
+    number, a (connect, read) tuple or None for no limit.
+    """
+    if isinstance(timeout, (tuple, list)):
+        values = [value for value in timeout if value is not None]
+        return max(values) if values else None
+    if isinstance(timeout, (int, float)):
+        return timeout
+    return None
+
+def retry_after_seconds(value):
+    """Return the seconds of a Retry-After header, or None if it is not a number."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    """
+    HostLimiters for every host, created on first use.
+
+    Args:
+        limits (dict, optional): HostLimiter settings per host, merged over DEFAULT_LIMITS
+        default (dict, optional): Settings for other hosts, defaults to DEFAULT_HOST_LIMIT
+    """
+
+    def __init__(self, limits=None, default=None):
+        self.limits = {host: dict(settings) for host, settings in DEFAULT_LIMITS.items()}
+        for host, settings in (limits or {}).items():
+            self.limits.setdefault(host, {}).update(settings)
+        self.default = dict(DEFAULT_HOST_LIMIT if default is None else default)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """Return the limiter of a host."""
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self._hosts.get(host)
+                if limiter is None:
+                    limiter = self._hosts[host] = HostLimiter(host, **self.limits.get(host, self.default))
+        return limiter
+
+    def snapshot(self):
+        """Return {host: HostLimiter.snapshot()} for every host seen so far."""
+        with self._lock:
+            hosts = dict(self._hosts)
+        return {host: limiter.snapshot() for host, limiter in hosts.items()}
@@ -0,0 +1,182 @@
+"""
+Registry of courier tracker backends.
+
+Couriers are registered by name with a factory and a set of capabilities.
+The factory is only imported when a tracker is first built, so a process
+never loads code for couriers it does not use.
+
+Third-party packages can add couriers through the "awb_tracking.couriers"
+entry point group. The entry point may reference a CourierSpec or a
+tracker class; a class can declare its capabilities in a `capabilities`
+dict attribute:
+
+    [project.entry-points."awb_tracking.couriers"]
+    bluedart = "awb_bluedart:BlueDartTracker"
+"""
+import importlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "awb_tracking.couriers"
+
+DEFAULT_CAPABILITIES = {
+    # The tracker can look up several AWBs in one call (track_batch)
+    "supports_batch": False,
+    # Lookups solve a captcha, so they are CPU-bound and slower
+    "needs_captcha": False,
+    # Suggested maximum number of concurrent lookups
+    "max_concurrency": 8,
+}
+
+class CourierSpec:
+    """
+    Description of a courier backend.
+
+    Args:
+        name (str): Courier name used with AWBTracker, e.g. "vrl"
+        factory: Tracker class or callable, or a "package.module:Class" string
+                 imported on first use
+        **capabilities: Overrides for DEFAULT_CAPABILITIES
+    """
+
+    def __init__(self, name, factory, **capabilities):
+        self.name = name.lower()
+        self.factory = factory
+        self._capabilities = capabilities or None
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Import and return the tracker factory.
+        """
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    self._loaded = _resolve(self.factory)
+        return self._loaded
+
+    def create(self, **options):
+        """
+        Build a new tracker instance.
+
+        Args:
+            **options: Keyword arguments for the tracker constructor
+        """
+        return self.load()(**options)
+
+    def capabilities(self):
+        """
+        Return the courier capabilities merged over DEFAULT_CAPABILITIES.
+
+        Capabilities given at registration are used as-is. Otherwise the
+        factory is loaded and its `capabilities` attribute is read.
+        """
+        capabilities = dict(DEFAULT_CAPABILITIES)
+        if self._capabilities is not None:
+            capabilities.update(self._capabilities)
+        else:
+            capabilities.update(getattr(self.load(), "capabilities", None) or {})
+        return capabilities
+
+def _resolve(factory):
+    """Turn a "module:attr" string or entry point into the object it names."""
+    if hasattr(factory, "load") and hasattr(factory, "group"):
+        factory = factory.load()
+    if isinstance(factory, str):
+        module_name, _, attr = factory.partition(":")
+        module = importlib.import_module(module_name, package=__package__)
+        factory = getattr(module, attr)
+    if isinstance(factory, CourierSpec):
+        factory = factory.load()
+    return factory
+
+_registry = {}
+_registry_lock = threading.Lock()
+_entry_points_loaded = False
+_entry_points_lock = threading.Lock()
+
+def register_courier(name, factory, **capabilities):
+    """
+    Register (or replace) a courier backend.
+
+    Args:
+        name (str): Courier name used with AWBTracker
+        factory: Tracker class or callable, or a "package.module:Class" string
+        **capabilities: Overrides for DEFAULT_CAPABILITIES
+
+    Returns:
+        CourierSpec: The registered spec
+    """
+    spec = CourierSpec(name, factory, **capabilities)
+    with _registry_lock:
+        _registry[spec.name] = spec
+    return spec
+
+def unregister_courier(name):
+    """Remove a courier backend from the registry."""
+    with _registry_lock:
+        _registry.pop(name.lower(), None)
+
+def load_entry_points():
+    """
+    Register third-party couriers from the "awb_tracking.couriers" entry
+    point group. Only the entry point metadata is read; the courier code is
+    imported when a tracker is first built. Runs once per process.
+    """
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    with _entry_points_lock:
+        # Other threads wait here until the registry is complete
+        if _entry_points_loaded:
+            return
+        for entry_point in _courier_entry_points():
+            with _registry_lock:
+                # Built-in and explicitly registered couriers take precedence
+                if entry_point.name.lower() not in _registry:
+                    _registry[entry_point.name.lower()] = CourierSpec(entry_point.name, entry_point)
+        _entry_points_loaded = True
+
+def _courier_entry_points():
+    """Return the entry points of the courier group, or none if they cannot be read."""
+    try:
+        from importlib.metadata import entry_points
+        try:
+            return entry_points(group=ENTRY_POINT_GROUP)
+        except TypeError:
+            # Python < 3.10 returns a dict of groups
+            return entry_points().get(ENTRY_POINT_GROUP, [])
+    except Exception as e:
+        logger.error("Error reading courier entry points: %s", e)
+        return []
+
+def get_courier(name):
+    """
+    Return the CourierSpec registered under a name, or None.
+    """
+    key = str(name).lower()
+    spec = _registry.get(key)
+    if spec is None:
+        load_entry_points()
+        spec = _registry.get(key)
+    return spec
+
+def list_couriers():
+    """
+    Return the names of all registered couriers, including entry points.
+    """
+    load_entry_points()
+    return sorted(_registry)
+
+# Built-in couriers
+register_courier("indiapost", ".indiapost:IndiaPostTracker",
+                 supports_batch=True, needs_captcha=True, max_concurrency=8)
+register_courier("dtdc", ".dtdc:DTDCTracker",
+                 needs_captcha=True, max_concurrency=4)
+register_courier("ecomexpress", ".ecomexpress:EcomExpressTracker",
+                 max_concurrency=32)
+register_courier("vrl", ".vrl:VRLTracker",
+                 max_concurrency=32)
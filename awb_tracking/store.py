@@ -0,0 +1,251 @@
+"""
+SQLite-backed store of tracked shipments.
+
+Every shipment keeps its last good tracking result, when it was last
+checked and how many lookups it took, so a polling run only touches the
+shipments that can still change instead of rescanning a flat file.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from . import utils
+from .cache import ERROR_STATUSES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shipments (
+    courier     TEXT    NOT NULL,
+    awb_number  TEXT    NOT NULL,
+    status      TEXT,
+    terminal    INTEGER NOT NULL DEFAULT 0,
+    result      TEXT,
+    last_error  TEXT,
+    checked_at  REAL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL    NOT NULL,
+    PRIMARY KEY (courier, awb_number)
+);
+CREATE INDEX IF NOT EXISTS idx_shipments_due ON shipments (terminal, courier, checked_at);
+CREATE INDEX IF NOT EXISTS idx_shipments_status ON shipments (courier, status);
+"""
+
+class ShipmentStore:
+    """
+    Local SQLite store of shipments and their last tracking results.
+
+    Args:
+        path (str): Database file, created if missing; ":memory:" for a
+                    database that lives as long as the store
+    """
+
+    def __init__(self, path="shipments.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = self._connect()
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._conn.commit()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        # WAL lets due() stream from one connection while record() writes on another
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
+
+    def add(self, courier, awb_number):
+        """
+        Add a shipment to the store; existing shipments are left untouched.
+
+        Returns:
+            bool: True if the shipment was new
+        """
+        return self.add_many([(courier, awb_number)]) == 1
+
+    def add_many(self, items):
+        """
+        Add many shipments at once; existing shipments are left untouched.
+
+        Args:
+            items: Iterable of (courier, awb_number) pairs
+
+        Returns:
+            int: Number of new shipments
+        """
+        now = time.time()
+        rows = ((str(courier).strip().lower(), str(awb_number).strip(), now) for courier, awb_number in items)
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO shipments (courier, awb_number, created_at) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            return self._conn.total_changes - before
+
+    def record(self, courier, awb_number, result, error=None):
+        """
+        Record the outcome of a lookup.
+
+        A good result replaces the stored one. A failed lookup (an exception
+        or an error status) keeps the last good result and only updates the
+        error, timestamp and attempt count.
+
+        Args:
+            courier (str): Courier name
+            awb_number (str): The AWB / tracking number
+            result (dict): Tracking result returned by the tracker
+            error (str, optional): Failure message if the lookup raised
+        """
+        courier = str(courier).strip().lower()
+        awb_number = str(awb_number).strip()
+        now = time.time()
+
+        status = str(result.get("status") or "").strip().lower() if isinstance(result, dict) else ""
+        failed = error is not None or not status or status in ERROR_STATUSES
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO shipments (courier, awb_number, created_at) VALUES (?, ?, ?)",
+                (courier, awb_number, now))
+            if failed:
+                if error is None:
+                    error = (result.get("status_txt") if isinstance(result, dict) else None) or status or "No result"
+                self._conn.execute(
+                    "UPDATE shipments SET last_error = ?, checked_at = ?, attempts = attempts + 1 "
+                    "WHERE courier = ? AND awb_number = ?",
+                    (str(error), now, courier, awb_number))
+            else:
+                self._conn.execute(
+                    "UPDATE shipments SET status = ?, terminal = ?, result = ?, last_error = NULL, "
+                    "checked_at = ?, attempts = attempts + 1 WHERE courier = ? AND awb_number = ?",
+                    (status, int(utils.is_terminal_status(status)), json.dumps(result, default=str),
+                     now, courier, awb_number))
+            self._conn.commit()
+
+    def get(self, courier, awb_number):
+        """
+        Return the stored record of a shipment.
+
+        Returns:
+            dict: The shipment record with "result" decoded, or None if unknown
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM shipments WHERE courier = ? AND awb_number = ?",
+                (str(courier).strip().lower(), str(awb_number).strip())).fetchone()
+        return self._to_dict(row) if row else None
+
+    def due(self, courier=None, older_than_hours=0, limit=None):
+        """
+        Stream the non-terminal shipments that were never checked or were last
+        checked more than `older_than_hours` ago, least recently checked first.
+
+        Args:
+            courier (str, optional): Only return shipments of this courier
+            older_than_hours (float): Minimum age of the last check
+            limit (int, optional): Maximum number of shipments
+
+        Yields:
+            tuple: (courier, awb_number) pairs, ready for AWBTracker.iter_track()
+        """
+        query = "SELECT courier, awb_number FROM shipments WHERE terminal = 0"
+        params = []
+        if courier:
+            query += " AND courier = ?"
+            params.append(str(courier).strip().lower())
+        query += " AND (checked_at IS NULL OR checked_at <= ?)"
+        params.append(time.time() - older_than_hours * 3600)
+        query += " ORDER BY checked_at IS NOT NULL, checked_at"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+
+        if self.path == ":memory:":
+            # Another connection would open a new, empty database; take the
+            # rows up front instead
+            with self._lock:
+                rows = self._conn.execute(query, params).fetchall()
+            for row in rows:
+                yield row["courier"], row["awb_number"]
+            return
+
+        # A separate connection keeps this read snapshot stable while
+        # record() writes results on the main connection
+        conn = self._connect()
+        try:
+            for row in conn.execute(query, params):
+                yield row["courier"], row["awb_number"]
+        finally:
+            conn.close()
+
+    def count(self, courier=None, terminal=None):
+        """
+        Count stored shipments, optionally by courier and terminal state.
+        """
+        query = "SELECT COUNT(*) FROM shipments WHERE 1 = 1"
+        params = []
+        if courier:
+            query += " AND courier = ?"
+            params.append(str(courier).strip().lower())
+        if terminal is not None:
+            query += " AND terminal = ?"
+            params.append(int(bool(terminal)))
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def status_counts(self, courier=None):
+        """
+        Return the number of shipments per (courier, status).
+
+        Returns:
+            dict: {(courier, status): count}; status is None for unchecked shipments
+        """
+        query = "SELECT courier, status, COUNT(*) FROM shipments"
+        params = []
+        if courier:
+            query += " WHERE courier = ?"
+            params.append(str(courier).strip().lower())
+        query += " GROUP BY courier, status"
+        with self._lock:
+            return {(row[0], row[1]): row[2] for row in self._conn.execute(query, params)}
+
+    def poll(self, tracker, courier=None, older_than_hours=0, limit=None, **kwargs):
+        """
+        Re-track the due shipments and record every result.
+
+        Args:
+            tracker (AWBTracker): Tracker used for the lookups
+            courier (str, optional): Only poll shipments of this courier
+            older_than_hours (float): Minimum age of the last check, see due()
+            limit (int, optional): Maximum number of shipments to poll
+            **kwargs: Passed to AWBTracker.iter_track(), e.g. max_workers
+
+        Returns:
+            dict: Number of shipments "checked", "failed" and newly "terminal"
+        """
+        summary = {"checked": 0, "failed": 0, "terminal": 0}
+        items = self.due(courier=courier, older_than_hours=older_than_hours, limit=limit)
+        for item in tracker.iter_track(items, **kwargs):
+            result = item["result"]
+            self.record(item["courier"], item["awb_number"], result, item["error"])
+
+            summary["checked"] += 1
+            status = result.get("status") if isinstance(result, dict) else None
+            if item["error"] is not None or not status or str(status).lower() in ERROR_STATUSES:
+                summary["failed"] += 1
+            elif utils.is_terminal_status(status):
+                summary["terminal"] += 1
+        return summary
+
+    @staticmethod
+    def _to_dict(row):
+        record = dict(row)
+        record["terminal"] = bool(record["terminal"])
+        record["result"] = json.loads(record["result"]) if record["result"] else None
+        return record
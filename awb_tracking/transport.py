@@ -0,0 +1,341 @@
+"""
+Shared HTTP transport for all trackers.
+
+Connection pools live in HTTPAdapters that are shared by every session the
+transport hands out, so keep-alive connections to the few courier hosts
+are reused across lookups instead of paying a TCP and TLS handshake each
+time. Each courier host gets its own pool size. Sessions still have their
+own cookies, which the captcha flows need. Every request gets a
+(connect, read) timeout unless the caller passes its own, and goes
+through the adaptive per-host rate limiter and circuit breaker, see
+ratelimit.
+
+Stateless API calls (VRL, Ecom Express) go through request(), which uses a
+per-thread session that never stores cookies.
+
+The async interface uses httpx with HTTP/2 when the h2 package is
+installed. DNS answers can be cached process-wide with enable_dns_cache().
+
+    from awb_tracking import transport
+    transport.configure(pool_sizes={"www.indiapost.gov.in": 16}, dns_cache_ttl=300)
+"""
+import asyncio
+import logging
+import socket
+import threading
+import time
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import ratelimit
+from .utils import DEFAULT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Keep-alive connections kept per courier host, in line with the couriers'
+# max_concurrency capability
+DEFAULT_POOL_SIZES = {
+    "www.indiapost.gov.in": 8,
+    "www.dtdc.in": 4,
+    "d-captcha-com.dtdc.com": 4,
+    "www.ecomexpress.in": 32,
+    "vrlgroup.in": 32,
+}
+
+# Pool size for hosts not listed above
+DEFAULT_POOL_SIZE = 10
+
+class Transport:
+    """
+    Pooled HTTP transport shared by all trackers.
+
+    Args:
+        pool_sizes (dict, optional): Connections kept alive per host, merged
+                                     over DEFAULT_POOL_SIZES
+        default_pool_size (int): Connections kept alive for other hosts
+        max_retries (int): Retries for failed connections (not for responses)
+        http2 (bool, optional): Use HTTP/2 for the async client; by default it
+                                is used when the h2 package is installed
+        timeout (tuple): Default (connect, read) timeout in seconds of every request
+        rate_limits (dict, optional): ratelimit.HostLimiter settings per host,
+                                      merged over ratelimit.DEFAULT_LIMITS
+        rate_limit (bool): Apply the rate limiter and circuit breaker
+    """
+
+    def __init__(self, pool_sizes=None, default_pool_size=DEFAULT_POOL_SIZE, max_retries=0, http2=None,
+                 timeout=DEFAULT_TIMEOUT, rate_limits=None, rate_limit=True):
+        self.pool_sizes = dict(DEFAULT_POOL_SIZES)
+        self.pool_sizes.update(pool_sizes or {})
+        self.default_pool_size = default_pool_size
+        self.http2 = http2
+        self.timeout = timeout
+        self.limiter = ratelimit.RateLimiter(rate_limits) if rate_limit else None
+        # One adapter (and so one connection pool) per configured host
+        self.adapters = {
+            host: _LimitedAdapter(self.limiter, pool_connections=2, pool_maxsize=size, max_retries=max_retries)
+            for host, size in self.pool_sizes.items()
+        }
+        self.default_adapter = _LimitedAdapter(self.limiter, pool_connections=DEFAULT_POOL_SIZE,
+                                               pool_maxsize=default_pool_size, max_retries=max_retries)
+        self._local = threading.local()
+
+    def mount(self, session):
+        """
+        Mount the shared adapters on a requests.Session.
+
+        Returns:
+            requests.Session: The same session
+        """
+        session.mount("https://", self.default_adapter)
+        session.mount("http://", self.default_adapter)
+        for host, adapter in self.adapters.items():
+            session.mount(f"https://{host}/", adapter)
+            session.mount(f"http://{host}/", adapter)
+        return session
+
+    def session(self):
+        """
+        Return a new session with its own cookies on the shared connection pools.
+
+        Closing the session only drops its cookies; the pools stay open.
+        """
+        session = _TransportSession()
+        session.timeout = self.timeout
+        return self.mount(session)
+
+    def _stateless_session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self.session()
+            # API calls must not leak cookies between unrelated lookups
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            self._local.session = session
+        return session
+
+    def request(self, method, url, **kwargs):
+        """
+        Send a cookie-less request on the shared pools, like requests.request().
+        """
+        return self._stateless_session().request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def async_client(self, **kwargs):
+        """
+        Create an httpx.AsyncClient for the async tracking interface.
+
+        HTTP/2 is enabled when the h2 package is installed (unless disabled
+        on the transport), keep-alive limits follow the pool sizes, the
+        timeouts those of the transport, and requests go through the same
+        rate limiter as the synchronous ones.
+        httpx applies its limits per client rather than per host.
+
+        Args:
+            **kwargs: Extra keyword arguments for httpx.AsyncClient
+        """
+        try:
+            import httpx
+        except ImportError as e:
+            raise ImportError("The async tracking interface requires httpx: pip install httpx") from e
+
+        http2 = self.http2
+        if http2 is None:
+            try:
+                import h2  # noqa: F401
+                http2 = True
+            except ImportError:
+                http2 = False
+        connect, read = self.timeout
+        kwargs.setdefault("timeout", httpx.Timeout(read, connect=connect))
+        limits = kwargs.pop("limits", None) or httpx.Limits(
+            max_connections=None,
+            max_keepalive_connections=sum(self.pool_sizes.values()) + self.default_pool_size)
+        if "transport" not in kwargs:
+            # The client's http2 and limits only configure its default
+            # transport, so they go to the transport built here instead
+            async_transport = httpx.AsyncHTTPTransport(http2=kwargs.pop("http2", http2), limits=limits)
+            if self.limiter is not None:
+                async_transport = _LimitedAsyncTransport(async_transport, self.limiter)
+            kwargs["transport"] = async_transport
+        return httpx.AsyncClient(**kwargs)
+
+    def close(self):
+        """Close every pooled connection."""
+        for adapter in self.adapters.values():
+            adapter.close()
+        self.default_adapter.close()
+
+def _record(limiter, started, response=None, error=False):
+    """Report the outcome of a request to a host limiter."""
+    status_code = getattr(response, "status_code", None)
+    retry_after = None
+    if status_code == 429:
+        retry_after = ratelimit.retry_after_seconds(response.headers.get("Retry-After"))
+    limiter.record(time.monotonic() - started, status_code, error, retry_after)
+
+class _LimitedAdapter(HTTPAdapter):
+    """HTTPAdapter that sends every request through the host's rate limiter."""
+
+    def __init__(self, limiter, **kwargs):
+        self.limiter = limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.limiter is None:
+            return super().send(request, **kwargs)
+        limiter = self.limiter.get(urlsplit(request.url).hostname or "")
+        # Waiting for a token counts against the request's timeout
+        limiter.acquire(ratelimit.wait_budget(kwargs.get("timeout")))
+        started = time.monotonic()
+        try:
+            response = super().send(request, **kwargs)
+        except BaseException:
+            _record(limiter, started, error=True)
+            raise
+        _record(limiter, started, response)
+        return response
+
+class _LimitedAsyncTransport:
+    """httpx async transport wrapper applying the rate limiter, see _LimitedAdapter."""
+
+    def __init__(self, transport, limiter):
+        self.transport = transport
+        self.limiter = limiter
+
+    async def handle_async_request(self, request):
+        import httpx
+
+        limiter = self.limiter.get(request.url.host)
+        try:
+            wait = limiter.reserve()
+        except ratelimit.CircuitOpenError as e:
+            # Surface as an httpx error, which the async trackers handle
+            raise httpx.ConnectError(str(e), request=request) from e
+        if wait > 0:
+            timeouts = request.extensions.get("timeout") or {}
+            budget = ratelimit.wait_budget(tuple(timeouts.values()))
+            if budget is not None and wait > budget:
+                limiter.cancel()
+                raise httpx.PoolTimeout(f"Rate limit for {request.url.host} would delay the request by "
+                                        f"{wait:.1f}s, longer than its {budget:.1f}s timeout", request=request)
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled before sending: free the token and any probe slot
+                limiter.cancel()
+                raise
+        started = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            _record(limiter, started, error=True)
+            raise
+        _record(limiter, started, response)
+        return response
+
+    async def __aenter__(self):
+        await self.transport.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.transport.__aexit__(*args)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class _TransportSession(requests.Session):
+    """
+    A requests.Session with a default timeout, whose close() keeps the
+    shared pools open.
+    """
+
+    timeout = DEFAULT_TIMEOUT
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, **kwargs)
+
+    def close(self):
+        self.cookies.clear()
+
+_transport = None
+_transport_lock = threading.Lock()
+
+def get_transport():
+    """Return the process-wide transport, creating it on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = Transport()
+    return _transport
+
+def configure(dns_cache_ttl=None, **kwargs):
+    """
+    Replace the process-wide transport, see Transport for the arguments.
+
+    Args:
+        dns_cache_ttl (float, optional): Also enable the DNS cache with this TTL
+                                         in seconds
+
+    Returns:
+        Transport: The new transport
+    """
+    global _transport
+    transport = Transport(**kwargs)
+    with _transport_lock:
+        previous, _transport = _transport, transport
+    if previous is not None:
+        previous.close()
+    if dns_cache_ttl:
+        enable_dns_cache(dns_cache_ttl)
+    return transport
+
+# DNS cache: (getaddrinfo arguments) -> (expiry time, result)
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_original_getaddrinfo = None
+
+def enable_dns_cache(ttl=300):
+    """
+    Cache socket.getaddrinfo() answers for `ttl` seconds, process-wide.
+
+    New connections to the courier hosts then skip the DNS round trip.
+    Failed lookups are not cached.
+    """
+    global _original_getaddrinfo
+    with _dns_lock:
+        if _original_getaddrinfo is None:
+            _original_getaddrinfo = socket.getaddrinfo
+        resolve = _original_getaddrinfo
+
+    def cached_getaddrinfo(*args, **kwargs):
+        key = (args, tuple(sorted(kwargs.items())))
+        now = time.monotonic()
+        entry = _dns_cache.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        result = resolve(*args, **kwargs)
+        with _dns_lock:
+            _dns_cache[key] = (now + ttl, result)
+        return result
+
+    socket.getaddrinfo = cached_getaddrinfo
+    logger.debug("DNS cache enabled, TTL %s seconds", ttl)
+
+def disable_dns_cache():
+    """Restore the original socket.getaddrinfo() and drop cached answers."""
+    global _original_getaddrinfo
+    with _dns_lock:
+        if _original_getaddrinfo is not None:
+            socket.getaddrinfo = _original_getaddrinfo
+            _original_getaddrinfo = None
+        _dns_cache.clear()
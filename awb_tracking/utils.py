@@ -1,29 +1,238 @@
-from bs4 import BeautifulSoup
+import logging
+import threading
+import time
+
+from . import document
+
+logger = logging.getLogger(__name__)
+
+# Normalized statuses after which a shipment can no longer change
+TERMINAL_STATUSES = ("delivered", "returned")
+
+# Statuses that describe a failed lookup rather than the shipment
+ERROR_STATUSES = ("error", "unknown", "timeout")
+
+# (connect, read) timeout in seconds for every courier request
+DEFAULT_TIMEOUT = (5.0, 20.0)
+
+# Time budget in seconds for one multi-step (captcha) lookup
+DEFAULT_LOOKUP_TIMEOUT = 60.0
+
+class LookupTimeout(TimeoutError):
+    """
+    A lookup step timed out, or the lookup ran out of its time budget.
+    
+    Args:
+        step (str): The step that timed out, e.g. "page_fetch" or "ocr"
+        reason: What happened, e.g. the underlying requests exception
+    """
+    
+    def __init__(self, step, reason="deadline exceeded"):
+        super().__init__(f"Timed out during {step}: {reason}")
+        self.step = step
+
+class Deadline:
+    """
+    End-to-end time budget of one lookup, passed through all of its steps.
+    
+    Each step calls request_timeout() (or check()) before it starts, so the
+    lookup stops as soon as the budget is spent and no single request can
+    wait longer than what is left of it.
+    
+    Args:
+        seconds (float, optional): The budget; None for no limit beyond the
+                                   per-request timeouts
+        timeout (tuple): (connect, read) timeout of a single request
+    """
+    
+    def __init__(self, seconds=None, timeout=DEFAULT_TIMEOUT):
+        self.seconds = seconds
+        self.timeout = timeout
+        self.expires = time.monotonic() + seconds if seconds else None
+    
+    def remaining(self):
+        """Return the seconds left, or None if there is no budget."""
+        if self.expires is None:
+            return None
+        return max(0.0, self.expires - time.monotonic())
+    
+    def expired(self):
+        return self.expires is not None and time.monotonic() >= self.expires
+    
+    def check(self, step):
+        """
+        Raise LookupTimeout if the budget is spent before `step` starts.
+        
+        Returns:
+            float: The seconds left, or None if there is no budget
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise LookupTimeout(step)
+        return remaining
+    
+    def request_timeout(self, step):
+        """
+        Return the requests timeout for `step`: the per-request timeout,
+        capped by what is left of the budget.
+        
+        Raises:
+            LookupTimeout: If the budget is already spent
+        """
+        remaining = self.check(step)
+        if remaining is None:
+            return self.timeout
+        connect, read = self.timeout
+        return (min(connect, remaining), min(read, remaining))
+
+def timeout_result(tracking_number, error, **extra):
+    """
+    Build the tracking result of a lookup that timed out.
+    
+    Args:
+        tracking_number (str): The tracking number looked up
+        error (Exception): The LookupTimeout (or requests/httpx timeout)
+        **extra: Additional result fields, e.g. captcha_attempts
+        
+    Returns:
+        dict: Result with status "timeout" and the step in "timeout_step"
+    """
+    result = {
+        "tracking_number": tracking_number,
+        "status": "timeout",
+        "status_txt": str(error) or "Timed out",
+        "timeout_step": getattr(error, "step", None),
+    }
+    result.update(extra)
+    return result
+
+def is_terminal_status(status):
+    """
+    Check whether a tracking status is final (the shipment will not move again).
+    
+    Args:
+        status (str): The "status" value of a tracking result
+        
+    Returns:
+        bool: True for terminal statuses such as "delivered"
+    """
+    return str(status or "").strip().lower() in TERMINAL_STATUSES
 
 def get_html_value_by_id(html_content, element_id):
     """
     Extract the HTML value of an element with the specified ID from HTML content.
     
     Args:
-        html_content (bytes or str): The HTML content to parse
+        html_content (bytes, str or HtmlDocument): The HTML content, parsed
+                                                   only if it is not a document yet
         element_id (str): The ID of the element to find
         
     Returns:
         str: The inner HTML of the element if found, None otherwise
     """
     try:
-        # Create a BeautifulSoup object to parse the HTML
-        soup = BeautifulSoup(html_content, 'html.parser')
+        # Parse the HTML unless the caller already did
+        doc = document.parse(html_content)
         
-        # Find the element with the specified ID
-        element = soup.find(id=element_id)
-        
-        # Return the inner HTML if element is found
-        if element:
-            return element.decode_contents()
+        # Return the inner HTML of the element if it is found
+        value = doc.inner_html(element_id)
+        if value is not None:
+            return value
         else:
-            print(f"Element with ID '{element_id}' not found")
+            logger.debug("Element with ID '%s' not found", element_id)
             return None
     except Exception as e:
-        print(f"Error parsing HTML: {e}")
-        return None
\ No newline at end of file
+        logger.error("Error parsing HTML: %s", e)
+        return None
+
+def new_async_client(**kwargs):
+    """
+    Create a non-blocking HTTP client for the async tracking interface.
+    
+    httpx is only required by the async interface, so it is imported on
+    first use. The client is configured by the shared transport (HTTP/2
+    when available, keep-alive limits), see transport.Transport.async_client().
+    
+    Args:
+        **kwargs: Extra keyword arguments for httpx.AsyncClient
+        
+    Returns:
+        httpx.AsyncClient: A new client; close it with `await client.aclose()`
+        or use it as an async context manager
+    """
+    from . import transport
+    return transport.get_transport().async_client(**kwargs)
+
+class CaptchaStats:
+    """
+    Thread-safe counters of captcha attempts, to measure the real captcha
+    success rate of a tracker. When a courier is given, attempts are also
+    counted in metrics.CAPTCHA_ATTEMPTS.
+    
+    Args:
+        courier (str, optional): Courier name used as the metrics label
+    """
+    
+    def __init__(self, courier=None):
+        self.courier = courier
+        self.lookups = 0
+        self.attempts = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.discarded = 0
+        self.chained = 0
+        self._lock = threading.Lock()
+    
+    def record(self, attempts, accepted, discarded=0, chained=False):
+        """
+        Record one lookup.
+        
+        Args:
+            attempts (int): Number of captchas solved during the lookup
+            accepted (bool): Whether the courier finally accepted a captcha
+            discarded (int): Attempts dropped before submission (unreadable
+                             image or implausible answer)
+            chained (bool): The accepted answer was carried forward from an
+                            earlier lookup instead of solved for this one
+        """
+        submitted = attempts - discarded
+        rejected = max(0, submitted - 1) if accepted else submitted
+        chained = accepted and chained
+        # A reused answer says nothing about the solver's success rate
+        solved = accepted and not chained
+        with self._lock:
+            self.lookups += 1
+            self.attempts += attempts
+            self.discarded += discarded
+            self.rejected += rejected
+            if solved:
+                self.accepted += 1
+            if chained:
+                self.chained += 1
+        
+        if self.courier:
+            from . import metrics
+            for outcome, count in (("accepted", int(solved)), ("rejected", rejected), ("discarded", discarded),
+                                   ("chained", int(chained))):
+                if count:
+                    metrics.CAPTCHA_ATTEMPTS.inc(count, courier=self.courier, outcome=outcome)
+    
+    def snapshot(self):
+        """
+        Return the counters and the per-captcha success rate.
+        
+        Returns:
+            dict: lookups, attempts, accepted, rejected (by the courier),
+                  discarded (before submission), chained (lookups accepted
+                  with a reused answer) and success_rate
+        """
+        with self._lock:
+            return {
+                "lookups": self.lookups,
+                "attempts": self.attempts,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "discarded": self.discarded,
+                "chained": self.chained,
+                "success_rate": self.accepted / self.attempts if self.attempts else 0.0,
+            }
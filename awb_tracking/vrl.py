@@ -1,22 +1,22 @@
 import requests
 
+from . import metrics
+from . import transport
+from . import utils
+
+COURIER = "vrl"
+
+TRACKING_URL = "https://vrlgroup.in/track_consignment.aspx?lrtrack=1&lrno={awb_number}"
+
 class VRLTracker:
     """
     Tracker for VRL logistics
     """
 
-    def track(self, awb_number):
+    def _parse_result(self, awb_number, result):
         """
-        Track a VRL shipment
-        
-        Args:
-            awb_number: The LR number to track
-            
-        Returns:
-            Dictionary with tracking information
+        Convert the VRL JSON response into the common tracking format.
         """
-        url = f"https://vrlgroup.in/track_consignment.aspx?lrtrack=1&lrno={awb_number}"
-        
         # Initialize tracking info with default values
         tracking_info = {
             "tracking_number": awb_number,
@@ -26,24 +26,90 @@ class VRLTracker:
             "status_txt": "No tracking information found"
         }
         
-        try:
-            response = requests.post(url)
-            result = response.json()
+        if result.get("Status") == "Success":
+            status_txt = result.get("LrStatus", "")
+
+            tracking_info["location"] = result.get("LrStatusLocation", "")
+            tracking_info["date_time"] = result.get("LrStatusDatetime", "")
+            tracking_info["status_txt"] = status_txt
             
-            if result.get("Status") == "Success":
-                status_txt = result.get("LrStatus", "")
-
-                tracking_info["location"] = result.get("LrStatusLocation", "")
-                tracking_info["date_time"] = result.get("LrStatusDatetime", "")
-                tracking_info["status_txt"] = status_txt
-                
-                # Determine status
-                if "delivered" in status_txt.lower():
-                    tracking_info["status"] = "delivered"
-                else:
-                    tracking_info["status"] = "intransit"
+            # Determine status
+            if "delivered" in status_txt.lower():
+                tracking_info["status"] = "delivered"
+            else:
+                tracking_info["status"] = "intransit"
+        
+        return tracking_info
+
+    def track(self, awb_number):
+        """
+        Track a VRL shipment
+        
+        Args:
+            awb_number: The LR number to track
             
+        Returns:
+            Dictionary with tracking information
+        """
+        url = TRACKING_URL.format(awb_number=awb_number)
+        response = None
+        
+        try:
+            with metrics.stage(COURIER, "request"):
+                response = transport.get_transport().post(url)
+            metrics.record_response(COURIER, response)
+            with metrics.stage(COURIER, "parse"):
+                return self._parse_result(awb_number, response.json())
+        except requests.Timeout as e:
+            metrics.record_response(COURIER, None)
+            return utils.timeout_result(awb_number, utils.LookupTimeout("request", e))
         except Exception as e:
-            tracking_info["status_txt"] = str(e)
+            if response is None:
+                metrics.record_response(COURIER, None)
+            return {
+                "tracking_number": awb_number,
+                "status": "error",
+                "location": "",
+                "date_time": "",
+                "status_txt": str(e)
+            }
+
+    async def track_async(self, awb_number, client=None):
+        """
+        Track a VRL shipment without blocking the event loop.
+        
+        Args:
+            awb_number: The LR number to track
+            client: Optional shared httpx.AsyncClient
             
-        return tracking_info
+        Returns:
+            Dictionary with tracking information
+        """
+        import httpx
+
+        url = TRACKING_URL.format(awb_number=awb_number)
+        response = None
+        
+        try:
+            with metrics.stage(COURIER, "request"):
+                if client is None:
+                    async with utils.new_async_client() as client:
+                        response = await client.post(url)
+                else:
+                    response = await client.post(url)
+            metrics.record_response(COURIER, response)
+            with metrics.stage(COURIER, "parse"):
+                return self._parse_result(awb_number, response.json())
+        except httpx.TimeoutException as e:
+            metrics.record_response(COURIER, None)
+            return utils.timeout_result(awb_number, utils.LookupTimeout("request", e))
+        except Exception as e:
+            if response is None:
+                metrics.record_response(COURIER, None)
+            return {
+                "tracking_number": awb_number,
+                "status": "error",
+                "location": "",
+                "date_time": "",
+                "status_txt": str(e)
+            }
@@ -0,0 +1,99 @@
+"""
+Import-time and memory benchmark for the awb_tracking package.
+
+Each scenario runs in a fresh interpreter and reports wall time, peak RSS
+and which heavy libraries ended up loaded. Importing the package and
+tracking API-based couriers must not load the OCR stack; only the
+"ocr warm-up" scenario should.
+
+Usage:
+    python test/bench_import.py
+    python test/bench_import.py --json import.json --max-import-ms 500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("easyocr", "torch", "cv2", "pytesseract", "numpy", "PIL", "bs4", "lxml", "selectolax", "httpx")
+
+SCENARIOS = {
+    "import": "import awb_tracking",
+    "tracker": "from awb_tracking import AWBTracker; AWBTracker()",
+    "ocr warm-up": "from awb_tracking import ocr; ocr.warm_up()",
+}
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+{code}
+elapsed = (time.perf_counter() - start) * 1000.0
+print(json.dumps({{
+    "ms": elapsed,
+    "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    "loaded": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+def run_scenario(code, repeat):
+    """
+    Run a snippet in fresh interpreters and return the fastest run.
+    """
+    best = None
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(code=code, heavy=HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True)
+        if output.returncode != 0:
+            return {"error": output.stderr.strip().splitlines()[-1] if output.stderr else "failed"}
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        if best is None or result["ms"] < best["ms"]:
+            best = result
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark awb_tracking import time and memory')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per scenario, the fastest is reported')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='Only run these scenarios')
+    parser.add_argument('--json', help='Write machine-readable results to this file')
+    parser.add_argument('--max-import-ms', type=float, help='Fail if importing the package takes longer')
+    args = parser.parse_args()
+
+    results = {}
+    for name in args.scenario or SCENARIOS:
+        # The OCR warm-up loads model weights, one run is enough
+        repeat = 1 if name == "ocr warm-up" else args.repeat
+        results[name] = run_scenario(SCENARIOS[name], repeat)
+
+    print(f"{'scenario':<14} {'ms':>9} {'max RSS MB':>11}  loaded")
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<14} error: {r['error']}")
+            continue
+        print(f"{name:<14} {r['ms']:>9.1f} {r['max_rss_mb']:>11.1f}  {', '.join(r['loaded']) or '-'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    failed = False
+    for name in ("import", "tracker"):
+        r = results.get(name)
+        if not r or "error" in r:
+            continue
+        ocr_loaded = [m for m in ("easyocr", "torch", "cv2", "pytesseract") if m in r["loaded"]]
+        if ocr_loaded:
+            print(f"\n{name}: OCR libraries loaded eagerly: {', '.join(ocr_loaded)}")
+            failed = True
+    if args.max_import_ms and results.get("import", {}).get("ms", 0) > args.max_import_ms:
+        print(f"\nImport took {results['import']['ms']:.1f} ms, limit is {args.max_import_ms:.1f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
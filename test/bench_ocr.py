@@ -0,0 +1,221 @@
+"""
+Captcha OCR accuracy and latency benchmark.
+
+Runs every OCR engine and preprocessing pipeline over a labeled captcha
+corpus and reports exact-match accuracy, answer accuracy after
+captcha2answer, p50/p95/p99 latency and mean time per preprocessing stage
+per courier.
+
+Corpus layout, one folder per courier:
+
+    corpus/
+        indiapost/labels.csv
+        indiapost/0001.gif
+        dtdc/labels.csv
+        dtdc/0001.png
+
+labels.csv columns: file, text (the characters in the image) and, for
+India Post, question (the captcha question shown on the page) and answer
+(the value the site expects). If a folder has no labels.csv, the file name
+without extension is used as the text.
+
+Usage:
+    python test/bench_ocr.py corpus --json results.json
+    python test/bench_ocr.py corpus --model dtdc.npz --engines model --courier dtdc
+    python test/bench_ocr.py corpus --baseline results.json --tolerance 0.02
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from awb_tracking import captcha_model, ocr, preprocess
+from awb_tracking.indiapost import captcha2answer
+
+IMAGE_EXTENSIONS = ('.gif', '.png', '.jpg', '.jpeg', '.bmp')
+
+ENGINES = ("easyocr", "tesseract", "model")
+
+# Preprocessing pipelines applied before the image is handed to the engine
+PREPROCESSORS = ["none"] + list(preprocess.PIPELINE_SPECS)
+
+def load_corpus(corpus_dir):
+    """
+    Load labeled samples from every courier folder of the corpus.
+
+    Returns:
+        list: Sample dicts with courier, path, image bytes, text, question and answer
+    """
+    samples = []
+    for courier in sorted(os.listdir(corpus_dir)):
+        folder = os.path.join(corpus_dir, courier)
+        if not os.path.isdir(folder):
+            continue
+
+        labels_path = os.path.join(folder, "labels.csv")
+        if os.path.exists(labels_path):
+            with open(labels_path, newline='') as f:
+                rows = list(csv.DictReader(f))
+        else:
+            rows = [{"file": name, "text": os.path.splitext(name)[0]}
+                    for name in sorted(os.listdir(folder))
+                    if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+        for row in rows:
+            path = os.path.join(folder, row["file"])
+            with open(path, "rb") as f:
+                image = f.read()
+            text = (row.get("text") or "").strip()
+            samples.append({
+                "courier": courier,
+                "path": path,
+                "image": image,
+                "text": text,
+                "question": (row.get("question") or "").strip(),
+                "answer": (row.get("answer") or text).strip(),
+            })
+    return samples
+
+def percentile(values, pct):
+    """Return the pct-th percentile (nearest rank) of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+def run_combination(samples, engine, preprocess_name):
+    """
+    Solve every sample with one engine and preprocessing combination.
+    A fresh pipeline is built so its stage timings cover this run only.
+
+    Returns:
+        dict: Accuracy and latency figures for the combination
+    """
+    exact = 0
+    answered = 0
+    answer_total = 0
+    latencies = []
+    failures = []
+    pipeline = None
+    if preprocess_name != "none":
+        pipeline = preprocess.Pipeline(preprocess.PIPELINE_SPECS[preprocess_name], name=preprocess_name)
+
+    for sample in samples:
+        start = time.perf_counter()
+        text = ocr.ocr_processor(sample["image"], ocr=engine, debug=False, preprocess=pipeline or "none")
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+        text = (text or "").strip()
+        if text == sample["text"]:
+            exact += 1
+        else:
+            failures.append({"path": sample["path"], "expected": sample["text"], "got": text})
+
+        if sample["answer"]:
+            answer_total += 1
+            if sample["question"]:
+                answer = captcha2answer(sample["question"], text)
+            else:
+                answer = text
+            if str(answer or "").strip().lower() == sample["answer"].lower():
+                answered += 1
+
+    count = len(samples)
+    return {
+        "samples": count,
+        "exact_match": exact / count if count else 0.0,
+        "answer_accuracy": answered / answer_total if answer_total else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": sum(latencies) / count if count else 0.0,
+        },
+        "stage_ms": pipeline.stage_timings() if pipeline else {},
+        "failures": failures,
+    }
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Return the combinations whose accuracy dropped by more than `tolerance`.
+    """
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        for metric in ("exact_match", "answer_accuracy"):
+            if current[metric] < previous[metric] - tolerance:
+                regressions.append(f"{key} {metric}: {previous[metric]:.3f} -> {current[metric]:.3f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark captcha OCR accuracy and latency')
+    parser.add_argument('corpus', help='Corpus directory with one folder per courier')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), help='OCR engines to benchmark')
+    parser.add_argument('--preprocess', nargs='+', default=PREPROCESSORS, choices=PREPROCESSORS, help='Preprocessing pipelines to benchmark')
+    parser.add_argument('--courier', action='append', help='Only benchmark these couriers')
+    parser.add_argument('--model', help='Captcha model file (see awb_tracking.captcha_model) for the "model" engine')
+    parser.add_argument('--json', help='Write machine-readable results to this file')
+    parser.add_argument('--baseline', help='Fail if accuracy dropped compared to this results file')
+    parser.add_argument('--tolerance', type=float, default=0.02, help='Allowed accuracy drop against the baseline')
+    args = parser.parse_args()
+
+    if args.model:
+        captcha_model.register_model("default", args.model)
+
+    samples = load_corpus(args.corpus)
+    if args.courier:
+        samples = [s for s in samples if s["courier"] in args.courier]
+    if not samples:
+        print(f"No labeled captchas found in {args.corpus}")
+        sys.exit(1)
+
+    couriers = sorted({s["courier"] for s in samples})
+    results = {}
+
+    for engine in args.engines:
+        # Load the engine before timing so the model load is not measured
+        if not ocr.warm_up(engine):
+            print(f"Skipping {engine}: engine not available")
+            continue
+        for preprocess_name in args.preprocess:
+            for courier in couriers:
+                courier_samples = [s for s in samples if s["courier"] == courier]
+                key = f"{courier}/{engine}/{preprocess_name}"
+                results[key] = run_combination(courier_samples, engine, preprocess_name)
+                results[key].update({"courier": courier, "engine": engine, "preprocess": preprocess_name})
+
+    print(f"\n{'combination':<36} {'n':>5} {'exact':>7} {'answer':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for key, r in results.items():
+        latency = r["latency_ms"]
+        print(f"{key:<36} {r['samples']:>5} {r['exact_match']:>7.1%} {r['answer_accuracy']:>7.1%} "
+              f"{latency['p50']:>8.1f} {latency['p95']:>8.1f} {latency['p99']:>8.1f}")
+        if r["stage_ms"]:
+            stages = ", ".join(f"{name} {ms:.2f}" for name, ms in r["stage_ms"].items())
+            print(f"{'':<36} stages ms: {stages}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("\nAccuracy regressions:")
+            for line in regressions:
+                print(f"- {line}")
+            sys.exit(1)
+        print("\nNo accuracy regressions against the baseline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import csv
+
+import pytest
+
+from awb_tracking import bulk
+
+class FakeTracker:
+    """Answers every lookup without the network; stops after `fail_after` results like a crash would."""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.tracked = []
+
+    def iter_track(self, items, max_workers=8, courier_limits=None, ordered=False):
+        for index, (courier, awb_number) in enumerate(items):
+            if self.fail_after is not None and len(self.tracked) >= self.fail_after:
+                raise KeyboardInterrupt
+            self.tracked.append(awb_number)
+            result = {"tracking_number": awb_number, "status": "delivered",
+                      "location": f"Hub {awb_number}", "date_time": "2026-10-01 10:00"}
+            yield {"index": index, "courier": courier, "awb_number": awb_number, "result": result, "error": None}
+
+def write_input(path, header, count):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for number in range(count):
+            row = {"orderid": f"O{number}", "courier": "vrl", "awb_number": f"A{number}"}
+            writer.writerow([row.get(field, "") for field in header])
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+@pytest.fixture
+def paths(tmp_path):
+    return tmp_path / "input.csv", tmp_path / "output.csv"
+
+def test_template_date_column_is_kept(paths):
+    input_path, output_path = paths
+    write_input(input_path, ["orderid", "courier", "awb_number", "status", "location", "date"], 2)
+    bulk.run_bulk(str(input_path), str(output_path), tracker=FakeTracker())
+    with open(output_path, newline="") as f:
+        assert next(csv.reader(f)) == ["orderid", "courier", "awb_number", "status", "location", "date"]
+    assert [row["date"] for row in read_rows(output_path)] == ["2026-10-01 10:00"] * 2
+
+def test_result_columns_are_added(paths):
+    input_path, output_path = paths
+    write_input(input_path, ["courier", "awb_number"], 1)
+    bulk.run_bulk(str(input_path), str(output_path), tracker=FakeTracker())
+    assert read_rows(output_path) == [{"courier": "vrl", "awb_number": "A0", "status": "delivered",
+                                       "location": "Hub A0", "date_time": "2026-10-01 10:00"}]
+
+def test_resume_after_partial_run(paths):
+    input_path, output_path = paths
+    write_input(input_path, ["orderid", "courier", "awb_number"], 5)
+    with pytest.raises(KeyboardInterrupt):
+        bulk.run_bulk(str(input_path), str(output_path), tracker=FakeTracker(fail_after=2))
+    assert bulk.checkpoint(str(output_path)) == 2
+
+    tracker = FakeTracker()
+    summary = bulk.run_bulk(str(input_path), str(output_path), tracker=tracker)
+    assert tracker.tracked == ["A2", "A3", "A4"]
+    assert summary == {"skipped": 2, "written": 3, "tracked": 3, "errors": 0}
+    assert [row["awb_number"] for row in read_rows(output_path)] == [f"A{number}" for number in range(5)]
+
+def test_resume_after_torn_final_line(paths):
+    input_path, output_path = paths
+    write_input(input_path, ["orderid", "courier", "awb_number"], 4)
+    bulk.run_bulk(str(input_path), str(output_path), tracker=FakeTracker())
+    complete = output_path.read_bytes()
+    # Crash in the middle of writing the third row
+    lines = complete.splitlines(keepends=True)
+    output_path.write_bytes(b"".join(lines[:3]) + lines[3][:5])
+
+    assert bulk.checkpoint(str(output_path)) == 2
+    assert output_path.read_bytes() == b"".join(lines[:3])
+
+    tracker = FakeTracker()
+    bulk.run_bulk(str(input_path), str(output_path), tracker=tracker)
+    assert tracker.tracked == ["A2", "A3"]
+    assert output_path.read_bytes() == complete
+
+def test_checkpoint_without_output(paths):
+    _, output_path = paths
+    assert bulk.checkpoint(str(output_path)) == -1
+
+class EagerTracker(FakeTracker):
+    """Pulls every item it can before answering, like iter_track() behind a slow first lookup."""
+
+    def __init__(self, written):
+        super().__init__()
+        self.written = written
+        self.read_ahead = []
+
+    def iter_track(self, items, max_workers=8, courier_limits=None, ordered=False):
+        pulled = []
+        for courier, awb_number in items:
+            # awb_number A<n> is input row n, so rows n + 1 have been read
+            self.read_ahead.append(int(awb_number[1:]) + 1 - self.written[0])
+            pulled.append((courier, awb_number))
+        yield from super().iter_track(pulled, max_workers, courier_limits, ordered)
+
+def test_read_ahead_is_bounded(paths):
+    input_path, output_path = paths
+    with open(input_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["courier", "awb_number", "status"])
+        for number in range(50):
+            # Every tenth row needs a lookup, the others are copied
+            writer.writerow(["vrl", f"A{number}", "" if number % 10 == 0 else "delivered"])
+
+    written = [0]
+
+    def progress(row_number, row):
+        written[0] = row_number
+
+    tracker = EagerTracker(written)
+    summary = bulk.run_bulk(str(input_path), str(output_path), tracker=tracker, max_pending=5,
+                            on_progress=progress)
+    assert summary == {"skipped": 0, "written": 50, "tracked": 5, "errors": 0}
+    assert tracker.tracked == [f"A{number}" for number in range(0, 50, 10)]
+    assert max(tracker.read_ahead) <= 5
+    assert [row["awb_number"] for row in read_rows(output_path)] == [f"A{number}" for number in range(50)]
@@ -0,0 +1,99 @@
+import logging
+
+import pytest
+
+from awb_tracking import captcha_solver
+from awb_tracking.captcha_solver import CaptchaSolveError
+
+CHARACTERS = "Enter characters as displayed in image"
+EXPRESSION = "Evaluate the Expression"
+
+@pytest.mark.parametrize("text, digits", [
+    ("123", "123"),
+    ("O1l", "011"),
+    ("S B", "58"),
+    ("Zg.", "29"),
+    ("|7!", "171"),
+    ("", ""),
+])
+def test_correct_digits(text, digits):
+    assert captcha_solver.correct_digits(text) == digits
+
+@pytest.mark.parametrize("text", ["12#", "4k", "7+1"])
+def test_correct_digits_rejects_unknown_characters(text):
+    with pytest.raises(CaptchaSolveError):
+        captcha_solver.correct_digits(text)
+
+@pytest.mark.parametrize("expression, tokens", [
+    ("12 + 7 =", [12, "+", 7]),
+    ("l2 x 3", [12, "*", 3]),
+    ("8 ÷ 2", [8, "/", 2]),
+    ("9 - O", [9, "-", 0]),
+    ("1t2", [1, "+", 2]),
+    ("S x B - 1", [5, "*", 8, "-", 1]),
+])
+def test_tokenize(expression, tokens):
+    assert captcha_solver.tokenize(expression) == tokens
+
+@pytest.mark.parametrize("expression", [
+    "",
+    "12",
+    "+ 3",
+    "4 +",
+    "1 + 2 + 3 + 4 + 5",
+    "1000 + 1",
+    "4 # 2",
+])
+def test_tokenize_rejects_implausible_expressions(expression):
+    with pytest.raises(CaptchaSolveError):
+        captcha_solver.tokenize(expression)
+
+@pytest.mark.parametrize("tokens, result", [
+    ([12, "*", 3], 36),
+    ([2, "+", 3, "*", 4], 14),
+    ([2, "*", 3, "+", 4], 10),
+    ([10, "-", 6, "/", 2], 7),
+    ([8, "/", 2, "*", 3], 12),
+    ([3, "-", 5], -2),
+])
+def test_evaluate_uses_operator_precedence(tokens, result):
+    assert captcha_solver.evaluate(tokens) == result
+
+@pytest.mark.parametrize("tokens", [[7, "/", 2], [4, "/", 0], [1, "+", 9, "/", 4]])
+def test_evaluate_rejects_non_integer_division(tokens):
+    with pytest.raises(CaptchaSolveError):
+        captcha_solver.evaluate(tokens)
+
+@pytest.mark.parametrize("question, ocr_text, answer", [
+    (CHARACTERS, "Ab3 dE", "ab3de"),
+    (EXPRESSION, "l2 x 3 =", "36"),
+    (EXPRESSION, "2 + 3 x 4", "14"),
+    ("Enter the First number", "7 4 1", "7"),
+    ("Enter the  second Number", "7 4 1", "4"),
+    ("Enter the third number", "7 A l", "1"),
+    ("Enter the sixth number", "123456", "6"),
+])
+def test_solve(question, ocr_text, answer):
+    assert captcha_solver.solve(question, ocr_text) == answer
+
+@pytest.mark.parametrize("question, ocr_text", [
+    (CHARACTERS, "ab"),
+    (CHARACTERS, "   "),
+    (EXPRESSION, "3 - 9"),
+    (EXPRESSION, "7 / 2"),
+    ("Enter the fourth number", "123"),
+    ("Enter the second number", "1#3"),
+])
+def test_solve_rejects_implausible_answers(question, ocr_text):
+    with pytest.raises(CaptchaSolveError):
+        captcha_solver.solve(question, ocr_text)
+
+def test_unknown_question_submits_ocr_text(caplog):
+    with caplog.at_level(logging.WARNING, logger="awb_tracking.captcha_solver"):
+        assert captcha_solver.solve("Type the word shown", " Xy-7 ") == "xy7"
+    assert "Type the word shown" in caplog.text
+
+@pytest.mark.parametrize("question", ["Enter the seventh number", "Type the word shown", None])
+def test_classify_unknown_question(question):
+    with pytest.raises(CaptchaSolveError):
+        captcha_solver.classify_question(question)
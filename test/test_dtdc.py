@@ -0,0 +1,27 @@
+import pytest
+
+from awb_tracking.dtdc import DTDCTracker
+
+SEARCH_FORM = ('<form id="trackForm"><label for="captchaInput">Enter Captcha</label>'
+               '<input name="captchaInput" id="captchaInput"><img id="captchaImg" src="captcha.png"></form>')
+
+@pytest.mark.parametrize("message", [
+    "Invalid Captcha",
+    "invalid captcha, please try again",
+    "Captcha is incorrect",
+    "The captcha code you entered is wrong",
+    "Wrong Captcha Code",
+    "Captcha does not match",
+])
+def test_captcha_error_is_rejection(message):
+    html = f'<html><body><div class="error">{message}</div>{SEARCH_FORM}</body></html>'
+    assert DTDCTracker.is_captcha_rejected(html)
+
+@pytest.mark.parametrize("html", [
+    # Search form without an error, e.g. an unknown consignment
+    f"<html><body><p>No records found</p>{SEARCH_FORM}</body></html>",
+    # Result page, whatever else it mentions
+    f'<html><body><div id="printdiv">Delivered</div><p>Invalid Captcha</p>{SEARCH_FORM}</body></html>',
+])
+def test_other_pages_are_not_rejections(html):
+    assert not DTDCTracker.is_captcha_rejected(html)
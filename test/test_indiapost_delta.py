@@ -0,0 +1,120 @@
+import pytest
+
+from awb_tracking import artifacts, indiapost, presolve, utils
+
+IMAGE_ID = indiapost.CAPTCHA_IMAGE_IDS[0]
+
+def delta(*records):
+    return "".join(f"{len(content)}|{kind}|{key}|{content}|" for kind, key, content in records)
+
+def captcha_panel(question="Enter the sum", src="Captcha.aspx?id=1"):
+    return (f'<span id="{indiapost.CAPTCHA_QUESTION_ID}">{question}</span>'
+            f'<img id="{IMAGE_ID}" src="{src}">'
+            '<input type="text" name="txtCaptcha" value="">')
+
+def make_prepared(answer="42"):
+    return presolve.PreparedCaptcha(
+        None, answer=answer, attempts=1,
+        fields={"__VIEWSTATE": "old", "__EVENTVALIDATION": "old", "txtCaptcha": ""},
+        question="Enter the sum", img_url=indiapost.get_captcha_img_url(captcha_panel()))
+
+def test_parse_delta_records():
+    content = delta(("updatePanel", "panel1", "<div>a|b|c</div>"),
+                    ("hiddenField", "__VIEWSTATE", "abc="),
+                    ("hiddenField", "__EVENTTARGET", ""))
+    assert indiapost.parse_delta(content.encode()) == [
+        ("updatePanel", "panel1", "<div>a|b|c</div>"),
+        ("hiddenField", "__VIEWSTATE", "abc="),
+        ("hiddenField", "__EVENTTARGET", ""),
+    ]
+
+def test_parse_delta_counts_characters_not_bytes():
+    content = delta(("updatePanel", "panel1", "डाक|घर"))
+    assert indiapost.parse_delta(content.encode("utf-8")) == [("updatePanel", "panel1", "डाक|घर")]
+
+@pytest.mark.parametrize("content", [
+    "<html><body>Tracking</body></html>",
+    "5|hiddenField|__VIEWSTATE|abc",
+    "10|hiddenField|__VIEWSTATE|abc|",
+    "3|hiddenField",
+    "x|hiddenField|__VIEWSTATE|abc|",
+])
+def test_parse_delta_rejects_non_delta_content(content):
+    with pytest.raises(ValueError):
+        indiapost.parse_delta(content)
+
+def test_apply_delta_updates_page_state():
+    prepared = make_prepared()
+    prepared.created -= 100
+    content = delta(("updatePanel", "panel1", captcha_panel() + '<input name="extra" value="1">'),
+                    ("hiddenField", "__VIEWSTATE", "new"),
+                    ("hiddenField", "__EVENTVALIDATION", "new-ev"))
+    assert indiapost.apply_delta(prepared, content)
+    assert prepared.state["fields"] == {"__VIEWSTATE": "new", "__EVENTVALIDATION": "new-ev",
+                                        "txtCaptcha": "", "extra": "1"}
+    # Same captcha: the answer is still good
+    assert prepared.answer == "42"
+    assert prepared.age() < 100
+
+@pytest.mark.parametrize("panel", [
+    captcha_panel(src="Captcha.aspx?id=2"),
+    captcha_panel(question="Enter the second number"),
+])
+def test_apply_delta_drops_answer_of_replaced_captcha(panel):
+    prepared = make_prepared()
+    content = delta(("updatePanel", "panel1", panel), ("hiddenField", "__VIEWSTATE", "new"))
+    assert indiapost.apply_delta(prepared, content)
+    assert prepared.answer is None
+    assert prepared.state["img_url"] == indiapost.get_captcha_img_url(panel)
+
+@pytest.mark.parametrize("content", [
+    "<html><body>Session expired</body></html>",
+    delta(("hiddenField", "__EVENTVALIDATION", "new")),
+    delta(("hiddenField", "__VIEWSTATE", "new"), ("pageRedirect", "", "/error.aspx")),
+    delta(("error", "500", "Server error"), ("hiddenField", "__VIEWSTATE", "new")),
+])
+def test_apply_delta_rejects_stale_state(content):
+    prepared = make_prepared()
+    assert not indiapost.apply_delta(prepared, content)
+    assert prepared.state["fields"]["__VIEWSTATE"] == "old"
+
+def test_stale_chain_is_reloaded_within_one_lookup(monkeypatch):
+    """A carried-forward state the site does not take is reloaded, and the lookup recorded once."""
+    fresh = make_prepared(answer="7")
+    fresh.state["content"] = "<html></html>"
+    fresh.attempts = 2
+    fresh.discarded = 1
+    monkeypatch.setattr(indiapost, "prepare_captcha", lambda *args: fresh)
+    responses = iter([
+        "<html><body>Session expired</body></html>",
+        delta(("updatePanel", "panel1", captcha_panel()), ("hiddenField", "__VIEWSTATE", "new")),
+    ])
+    monkeypatch.setattr(indiapost, "submit_tracking_form", lambda *args, **kwargs: next(responses))
+    monkeypatch.setattr(indiapost, "get_delivery_status",
+                        lambda content, number: {"tracking_number": number, "status": "transit"})
+
+    session = indiapost.IndiaPostSession()
+    session.chain = make_prepared()
+    stats = utils.CaptchaStats()
+    result = indiapost.track_consignment("EE123456789IN", session, stats=stats, prepared=session.chain,
+                                         artifact_sink=artifacts.ArtifactSink())
+    assert result["status"] == "transit"
+    assert result["captcha_attempts"] == 2
+    assert session.uses == 1
+    assert session.chain is fresh
+    assert stats.snapshot() == {"lookups": 1, "attempts": 2, "accepted": 1, "rejected": 0,
+                                "discarded": 1, "chained": 0, "success_rate": 0.5}
+
+def test_reused_answer_is_not_counted_as_a_solve(monkeypatch):
+    monkeypatch.setattr(indiapost, "submit_tracking_form", lambda *args, **kwargs: delta(
+        ("updatePanel", "panel1", captcha_panel()), ("hiddenField", "__VIEWSTATE", "new")))
+    monkeypatch.setattr(indiapost, "get_delivery_status",
+                        lambda content, number: {"tracking_number": number, "status": "delivered"})
+
+    session = indiapost.IndiaPostSession()
+    stats = utils.CaptchaStats()
+    result = indiapost.track_consignment("EE123456789IN", session, stats=stats, prepared=make_prepared(),
+                                         artifact_sink=artifacts.ArtifactSink())
+    assert result["captcha_attempts"] == 0
+    assert stats.snapshot() == {"lookups": 1, "attempts": 0, "accepted": 0, "rejected": 0,
+                                "discarded": 0, "chained": 1, "success_rate": 0.0}
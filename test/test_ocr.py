@@ -0,0 +1,64 @@
+import sys
+import threading
+import types
+
+import pytest
+from PIL import Image
+
+from awb_tracking import ocr
+
+@pytest.fixture
+def broken_tesserocr(monkeypatch):
+    """A tesserocr whose handle cannot be created, like one without tessdata."""
+    created = []
+
+    def api(**kwargs):
+        created.append(kwargs)
+        raise RuntimeError("Failed to init API, possibly an invalid tessdata path")
+
+    module = types.SimpleNamespace(PyTessBaseAPI=api, PSM=types.SimpleNamespace(SINGLE_WORD=8),
+                                   OEM=types.SimpleNamespace(DEFAULT=3))
+    monkeypatch.setitem(sys.modules, "tesserocr", module)
+    monkeypatch.setattr(ocr, "_tesserocr_available", None)
+    monkeypatch.setattr(ocr, "_tesseract_local", threading.local())
+    return created
+
+def test_unusable_tesserocr_is_tried_once(broken_tesserocr):
+    assert ocr.get_tesseract_api() is None
+    assert ocr.get_tesseract_api() is None
+    assert len(broken_tesserocr) == 1
+
+def test_unusable_tesserocr_falls_back_to_pytesseract(broken_tesserocr, monkeypatch):
+    calls = []
+
+    def image_to_string(image, config=None):
+        calls.append(config)
+        return " ab12 \n"
+
+    monkeypatch.setitem(sys.modules, "pytesseract", types.SimpleNamespace(image_to_string=image_to_string))
+    image = Image.new("RGB", (60, 20), "white")
+    assert ocr.ocr_tesseract(image, preprocess=None) == "ab12"
+    assert ocr.ocr_tesseract(image, preprocess=None) == "ab12"
+    assert calls == [ocr.TESSERACT_CONFIG] * 2
+    assert len(broken_tesserocr) == 1
+
+def test_only_easyocr_batches():
+    with pytest.raises(ValueError):
+        ocr.BatchOCRWorker("tesseract")
+    with pytest.raises(ValueError):
+        ocr.enable_batching("tesseract")
+    assert ocr._batch_worker is None
+
+def test_tesseract_runs_inline_while_batching(monkeypatch):
+    class Worker:
+        ocr = "easyocr"
+        lang_list = ("en",)
+        gpu = False
+
+        def solve(self, image, timeout=None):
+            raise AssertionError("tesseract images must not be queued")
+
+    monkeypatch.setattr(ocr, "_batch_worker", Worker())
+    monkeypatch.setattr(ocr, "ocr_tesseract", lambda image, debug, preprocess: "inline")
+    image = Image.new("RGB", (60, 20), "white")
+    assert ocr.ocr_processor(image, ocr="tesseract", preprocess="none") == "inline"
@@ -0,0 +1,156 @@
+import types
+
+import pytest
+import requests
+
+from awb_tracking import ratelimit
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(monotonic=clock.monotonic, sleep=clock.sleep))
+    return clock
+
+def make_limiter(**kwargs):
+    settings = {"rate": 10.0, "min_rate": 1.0, "max_rate": 20.0, "increase": 1.0, "decrease": 0.5,
+                "latency_target": 2.0, "cooldown": 5.0, "failure_threshold": 3, "reset_timeout": 30.0}
+    settings.update(kwargs)
+    return ratelimit.HostLimiter("courier.example", **settings)
+
+def test_success_increases_rate_additively(clock):
+    limiter = make_limiter()
+    limiter.record(latency=0.1, status_code=200)
+    assert limiter.rate == pytest.approx(10.1)
+    for _ in range(1000):
+        limiter.record(latency=0.1, status_code=200)
+    assert limiter.rate == 20.0
+
+@pytest.mark.parametrize("outcome", [
+    {"status_code": 503},
+    {"status_code": 429},
+    {"error": True},
+    {"latency": 3.0, "status_code": 200},
+])
+def test_congestion_halves_rate_once_per_cooldown(clock, outcome):
+    limiter = make_limiter()
+    limiter.record(**outcome)
+    assert limiter.rate == 5.0
+    limiter.record(**outcome)
+    assert limiter.rate == 5.0
+    clock.now += 5.0
+    limiter.record(**outcome)
+    assert limiter.rate == 2.5
+
+def test_rate_does_not_drop_below_min_rate(clock):
+    limiter = make_limiter(rate=1.5, cooldown=0.0)
+    for _ in range(5):
+        limiter.record(status_code=503)
+    assert limiter.rate == 1.0
+
+def test_retry_after_pauses_host(clock):
+    limiter = make_limiter()
+    limiter.record(status_code=429, retry_after=7.0)
+    assert limiter.reserve() == pytest.approx(7.0)
+    clock.now += 7.0
+    assert limiter.reserve() == 0.0
+
+def test_tokens_queue_callers(clock):
+    limiter = make_limiter(rate=2.0, burst=1.0)
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == pytest.approx(0.5)
+    assert limiter.reserve() == pytest.approx(1.0)
+
+def test_acquire_sleeps_within_timeout(clock):
+    limiter = make_limiter(rate=2.0, burst=1.0)
+    limiter.acquire(timeout=1.0)
+    limiter.acquire(timeout=1.0)
+    assert clock.slept == [pytest.approx(0.5)]
+
+def test_acquire_raises_instead_of_waiting_past_timeout(clock):
+    limiter = make_limiter(rate=1.0, burst=1.0)
+    limiter.acquire()
+    with pytest.raises(requests.Timeout):
+        limiter.acquire(timeout=0.5)
+    assert clock.slept == []
+    # The refused reservation was given back
+    assert limiter.tokens == pytest.approx(0.0)
+
+@pytest.mark.parametrize("timeout, budget", [
+    (None, None),
+    (3, 3),
+    ((5.0, 20.0), 20.0),
+    ((5.0, None), 5.0),
+])
+def test_wait_budget(timeout, budget):
+    assert ratelimit.wait_budget(timeout) == budget
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    limiter = make_limiter()
+    limiter.record(status_code=500)
+    limiter.record(status_code=200)
+    limiter.record(status_code=500)
+    limiter.record(error=True)
+    assert limiter.state == ratelimit.CLOSED
+    limiter.record(status_code=502)
+    assert limiter.state == ratelimit.OPEN
+    with pytest.raises(ratelimit.CircuitOpenError):
+        limiter.reserve()
+
+def test_throttling_does_not_open_circuit(clock):
+    limiter = make_limiter()
+    for _ in range(10):
+        limiter.record(status_code=429)
+    assert limiter.state == ratelimit.CLOSED
+
+def open_circuit(limiter):
+    for _ in range(limiter.failure_threshold):
+        limiter.record(error=True)
+    assert limiter.state == ratelimit.OPEN
+
+def test_half_open_probe_closes_circuit(clock):
+    limiter = make_limiter()
+    open_circuit(limiter)
+    clock.now += 30.0
+    limiter.reserve()
+    assert limiter.state == ratelimit.HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(ratelimit.CircuitOpenError):
+        limiter.reserve()
+    limiter.record(latency=0.1, status_code=200)
+    assert limiter.state == ratelimit.CLOSED
+    assert limiter.failures == 0
+    limiter.reserve()
+
+def test_failed_probe_reopens_circuit(clock):
+    limiter = make_limiter()
+    open_circuit(limiter)
+    clock.now += 30.0
+    limiter.reserve()
+    limiter.record(error=True)
+    assert limiter.state == ratelimit.OPEN
+    with pytest.raises(ratelimit.CircuitOpenError):
+        limiter.reserve()
+    clock.now += 30.0
+    limiter.reserve()
+    assert limiter.state == ratelimit.HALF_OPEN
+
+def test_cancelled_probe_frees_probe_slot(clock):
+    limiter = make_limiter()
+    open_circuit(limiter)
+    clock.now += 30.0
+    limiter.reserve()
+    limiter.cancel()
+    assert limiter.state == ratelimit.HALF_OPEN
+    limiter.reserve()
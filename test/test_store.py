@@ -0,0 +1,77 @@
+import pytest
+
+from awb_tracking.store import ShipmentStore
+
+@pytest.fixture(params=["file", "memory"])
+def store(request, tmp_path):
+    path = str(tmp_path / "shipments.db") if request.param == "file" else ":memory:"
+    store = ShipmentStore(path)
+    yield store
+    store.close()
+
+def result(awb_number, status):
+    return {"tracking_number": awb_number, "status": status, "status_txt": f"{status} at hub"}
+
+class FakeTracker:
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.tracked = []
+
+    def iter_track(self, items, **kwargs):
+        for index, (courier, awb_number) in enumerate(items):
+            self.tracked.append((courier, awb_number))
+            status = self.statuses.get(awb_number)
+            if isinstance(status, Exception):
+                yield {"index": index, "courier": courier, "awb_number": awb_number,
+                       "result": None, "error": str(status)}
+            else:
+                yield {"index": index, "courier": courier, "awb_number": awb_number,
+                       "result": result(awb_number, status), "error": None}
+
+def test_add_due_record_due(store):
+    assert store.add("VRL", " 1001 ")
+    assert not store.add("vrl", "1001")
+    assert store.add_many([("vrl", "1002"), ("dtdc", "D1")]) == 2
+    assert sorted(store.due()) == [("dtdc", "D1"), ("vrl", "1001"), ("vrl", "1002")]
+
+    store.record("vrl", "1001", result("1001", "delivered"))
+    store.record("vrl", "1002", result("1002", "transit"))
+    # Terminal shipments are done; checked ones come after unchecked ones
+    assert list(store.due()) == [("dtdc", "D1"), ("vrl", "1002")]
+    assert list(store.due(courier="VRL")) == [("vrl", "1002")]
+    assert list(store.due(limit=1)) == [("dtdc", "D1")]
+    assert list(store.due(older_than_hours=1)) == [("dtdc", "D1")]
+
+def test_due_can_be_consumed_while_recording(store):
+    store.add_many([("vrl", str(number)) for number in range(5)])
+    for courier, awb_number in store.due():
+        store.record(courier, awb_number, result(awb_number, "delivered"))
+    assert list(store.due()) == []
+    assert store.count(terminal=True) == 5
+
+def test_failed_lookup_keeps_last_good_result(store):
+    store.record("vrl", "1001", result("1001", "transit"))
+    store.record("vrl", "1001", {"tracking_number": "1001", "status": "error", "status_txt": "Captcha rejected"})
+    store.record("vrl", "1001", None, error="Connection reset")
+
+    record = store.get("vrl", "1001")
+    assert record["status"] == "transit"
+    assert record["result"] == result("1001", "transit")
+    assert record["last_error"] == "Connection reset"
+    assert record["attempts"] == 3
+    assert not record["terminal"]
+    assert store.get("vrl", "9999") is None
+
+def test_poll_records_every_result(store):
+    store.add_many([("vrl", "1001"), ("vrl", "1002"), ("vrl", "1003"), ("dtdc", "D1")])
+    tracker = FakeTracker({"1001": "delivered", "1002": "transit", "1003": RuntimeError("boom"), "D1": "error"})
+
+    summary = store.poll(tracker, courier="vrl")
+    assert summary == {"checked": 3, "failed": 1, "terminal": 1}
+    assert sorted(tracker.tracked) == [("vrl", "1001"), ("vrl", "1002"), ("vrl", "1003")]
+    assert store.status_counts() == {("vrl", "delivered"): 1, ("vrl", "transit"): 1,
+                                     ("vrl", None): 1, ("dtdc", None): 1}
+
+    summary = store.poll(tracker)
+    assert summary == {"checked": 3, "failed": 2, "terminal": 0}
+    assert store.get("dtdc", "D1")["last_error"] == "error at hub"